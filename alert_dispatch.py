@@ -0,0 +1,316 @@
+# alert_dispatch.py
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import requests
+from prometheus_client import Counter, Gauge, Histogram
+from alerter import alert_provider, build_alert_request, notify_console
+
+log = logging.getLogger("collector.alerts")
+
+ALERT_QUEUE_DEPTH = Gauge('noc_alert_queue_depth', 'Alerts waiting for delivery', ['destination'])
+ALERT_DELIVERY_SECONDS = Histogram('noc_alert_delivery_seconds', 'Time from submit to delivered alert',
+                                   ['destination'], buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300))
+ALERT_DELIVERIES = Counter('noc_alert_deliveries_total', 'Alert delivery outcomes', ['destination', 'result'])
+
+# providers whose messages can be merged into a single POST (see merge_payloads),
+# with their default batch size; the others always send one alert per POST
+BATCH_SIZE = {'slack': 20, 'discord': 10, 'webhook': 1}
+DISCORD_MAX_CHARS = 2000
+# incident APIs: a trigger and the resolve with the same dedup_key must arrive
+# in order, so these get one worker per destination
+ORDERED = ('pagerduty', 'opsgenie')
+# default (requests/s, burst) per provider, under their published limits
+RATE_LIMIT = {'pagerduty': (2, 20), 'opsgenie': (2, 20), 'slack': (1, 5), 'discord': (0.5, 5)}
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `reserve` returns how long to wait for the token."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def take(self, n=1):
+        """Non-blocking: take up to n whole tokens, returns how many were granted."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            granted = max(0, min(n, int(self.tokens)))
+            self.tokens -= granted
+            return granted
+
+
+def merge_payloads(provider, payloads):
+    """One request body for several alerts of the same destination."""
+    if len(payloads) == 1:
+        return payloads[0]
+    if provider == 'slack':
+        return {"text": "\n".join(p["text"] for p in payloads)}
+    if provider == 'discord':
+        return {"content": "\n".join(p["content"] for p in payloads)[:DISCORD_MAX_CHARS]}
+    return {"alerts": payloads}
+
+
+class Destination:
+    """One configured alert target with its own queue and workers."""
+
+    def __init__(self, name, alert_cfg, queue_size, batch_size, rate_limit=None):
+        self.name = name
+        self.cfg = alert_cfg
+        self.provider = alert_provider(alert_cfg)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(*rate_limit) if rate_limit else None
+        self.spilled = set()  # dedup keys with an alert in the spill file: later ones follow it there
+        self.threads = []
+        self.depth = ALERT_QUEUE_DEPTH.labels(destination=name)
+
+
+class AlertDispatcher:
+    """Non-blocking alert delivery.
+
+    `submit` only enqueues; each destination is served by `workers` threads
+    (one for ORDERED providers), each with its own pooled requests.Session,
+    and every POST takes a token
+    from the destination's rate limit (`rate_limit: [per_second, burst]`,
+    null to disable; provider defaults in RATE_LIMIT). Failed requests are retried
+    with jittered exponential backoff; alerts that still fail, or that do not
+    fit in the queue, are appended to a JSONL spill file and replayed on
+    start and every `replay_interval` seconds. Once an alert with a
+    dedup_key is spilled, later alerts with that key are spilled behind it
+    until the replay, so a resolve never overtakes its trigger.
+    """
+
+    def __init__(self, alert_cfg, spill_path="alert_spill.jsonl", queue_size=10000, workers=2,
+                 max_retries=5, backoff_base=1.0, backoff_max=60, batch_wait=0.5, timeout=7,
+                 replay_interval=60):
+        self.spill_path = spill_path
+        self.workers = max(1, int(workers))
+        self.max_retries = int(max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+        self.replay_interval = replay_interval
+        self._stop = threading.Event()
+        self._spill_lock = threading.Lock()
+        self.destinations = {}
+        alert_cfg = alert_cfg or {}
+        dispatch = alert_cfg.get('dispatch') or {}
+        for i, d in enumerate(alert_cfg.get('destinations') or [alert_cfg]):
+            name = d.get('name') or (alert_provider(d) if i == 0 else f"{alert_provider(d)}{i}")
+            provider = alert_provider(d)
+            batch = int(d.get('batch_size', dispatch.get('batch_size', BATCH_SIZE[provider]))) \
+                if provider in BATCH_SIZE else 1
+            rate = d.get('rate_limit', dispatch.get('rate_limit', RATE_LIMIT.get(alert_provider(d))))
+            self.destinations[name] = Destination(name, d, queue_size, max(1, batch), rate)
+        for dest in self.destinations.values():
+            for k in range(1 if dest.provider in ORDERED else self.workers):
+                t = threading.Thread(target=self._worker, args=(dest,), daemon=True,
+                                     name=f"alerts-{dest.name}-{k}")
+                t.start()
+                dest.threads.append(t)
+        self.replay()
+        self._replayer = threading.Thread(target=self._replay_loop, daemon=True, name="alerts-replay")
+        self._replayer.start()
+
+    @classmethod
+    def from_config(cls, config):
+        """Dispatcher for config['alerting'], or None when `alerting.dispatch.enabled` is false."""
+        alert_cfg = (config or {}).get('alerting') or {}
+        d = alert_cfg.get('dispatch') or {}
+        if not d.get('enabled', True):
+            return None
+        return cls(alert_cfg,
+                   spill_path=d.get('spill_path', 'alert_spill.jsonl'),
+                   queue_size=int(d.get('queue_size', 10000)),
+                   workers=int(d.get('workers', 2)),
+                   max_retries=int(d.get('max_retries', 5)),
+                   backoff_base=float(d.get('backoff_base', 1.0)),
+                   backoff_max=float(d.get('backoff_max', 60)),
+                   batch_wait=float(d.get('batch_wait', 0.5)),
+                   timeout=float(d.get('timeout', 7)),
+                   replay_interval=float(d.get('replay_interval', 60)))
+
+    def submit(self, device, iface, state, details, summary=None, action='trigger', dedup_key=None):
+        """Queue one alert (or incident, see alerter.build_alert_request) for
+        every destination. Never blocks."""
+        event = {'device': device, 'iface': iface, 'state': state, 'details': details,
+                 'submitted': time.time()}
+        if summary:
+            event.update(summary=summary, action=action, dedup_key=dedup_key)
+        for dest in self.destinations.values():
+            self._enqueue(dest, event)
+
+    @staticmethod
+    def _request(dest, e):
+        return build_alert_request(e['device'], e['iface'], e['state'], e['details'], dest.cfg,
+                                   e.get('summary'), e.get('action', 'trigger'), e.get('dedup_key'))
+
+    def _enqueue(self, dest, event):
+        if self._request(dest, event) is None:
+            notify_console(event['device'], event['iface'], event['state'],
+                           event.get('summary') or event['details'])
+            return
+        if event.get('dedup_key') in dest.spilled:
+            self._spill(dest, [event])
+            return
+        try:
+            dest.queue.put_nowait(event)
+        except queue.Full:
+            ALERT_DELIVERIES.labels(destination=dest.name, result='overflow').inc()
+            self._spill(dest, [event])
+            return
+        dest.depth.set(dest.queue.qsize())
+
+    def _worker(self, dest):
+        session = requests.Session()
+        try:
+            while not self._stop.is_set():
+                try:
+                    batch = [dest.queue.get(timeout=0.2)]
+                except queue.Empty:
+                    continue
+                deadline = time.monotonic() + self.batch_wait
+                while len(batch) < dest.batch_size:
+                    try:
+                        batch.append(dest.queue.get(timeout=max(0, deadline - time.monotonic())))
+                    except queue.Empty:
+                        break
+                dest.depth.set(dest.queue.qsize())
+                self._deliver(dest, session, batch)
+        finally:
+            session.close()
+
+    def _deliver(self, dest, session, batch):
+        """POST a batch, merged per target URL. Returns True when all were delivered."""
+        behind = [e for e in batch if e.get('dedup_key') in dest.spilled]
+        if behind:
+            self._spill(dest, behind)
+            batch = [e for e in batch if e.get('dedup_key') not in dest.spilled]
+        groups = {}  # url -> (headers, [event], [payload]), in submit order
+        for e in batch:
+            url, headers, payload = self._request(dest, e)
+            group = groups.setdefault(url, (headers, [], []))
+            group[1].append(e)
+            group[2].append(payload)
+        ok = True
+        for url, (headers, events, payloads) in groups.items():
+            ok = self._post(dest, session, url, headers, merge_payloads(dest.provider, payloads), events) and ok
+        return ok
+
+    def _post(self, dest, session, url, headers, payload, batch):
+        for attempt in range(self.max_retries + 1):
+            if dest.bucket is not None:
+                self._stop.wait(dest.bucket.reserve())
+            delay = None
+            try:
+                r = session.post(url, json=payload, headers=headers, timeout=self.timeout)
+                if r.status_code < 300:
+                    now = time.time()
+                    for e in batch:
+                        ALERT_DELIVERY_SECONDS.labels(destination=dest.name).observe(now - e['submitted'])
+                    ALERT_DELIVERIES.labels(destination=dest.name, result='delivered').inc(len(batch))
+                    return True
+                if r.status_code < 500 and r.status_code != 429:
+                    log.error("[%s] alert rejected: status=%s resp=%s", dest.name, r.status_code, r.text[:200])
+                    ALERT_DELIVERIES.labels(destination=dest.name, result='rejected').inc(len(batch))
+                    return False
+                if r.status_code == 429:
+                    try:
+                        delay = float(r.headers.get('Retry-After'))
+                    except (TypeError, ValueError):
+                        pass
+                err = f"status={r.status_code}"
+            except requests.RequestException as e:
+                err = str(e)
+            if attempt == self.max_retries:
+                break
+            ALERT_DELIVERIES.labels(destination=dest.name, result='retry').inc(len(batch))
+            if delay is None:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                delay *= random.uniform(0.5, 1.0)
+            log.info("[%s] alert delivery failed (%s), retry %d in %.1fs", dest.name, err, attempt + 1, delay)
+            if self._stop.wait(delay):
+                break
+        log.warning("[%s] giving up on %d alert(s): %s", dest.name, len(batch), err)
+        ALERT_DELIVERIES.labels(destination=dest.name, result='spilled').inc(len(batch))
+        self._spill(dest, batch)
+        return False
+
+    def _spill(self, dest, events):
+        with self._spill_lock, open(self.spill_path, 'a', encoding='utf-8') as f:
+            for e in events:
+                f.write(json.dumps(dict(e, destination=dest.name), default=str) + "\n")
+                if e.get('dedup_key'):
+                    dest.spilled.add(e['dedup_key'])
+
+    def replay(self):
+        """Re-queue spilled alerts. Returns how many were read from the spill file."""
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return 0
+            with open(self.spill_path, encoding='utf-8') as f:
+                lines = f.readlines()
+            os.remove(self.spill_path)
+            for dest in self.destinations.values():
+                dest.spilled.clear()  # re-queued below in their original order
+        n = 0
+        for line in lines:
+            try:
+                e = json.loads(line)
+            except ValueError:
+                log.warning("skipping corrupt alert spill line: %r", line[:200])
+                continue
+            dest = self.destinations.get(e.pop('destination', None))
+            if dest is None:
+                log.warning("dropping spilled alert for unknown destination: %s", e)
+                continue
+            self._enqueue(dest, e)
+            n += 1
+        if n:
+            log.info("replaying %d spilled alert(s)", n)
+        return n
+
+    def _replay_loop(self):
+        while not self._stop.wait(self.replay_interval):
+            self.replay()
+
+    def pending(self):
+        return sum(d.queue.qsize() for d in self.destinations.values())
+
+    def close(self, timeout=10):
+        """Deliver what is queued within `timeout`, spill the rest."""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        for dest in self.destinations.values():
+            for t in dest.threads:
+                t.join(max(1, deadline - time.monotonic()))
+            left = []
+            while True:
+                try:
+                    left.append(dest.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if left:
+                self._spill(dest, left)
+            dest.depth.set(0)
@@ -3,6 +3,7 @@ import requests
 import json
 import time
 import logging
+from urllib.parse import quote
 
 log = logging.getLogger("alerter")
 
@@ -71,20 +72,29 @@ def notify_opsgenie(routing_key, message, note=None, priority="P3", tags=None, d
         log.exception("notify_opsgenie failed: %s", e)
         return None, str(e)
 
-def notify_pagerduty(routing_key, summary, severity='error', source='mikrotik_collector', details=None, timeout=7):
-    """Send event to PagerDuty Events API v2 (trigger event)."""
-    url = "https://events.pagerduty.com/v2/enqueue"
-    payload = {
-        "routing_key": routing_key,
-        "event_action": "trigger",
-        "payload": {
-            "summary": summary,
-            "severity": severity,
-            "source": source,
-        }
+def pagerduty_event(routing_key, summary, severity='error', source='mikrotik_collector', details=None,
+                    event_action='trigger', dedup_key=None):
+    """Events API v2 body. Events sharing a dedup_key update the same incident;
+    'resolve' closes it and carries no payload."""
+    event = {"routing_key": routing_key, "event_action": event_action}
+    if dedup_key:
+        event["dedup_key"] = dedup_key
+    if event_action == 'resolve':
+        return event
+    event["payload"] = {
+        "summary": summary,
+        "severity": severity,
+        "source": source,
     }
     if details:
-        payload["payload"]["custom_details"] = details
+        event["payload"]["custom_details"] = details
+    return event
+
+def notify_pagerduty(routing_key, summary, severity='error', source='mikrotik_collector', details=None, timeout=7,
+                     event_action='trigger', dedup_key=None):
+    """Send event to PagerDuty Events API v2 (trigger, acknowledge or resolve)."""
+    url = "https://events.pagerduty.com/v2/enqueue"
+    payload = pagerduty_event(routing_key, summary, severity, source, details, event_action, dedup_key)
     try:
         r = requests.post(url, json=payload, timeout=timeout)
         return r.status_code, r.text
@@ -92,42 +102,77 @@ def notify_pagerduty(routing_key, summary, severity='error', source='mikrotik_co
         log.exception("notify_pagerduty failed: %s", e)
         return None, str(e)
 
-# Helper to dispatch based on provider type
-def alert_for_event_extended(device, iface, state, details, config):
-    """Extended alert dispatcher supporting webhook, slack, discord, opsgenie, pagerduty."""
-    alert_cfg = (config or {}).get('alerting') or {}
-    provider = alert_cfg.get('provider') or alert_cfg.get('type') or 'webhook'
+OPSGENIE_URL = "https://api.opsgenie.com/v2/alerts"
+PAGERDUTY_URL = "https://events.pagerduty.com/v2/enqueue"
+
+def alert_provider(alert_cfg):
+    return (alert_cfg.get('provider') or alert_cfg.get('type') or 'webhook').lower()
+
+def build_alert_request(device, iface, state, details, alert_cfg, summary=None, action='trigger', dedup_key=None):
+    """Return (url, headers, payload) for one alert under `alert_cfg`
+    (the 'alerting' config section), or None when it only goes to console.
+    `summary` replaces the per-interface message text; `action` ('trigger' or
+    'resolve') and `dedup_key` tie events to one incident where the provider
+    supports it."""
+    provider = alert_provider(alert_cfg)
+    msg = summary or f"[{device}/{iface}] {state} - {details}"
+    headers = {'Content-Type': 'application/json'}
     if provider == 'opsgenie':
         key = alert_cfg.get('opsgenie_api_key') or alert_cfg.get('opsgenie_key') or alert_cfg.get('routing_key')
         if not key:
             log.error('Opsgenie routing key not configured')
-            return
-        msg = f"[{device}/{iface}] {state} - {details}"
-        code, text = notify_opsgenie(key, msg, note=str(details), details={'device':device,'iface':iface,'state':state})
-        log.info("[OPSGENIE] status=%s resp=%s", code, (text or '')[:200])
-    elif provider == 'pagerduty':
+            return None
+        headers["Authorization"] = f"GenieKey {key}"
+        if action == 'resolve' and dedup_key:
+            alias = quote(dedup_key, safe='')
+            return f"{OPSGENIE_URL}/{alias}/close?identifierType=alias", headers, {"note": msg}
+        payload = {"message": msg[:130], "description": str(details), "priority": "P3",
+                   "details": {'device': device, 'iface': iface, 'state': state}}
+        if dedup_key:
+            payload["alias"] = dedup_key
+        return OPSGENIE_URL, headers, payload
+    if provider == 'pagerduty':
         key = alert_cfg.get('pagerduty_routing_key') or alert_cfg.get('pagerduty_key') or alert_cfg.get('routing_key')
         if not key:
             log.error('PagerDuty routing key not configured')
-            return
-        summary = f"[{device}/{iface}] {state}"
-        code, text = notify_pagerduty(key, summary, severity='critical' if state != 'UP' else 'info',
-                                     source=device, details=details)
-        log.info("[PAGERDUTY] status=%s resp=%s", code, (text or '')[:200])
+            return None
+        payload = pagerduty_event(key, summary or f"[{device}/{iface}] {state}",
+                                  severity='critical' if state != 'UP' else 'info', source=device,
+                                  details=details, event_action=action, dedup_key=dedup_key)
+        return PAGERDUTY_URL, headers, payload
+    webhook = alert_cfg.get('webhook') or alert_cfg.get('url')
+    if not webhook:
+        return None
+    if provider == 'discord':
+        payload = {"content": msg}
+    elif provider == 'slack':
+        payload = {"text": msg}
     else:
-        # fallback to original webhook-based behavior
-        provider = provider or alert_cfg.get('provider')
-        webhook = alert_cfg.get('webhook') or alert_cfg.get('url')
-        if webhook:
-            payload = {
-                "time": int(time.time()),
-                "device": device,
-                "iface": iface,
-                "state": state,
-                "details": details
-            }
-            code, text = notify_webhook(webhook, payload)
-            log.info(f"[WEBHOOK] provider={provider} status={code} resp={(text or '')[:200]}")
-        else:
-            # console fallback
-            notify_console(device, iface, state, details)
+        payload = {
+            "time": int(time.time()),
+            "device": device,
+            "iface": iface,
+            "state": state,
+            "details": details
+        }
+        if summary:
+            payload.update(summary=summary, action=action, dedup_key=dedup_key)
+    return webhook, headers, payload
+
+# Helper to dispatch based on provider type
+def alert_for_event_extended(device, iface, state, details, config, summary=None, action='trigger', dedup_key=None):
+    """Extended alert dispatcher supporting webhook, slack, discord, opsgenie, pagerduty.
+    Blocks on the HTTP call; the collector queues through alert_dispatch instead."""
+    alert_cfg = (config or {}).get('alerting') or {}
+    req = build_alert_request(device, iface, state, details, alert_cfg, summary, action, dedup_key)
+    if req is None:
+        # console fallback
+        notify_console(device, iface, state, summary or details)
+        return
+    url, headers, payload = req
+    try:
+        r = requests.post(url, json=payload, headers=headers, timeout=7)
+        code, text = r.status_code, r.text
+    except Exception as e:
+        code, text = None, str(e)
+    log.info("[%s] status=%s resp=%s", alert_provider(alert_cfg).upper(), code, (text or '')[:200])
@@ -1,6 +1,13 @@
 from flask import Flask, jsonify, request, abort
-from state_store import StateStore
+from state_store import StateStore, ReadPool
+from history_store import RESOLUTIONS, select_history, pick_resolution
+from inventory import ensure_schema
+from fleet_summary import merge as merge_summaries
+from event_retention import archived_events
+from tenant_store import select_events, check_api_key
 import sqlite3
+import json
+import time
 import os
 
 app = Flask(__name__)
@@ -11,12 +18,26 @@ from flask import abort
 def _auth_middleware():
     if not API_KEY:
         return  # no auth enforced if not set
+    if request.endpoint == 'tenant_events':
+        return  # admin key or that tenant's own key, checked by the route
     key = request.headers.get("X-API-Key")
     if key != API_KEY:
         abort(401)
 
 DB_PATH = os.environ.get('STATE_DB_PATH', 'state_api.db')
-store = StateStore(DB_PATH)
+store = StateStore(DB_PATH, readers=int(os.environ.get('API_DB_CONNECTIONS', 8)))
+_con = sqlite3.connect(DB_PATH)
+ensure_schema(_con)  # devices table + change log read by the collector's inventory
+_con.close()
+# summaries of collector shards this much older than the newest one are left out
+SUMMARY_MAX_AGE = int(os.environ.get('SUMMARY_MAX_AGE', 300))
+EVENT_ARCHIVE_DIR = os.environ.get('EVENT_ARCHIVE_DIR', 'event_archive')
+SAAS_DB = os.environ.get('SAAS_DB', 'saas.db')
+# read-only: the collector and migrate_saas.py create and own the schema
+tenants = ReadPool(SAAS_DB, int(os.environ.get('API_DB_CONNECTIONS', 8)))
+HISTORY_DB_PATH = os.environ.get('HISTORY_DB_PATH', 'iface_history.db')
+# read-only, like tenants: the collector creates iface_history.db and its schema
+history = ReadPool(HISTORY_DB_PATH, int(os.environ.get('API_DB_CONNECTIONS', 8)))
 
 @app.route('/api/v1/health', methods=['GET'])
 def health():
@@ -38,8 +59,9 @@ def create_device():
         if k not in data: return jsonify({"error": f"missing {k}"}), 400
     con = sqlite3.connect(DB_PATH)
     cur = con.cursor()
-    cur.execute("INSERT INTO devices(hostname, ip, username, password, enabled) VALUES(?,?,?,?,?)",
-                (data.get('hostname'), data['ip'], data['username'], data['password'], 1 if data.get('enabled', True) else 0))
+    cur.execute("INSERT INTO devices(hostname, ip, username, password, enabled, api_port, role) VALUES(?,?,?,?,?,?,?)",
+                (data.get('hostname'), data['ip'], data['username'], data['password'], 1 if data.get('enabled', True) else 0,
+                 data.get('api_port'), data.get('role')))
     con.commit()
     did = cur.lastrowid
     con.close()
@@ -49,7 +71,7 @@ def create_device():
 def update_device(did):
     data = request.get_json(force=True)
     fields, params = [], []
-    for k in ('hostname','ip','username','password'):
+    for k in ('hostname','ip','username','password','api_port','role'):
         if k in data: fields.append(f"{k}=?"); params.append(data[k])
     if 'enabled' in data: fields.append("enabled=?"); params.append(1 if data['enabled'] else 0)
     if not fields: return jsonify({"error":"nothing to update"}), 400
@@ -68,32 +90,158 @@ def delete_device(did):
     con.close()
     return jsonify({"deleted": did})
 
-def list_devices():
-    # Return list of devices from iface_state table (simple)
-    con = store._connect()
-    cur = con.cursor()
-    cur.execute("SELECT DISTINCT device FROM iface_state")
-    rows = [r[0] for r in cur.fetchall()]
-    con.close()
-    return jsonify({'devices': rows})
+def _not_modified(key):
+    """ETag from the change counter of `key` (see StateStore.version):
+    (304 response or None, etag). Checked before running the query, so an
+    unchanged poll costs one lookup."""
+    etag = f"v{store.version(key)}"  # ETags are per URL: the counter alone will do
+    if etag in request.if_none_match:
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+        return resp, etag
+    return None, etag
+
+def _cached(etag, body):
+    resp = jsonify(body)
+    resp.set_etag(etag)
+    return resp
 
 @app.route('/api/v1/device/<device>/ifaces', methods=['GET'])
 def list_ifaces(device):
-    con = store._connect()
-    cur = con.cursor()
-    cur.execute("SELECT iface, payload FROM iface_state WHERE device=?", (device,))
-    rows = [{'iface': r[0], 'payload': r[1]} for r in cur.fetchall()]
-    con.close()
-    return jsonify(rows)
+    """Interfaces of a device with their parsed snapshot; ?state=DOWN to filter."""
+    hit, etag = _not_modified('state:' + device)
+    if hit:
+        return hit
+    state = request.args.get('state')
+    rows = store.iface_snapshots(device, state.upper() if state else None)
+    return _cached(etag, [{'iface': i, 'ts': ts, 'state': st, 'reason': reason, 'since': since, 'payload': payload}
+                          for i, ts, st, reason, since, payload in rows])
+
+@app.route('/api/v1/device/<device>/iface/<path:iface>/state', methods=['GET'])
+def iface_state(device, iface):
+    row = store.load_iface_state(device, iface)
+    if row is None:
+        abort(404)
+    state, reason, since = row
+    duration = int(time.time()) - since if since else None
+    return jsonify({'device': device, 'iface': iface, 'state': state, 'reason': reason,
+                    'since': since, 'duration': duration})
+
+@app.route('/api/v1/ifaces/state/<state>', methods=['GET'])
+def ifaces_in_state(state):
+    """Interfaces in `state` (e.g. DOWN), longest first; ?min_duration=<s>&limit=<n>."""
+    now = int(time.time())
+    try:
+        min_duration = int(request.args.get('min_duration', 0))
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = store.iface_states(state.upper(), min_duration, limit, now)
+    return jsonify([{'device': d, 'iface': i, 'reason': reason, 'since': since, 'duration': now - since}
+                    for d, i, reason, since in rows])
 
 @app.route('/api/v1/events', methods=['GET'])
 def events():
-    con = store._connect()
-    cur = con.cursor()
-    cur.execute("SELECT device, iface, ts, event FROM event_log ORDER BY ts DESC LIMIT 200")
-    rows = [{'device': r[0], 'iface': r[1], 'ts': r[2], 'event': r[3]} for r in cur.fetchall()]
-    con.close()
-    return jsonify(rows)
+    """Events newest first. Filters: device, iface, state, since, until (unix ts);
+    limit (max 1000); cursor = next_cursor of the previous page."""
+    args = request.args
+    try:
+        limit = max(1, min(int(args.get('limit', 200)), 1000))
+        since = int(args['since']) if 'since' in args else None
+        until = int(args['until']) if 'until' in args else None
+        before = tuple(int(x) for x in args['cursor'].split(':', 1)) if args.get('cursor') else None
+        if before is not None and len(before) != 2:
+            raise ValueError("cursor must be <ts>:<id>")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    hit, etag = _not_modified('events')
+    if hit:
+        return hit
+    state = args.get('state')
+    rows = store.events(args.get('device'), args.get('iface'), state.upper() if state else None,
+                        since, until, before, limit)
+    items = [{'id': r[0], 'device': r[1], 'iface': r[2], 'ts': r[3], 'state': r[4], 'event': r[5]} for r in rows]
+    cursor = f"{rows[-1][3]}:{rows[-1][0]}" if len(rows) == limit else None
+    return _cached(etag, {'events': items, 'next_cursor': cursor})
+
+@app.route('/api/v1/events/archive', methods=['GET'])
+def events_archive():
+    """Events moved out of event_log by retention, as run-length records
+    (ts = first, last_ts, count); ?device&iface&since&until&limit."""
+    args = request.args
+    try:
+        limit = max(1, min(int(args.get('limit', 200)), 1000))
+        since = int(args['since']) if 'since' in args else None
+        until = int(args['until']) if 'until' in args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(archived_events(EVENT_ARCHIVE_DIR, device=args.get('device'), iface=args.get('iface'),
+                                   since=since, until=until, limit=limit))
+
+@app.route('/api/v1/tenants/<int:tid>/events', methods=['GET'])
+def tenant_events(tid):
+    """One tenant's events newest first; same filters and cursor as /api/v1/events (no state).
+    Needs the API key, or that tenant's own key in X-Tenant-Key."""
+    admin = not API_KEY or request.headers.get("X-API-Key") == API_KEY
+    tenant_key = request.headers.get("X-Tenant-Key")
+    if not admin and not (tenant_key and os.path.exists(SAAS_DB)):
+        abort(401)
+    if not admin:
+        with tenants.connection() as con:
+            if not check_api_key(con, tid, tenant_key):
+                abort(401)
+    args = request.args
+    try:
+        limit = max(1, min(int(args.get('limit', 200)), 1000))
+        since = int(args['since']) if 'since' in args else None
+        until = int(args['until']) if 'until' in args else None
+        before = tuple(int(x) for x in args['cursor'].split(':', 1)) if args.get('cursor') else None
+        if before is not None and len(before) != 2:
+            raise ValueError("cursor must be <ts>:<id>")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not os.path.exists(SAAS_DB):  # multi-tenancy never enabled: connecting would create it
+        return jsonify({'events': [], 'next_cursor': None})
+    with tenants.connection() as con:
+        rows = select_events(con, tid, args.get('device'), args.get('iface'), since, until, before, limit)
+    items = [{'id': r[0], 'device': r[1], 'iface': r[2], 'ts': r[3], 'event': r[4]} for r in rows]
+    cursor = f"{rows[-1][3]}:{rows[-1][0]}" if len(rows) == limit else None
+    return jsonify({'events': items, 'next_cursor': cursor})
+
+@app.route('/api/v1/summary', methods=['GET'])
+def summary():
+    """Fleet summary kept by the collector: state counts per device and for the
+    fleet, top interfaces by error rate and utilization, failed polls."""
+    hit, etag = _not_modified('summary')
+    if hit:
+        return hit
+    rows = store.summaries()
+    if not rows:
+        return jsonify({"error": "no summary published yet"}), 404
+    fresh = [r for r in rows if r[1] >= rows[0][1] - SUMMARY_MAX_AGE]
+    if len(fresh) == 1:
+        resp = app.response_class(fresh[0][2], mimetype='application/json')  # stored pre-serialized
+    else:
+        resp = jsonify(merge_summaries(json.loads(r[2]) for r in fresh))
+    resp.set_etag(etag)
+    return resp
+
+@app.route('/api/v1/device/<device>/iface/<path:iface>/history', methods=['GET'])
+def iface_history(device, iface):
+    now = int(time.time())
+    try:
+        end = int(request.args.get('end', now))
+        start = int(request.args.get('start', end - 86400))
+        res = request.args.get('resolution') or pick_resolution(start, end)
+        if res not in RESOLUTIONS:
+            raise ValueError(f"unknown resolution {res}")
+        rows = []
+        if os.path.exists(HISTORY_DB_PATH):  # history never enabled: connecting would create it
+            with history.connection() as con:
+                res, rows = select_history(con, device, iface, start, end, res)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({'device': device, 'iface': iface, 'resolution': res, 'points': rows})
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.environ.get('API_PORT', 5000)))
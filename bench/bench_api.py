@@ -0,0 +1,109 @@
+# bench_api.py - read API latency on a large event_log
+#
+#   python bench/bench_api.py --events 10000000
+#
+# Fills event_log with `events` rows spread over a year (2000 devices x 24
+# interfaces), then times the old unindexed "latest 200" query against the
+# indexed keyset pages behind /api/v1/events, and the full Flask request
+# path including a 304 revalidation.
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from state_store import StateStore  # noqa: E402
+
+STATES = ('DOWN', 'UP', 'DEGRADED', 'UP')
+
+
+def load(path, n, devices, ifaces, span):
+    store = StateStore(path)
+    con = store._connect()
+    names = [r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='event_log'")]
+    for name in names:  # bulk load first, index after
+        con.execute(f"DROP INDEX {name}")
+    rnd = random.Random(1)
+    start = int(time.time()) - span
+    chunk = 200000
+    for base in range(0, n, chunk):
+        rows = []
+        for k in range(base, min(n, base + chunk)):
+            state = STATES[k % 4]
+            rows.append((f'dev{rnd.randrange(devices)}', f'ether{rnd.randrange(ifaces)}',
+                         start + k * span // n, f'state_change X -> {state} : {{}}', state))
+        con.executemany("INSERT INTO event_log(device, iface, ts, event, state) VALUES (?,?,?,?,?)", rows)
+        con.commit()
+    con.close()
+    store = StateStore(path)  # recreates the indexes
+    con = store._connect()
+    con.execute("ANALYZE")
+    con.close()
+    return store
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return out, times[len(times) // 2] * 1000, times[-1] * 1000
+
+
+def main():
+    p = argparse.ArgumentParser(description="read API benchmark")
+    p.add_argument('--events', type=int, default=10_000_000)
+    p.add_argument('--devices', type=int, default=2000)
+    p.add_argument('--ifaces', type=int, default=24)
+    p.add_argument('--repeat', type=int, default=20)
+    p.add_argument('--dir', default=None, help="directory for the test database (default: tmp)")
+    args = p.parse_args()
+    path = os.path.join(args.dir or tempfile.mkdtemp(prefix='bench_api_'), 'state.db')
+    span = 365 * 86400
+    t0 = time.perf_counter()
+    if os.path.exists(path):
+        store = StateStore(path)
+    else:
+        store = load(path, args.events, args.devices, args.ifaces, span)
+    print(f"event_log: {args.events} rows, loaded+indexed in {time.perf_counter() - t0:.1f}s, "
+          f"db={os.path.getsize(path) / 1e6:.0f}MB", flush=True)
+    con = store._connect()
+    mid_ts, mid_id = con.execute("SELECT ts, id FROM event_log WHERE id=?", (args.events // 2,)).fetchone()
+    now = int(time.time())
+    cases = (
+        ('old: latest 200, no index', lambda: con.execute(
+            "SELECT device, iface, ts, event FROM event_log NOT INDEXED ORDER BY ts DESC LIMIT 200").fetchall()),
+        ('old: OFFSET mid page', lambda: con.execute(
+            "SELECT device, iface, ts, event FROM event_log ORDER BY ts DESC LIMIT 200 OFFSET ?",
+            (args.events // 2,)).fetchall()),
+        ('latest 200', lambda: store.events(limit=200)),
+        ('cursor page at mid', lambda: store.events(before=(mid_ts, mid_id), limit=200)),
+        ('device', lambda: store.events(device='dev7', limit=200)),
+        ('device+iface', lambda: store.events(device='dev7', iface='ether3', limit=200)),
+        ('state+last 30 days', lambda: store.events(state='DEGRADED', since=now - 30 * 86400, limit=200)),
+        ('device+7 days range', lambda: store.events(device='dev7', since=now - 200 * 86400,
+                                                     until=now - 193 * 86400, limit=200)),
+    )
+    for label, fn in cases:
+        rows, p50, mx = timed(fn, 3 if label.startswith('old') else args.repeat)
+        print(f"{label:>24}: rows={len(rows):<4} p50={p50:.2f}ms max={mx:.2f}ms", flush=True)
+
+    os.environ['STATE_DB_PATH'] = path
+    os.environ['HISTORY_DB_PATH'] = os.path.join(os.path.dirname(path), 'history.db')
+    os.environ.pop('API_KEY', None)
+    import api_server
+    client = api_server.app.test_client()
+    resp, p50, mx = timed(lambda: client.get('/api/v1/events?device=dev7&limit=200'), args.repeat)
+    print(f"{'GET /api/v1/events 200':>24}: p50={p50:.2f}ms max={mx:.2f}ms")
+    etag = resp.headers['ETag']
+    resp, p50, mx = timed(lambda: client.get('/api/v1/events?device=dev7&limit=200',
+                                             headers={'If-None-Match': etag}), args.repeat)
+    print(f"{'GET /api/v1/events 304':>24}: status={resp.status_code} p50={p50:.2f}ms max={mx:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# bench_classifier.py - per-interface classify_interface vs classify_batch
+#
+#   python bench/bench_classifier.py --sizes 10000 100000 1000000
+#
+# "per-iface" is what the collector used to do for every interface:
+# classify_interface() plus a separate rx/tx/err rate computation.
+# "batch" is classify_batch() on prebuilt columns; "batch+cols" includes
+# building the columns from snapshot dicts with to_columns().
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from classifier import classify_interface, classify_batch, to_columns  # noqa: E402
+
+
+def templates(k, seed=1):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(k):
+        prev = {'ts': 1000, 'rx_bytes': rnd.randint(0, 10**9), 'tx_bytes': rnd.randint(0, 10**9),
+                'rx_errors': rnd.randint(0, 10), 'tx_errors': 0, 'rx_drops': 0, 'tx_drops': 0,
+                'link_downs': 2, 'speed_mbps': 1000, 'carrier': True, 'disabled': False}
+        cur = dict(prev, ts=1015, rx_bytes=prev['rx_bytes'] + rnd.randint(0, 10**7),
+                   tx_bytes=prev['tx_bytes'] + rnd.randint(0, 10**7),
+                   rx_errors=prev['rx_errors'] + rnd.choice([0, 0, 0, 40]),
+                   link_downs=prev['link_downs'] + rnd.choice([0, 0, 0, 0, 1]),
+                   carrier=rnd.random() > 0.02, expected_speed_mbps=rnd.choice([None, 1000, 10000]),
+                   flaps='6AMAAAEAAAA=' if rnd.random() < 0.1 else '')
+        out.append((cur, prev))
+    return out
+
+
+def per_iface(pairs, thresholds):
+    for cur, prev in pairs:
+        classify_interface(cur, prev, thresholds)
+        interval = max(1, cur['ts'] - prev.get('ts', cur['ts']))
+        max(0, ((cur.get('rx_bytes', 0) - prev.get('rx_bytes', 0)) * 8) / interval)
+        max(0, ((cur.get('tx_bytes', 0) - prev.get('tx_bytes', 0)) * 8) / interval)
+        max(0, ((cur.get('rx_errors', 0) - prev.get('rx_errors', 0))
+                + (cur.get('tx_errors', 0) - prev.get('tx_errors', 0))) / interval)
+
+
+def main():
+    p = argparse.ArgumentParser(description="classifier throughput benchmark")
+    p.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = p.parse_args()
+    thresholds = {'err_per_sec': 1.0, 'flaps_window': 300, 'flaps_count': 3}
+    pool = templates(1000)
+    for n in args.sizes:
+        pairs = [pool[i % len(pool)] for i in range(n)]
+        t0 = time.perf_counter()
+        per_iface(pairs, thresholds)
+        t_old = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        cur, prev = to_columns([c for c, _ in pairs], [p for _, p in pairs])
+        t_cols = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        classify_batch(cur, prev, thresholds)
+        t_batch = time.perf_counter() - t0
+        print(f"n={n:<8} per-iface={t_old:7.3f}s ({n / t_old / 1e3:6.0f}k/s)  "
+              f"batch={t_batch:7.3f}s ({n / t_batch / 1e3:6.0f}k/s)  "
+              f"batch+cols={t_batch + t_cols:7.3f}s  speedup={t_old / t_batch:4.1f}x", flush=True)
+        del pairs, cur, prev
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+# bench_collector.py - end-to-end collector benchmark on a simulated fleet
+#
+#   python bench/bench_collector.py --devices 200 1000 --json out.json
+#   python bench/bench_collector.py --devices 200 1000 --baseline out.json   # exit 1 on regression
+#
+# Starts bench/routeros_sim.py (latency, jitter, hangs, counter wraps, flaps
+# and error bursts are passed through) and, per fleet size, runs
+# collector_api.start_collector in a child process: after every device has
+# been polled once it measures `--duration` seconds of steady state and
+# reports devices/s, interfaces/s, per-device cycle time (dispatch to
+# persisted), CPU, peak RSS, SQLite commit time and alert/event volume.
+# With --baseline each result is compared to the same fleet size in an
+# earlier --json file and any metric worse by more than --tolerance fails, as
+# does a run that cannot be compared (other parameters, fleet size missing
+# from the baseline, warm-up incomplete on either side).
+import os
+import sys
+import json
+import math
+import time
+import sqlite3
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# metric -> True when higher is better; what --baseline compares
+COMPARED = {
+    'devices_per_sec': True,
+    'cycle_avg_ms': False,
+    'cpu_ms_per_device': False,
+    'sqlite_ms_per_device': False,
+    'max_rss_mb': False,
+}
+# run options that may differ from the baseline's (fleet sizes are matched per result)
+UNCOMPARED_PARAMS = ('devices', 'tolerance')
+
+
+def fleet(n, port):
+    return [{'name': f'sim{i}', 'ip': '127.0.0.1', 'api_port': port, 'user': f'sim{i}', 'pass': ''}
+            for i in range(n)]
+
+
+def hist(name, labels=None):
+    """(count, sum, [(upper bound, cumulative count)]) of a histogram in the default registry."""
+    from prometheus_client import REGISTRY
+    count = total = 0.0
+    buckets = []
+    for fam in REGISTRY.collect():
+        for s in fam.samples:
+            if not s.name.startswith(name) or any(s.labels.get(k) != v for k, v in (labels or {}).items()):
+                continue
+            if s.name == name + '_count':
+                count = s.value
+            elif s.name == name + '_sum':
+                total = s.value
+            elif s.name == name + '_bucket':
+                buckets.append((float(s.labels['le']), s.value))
+    return count, total, sorted(buckets)
+
+
+def quantile(before, after, q):
+    """q-quantile of what a histogram observed between two hist() reads,
+    interpolated within buckets."""
+    diff = [(le, a - b) for (le, a), (_, b) in zip(after[2], before[2])]
+    total = diff[-1][1] if diff else 0
+    if not total:
+        return None
+    rank, lo, prev = q * total, 0.0, 0
+    for le, c in diff:
+        if c >= rank:
+            if le == float('inf'):
+                return lo
+            return lo + (le - lo) * (rank - prev) / max(c - prev, 1)
+        lo, prev = le, c
+    return lo
+
+
+def poll_failures():
+    import exporter
+    return sum(float(line.rsplit(' ', 1)[1]) for line in exporter.TABLE.render().decode().splitlines()
+               if line.startswith('noc_device_poll_failures_total{'))
+
+
+def run_child(args):
+    import collector_api
+    from alert_dispatch import AlertDispatcher
+    alerts = [0]
+    submit = AlertDispatcher.submit
+
+    def counted_submit(self, *a, **kw):
+        alerts[0] += 1  # alerts and correlated incidents handed to delivery
+        return submit(self, *a, **kw)
+
+    AlertDispatcher.submit = counted_submit
+    directory = tempfile.mkdtemp(prefix='bench_collector_')
+    db_path = os.path.join(directory, 'state.db')
+    config = {
+        'devices': fleet(args.devices, args.port), 'poll_interval': args.interval, 'db_path': db_path,
+        'engine': args.engine, 'logging': {'level': 'WARNING'},
+        'connections': {'socket_timeout': args.timeout},
+        'async': {'max_concurrency': args.concurrency, 'device_timeout': args.timeout},
+        'history': {'db_path': os.path.join(directory, 'history.db'), 'enabled': not args.no_history},
+        'alerting': {'dispatch': {'spill_path': os.path.join(directory, 'alert_spill.jsonl')}},
+        'instrumentation': {'enabled': args.instrument, 'profile_dir': directory},
+    }
+    t = threading.Thread(target=collector_api.start_collector, args=(config,), daemon=True)
+    t.start()
+
+    def events():
+        try:
+            con = sqlite3.connect(db_path)
+            n = con.execute("SELECT count(*) FROM event_log").fetchone()[0]
+            con.close()
+            return n
+        except sqlite3.Error:
+            return 0
+
+    warm_deadline = time.monotonic() + args.warmup
+    while hist('noc_collector_cycle_seconds')[0] < args.devices and time.monotonic() < warm_deadline:
+        time.sleep(0.05)
+    before = {
+        'cycle': hist('noc_collector_cycle_seconds'),
+        'commit': hist('noc_pipeline_stage_seconds', {'stage': 'commit'}),
+        'persist': hist('noc_pipeline_stage_seconds', {'stage': 'persist'}),
+        'usage': resource.getrusage(resource.RUSAGE_SELF),
+        'alerts': alerts[0], 'events': events(), 'failures': poll_failures(),
+        'wall': time.perf_counter(),
+    }
+    time.sleep(args.duration)
+    after = {
+        'cycle': hist('noc_collector_cycle_seconds'),
+        'commit': hist('noc_pipeline_stage_seconds', {'stage': 'commit'}),
+        'persist': hist('noc_pipeline_stage_seconds', {'stage': 'persist'}),
+        'usage': resource.getrusage(resource.RUSAGE_SELF),
+        'alerts': alerts[0], 'events': events(), 'failures': poll_failures(),
+        'wall': time.perf_counter(),
+    }
+    collector_api.shutdown_event.set()
+    t.join(timeout=30)
+
+    wall = after['wall'] - before['wall']
+    polled = after['cycle'][0] - before['cycle'][0]
+    cpu = (after['usage'].ru_utime + after['usage'].ru_stime) - (before['usage'].ru_utime + before['usage'].ru_stime)
+    commit = after['commit'][1] - before['commit'][1]
+    per = max(polled, 1)
+    p50, p99 = (quantile(before['cycle'], after['cycle'], q) for q in (0.5, 0.99))
+    print(json.dumps({
+        'devices': args.devices,
+        'engine': args.engine,
+        'warmed_up': before['cycle'][0] >= args.devices,
+        'seconds': round(wall, 2),
+        'devices_polled': int(polled),
+        'devices_per_sec': round(polled / wall, 1),
+        'interfaces_per_sec': round(polled * args.ifaces / wall, 1),
+        'fleet_cycle_s': round(args.devices * wall / polled, 3) if polled else None,
+        'cycle_avg_ms': round((after['cycle'][1] - before['cycle'][1]) / per * 1000, 2),
+        'cycle_p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+        'cycle_p99_ms': round(p99 * 1000, 1) if p99 is not None else None,
+        'cpu_percent': round(cpu / wall * 100, 1),
+        'cpu_ms_per_device': round(cpu / per * 1000, 3),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'sqlite_commit_s': round(commit, 3),
+        'sqlite_ms_per_device': round(commit / per * 1000, 3),
+        'persist_ms_per_device': round((after['persist'][1] - before['persist'][1]) / per * 1000, 3),
+        'poll_failures': int(after['failures'] - before['failures']),
+        'alerts': after['alerts'] - before['alerts'],
+        'events': after['events'] - before['events'],
+    }))
+
+
+def compare(results, baseline, tolerance, params=None):
+    """Failure lines: runs that cannot be compared (parameters differ, no baseline
+    entry, incomplete warm-up, unmeasured metric) and every compared metric worse
+    than baseline by more than `tolerance`."""
+    bad = []
+    if params is not None:
+        ref_params = baseline.get('params') or {}
+        for k in sorted(set(params) | set(ref_params)):
+            if k not in UNCOMPARED_PARAMS and params.get(k) != ref_params.get(k):
+                bad.append(f"PARAMS {k}: baseline {ref_params.get(k)!r} != {params.get(k)!r}")
+    old = {(r['devices'], r.get('engine')): r for r in baseline.get('results', [])}
+    for r in results:
+        run = f"devices={r['devices']} engine={r.get('engine')}"
+        b = old.get((r['devices'], r.get('engine')))
+        if b is None:
+            bad.append(f"MISSING {run}: not in baseline")
+            continue
+        for name, entry in (('baseline', b), ('run', r)):
+            if not entry.get('warmed_up'):
+                bad.append(f"WARM-UP {run}: {name} did not poll every device before measuring")
+        for metric, higher_better in COMPARED.items():
+            new, ref = r.get(metric), b.get(metric)
+            if new is None or ref is None:
+                bad.append(f"UNMEASURED {run} {metric}: {ref} -> {new}")
+                continue
+            if ref:
+                change = (new - ref) / ref
+            else:
+                change = 0.0 if new == ref else math.copysign(math.inf, new - ref)
+            if (-change if higher_better else change) > tolerance:
+                bad.append(f"REGRESSION {run} {metric}: {ref} -> {new} ({change:+.0%})")
+    return bad
+
+
+def main():
+    p = argparse.ArgumentParser(description="End-to-end collector benchmark")
+    p.add_argument('--devices', type=int, nargs='+', default=[200, 1000])
+    p.add_argument('--ifaces', type=int, default=24)
+    p.add_argument('--engine', default='thread', choices=('thread', 'async'))
+    p.add_argument('--interval', type=float, default=5.0, help="collector poll interval (s)")
+    p.add_argument('--duration', type=float, default=20.0, help="measured seconds after warm-up")
+    p.add_argument('--warmup', type=float, default=60.0, help="max seconds to wait for every device's first poll")
+    p.add_argument('--latency', type=float, default=0.005)
+    p.add_argument('--jitter', type=float, default=0.005)
+    p.add_argument('--hang', type=float, default=0.0)
+    p.add_argument('--wrap', action='store_true')
+    p.add_argument('--flap', type=float, default=0.01)
+    p.add_argument('--errors', type=float, default=0.01)
+    p.add_argument('--timeout', type=float, default=2.0, help="device socket/poll timeout (s)")
+    p.add_argument('--concurrency', type=int, default=512, help="async engine concurrency")
+    p.add_argument('--no-history', action='store_true', help="do not write the rate history store")
+    p.add_argument('--instrument', action='store_true', help="enable per-stage cycle instrumentation")
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--json', help="write results to this file")
+    p.add_argument('--baseline', help="earlier --json file to compare against")
+    p.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown (0.2 = 20%%)")
+    p.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    p.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = p.parse_args()
+    if args.child:
+        args.devices = args.devices[0]
+        return run_child(args)
+
+    sim_args = ['--ifaces', str(args.ifaces), '--latency', str(args.latency), '--jitter', str(args.jitter),
+                '--hang', str(args.hang), '--flap', str(args.flap), '--errors', str(args.errors),
+                '--seed', str(args.seed)] + (['--wrap'] if args.wrap else [])
+    sim = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bench', 'routeros_sim.py')] + sim_args,
+                           stdout=subprocess.PIPE, text=True)
+    port = int(sim.stdout.readline())
+    results = []
+    try:
+        for n in args.devices:
+            child = [sys.executable, __file__, '--child', '--port', str(port), '--devices', str(n)]
+            for opt in ('ifaces', 'engine', 'interval', 'duration', 'warmup', 'timeout', 'concurrency'):
+                child += [f'--{opt}', str(getattr(args, opt))]
+            child += [f'--{flag}' for flag in ('no-history', 'instrument') if getattr(args, flag.replace('-', '_'))]
+            out = subprocess.run(child, capture_output=True, text=True)
+            if out.returncode != 0:
+                sys.stderr.write(out.stderr)
+                raise SystemExit(f"benchmark child failed for {n} devices")
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            results.append(r)
+            print(f"devices={n:<5} {r['devices_per_sec']:8.1f} dev/s {r['interfaces_per_sec']:9.1f} if/s "
+                  f"cycle avg={r['cycle_avg_ms']}ms p99={r['cycle_p99_ms']}ms cpu={r['cpu_percent']}% "
+                  f"rss={r['max_rss_mb']}MB sqlite={r['sqlite_ms_per_device']}ms/dev "
+                  f"alerts={r['alerts']} failures={r['poll_failures']}"
+                  + ("" if r['warmed_up'] else "  (warm-up incomplete)"), flush=True)
+    finally:
+        sim.terminate()
+        sim.wait()
+
+    report = {
+        'ts': int(time.time()),
+        'commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                 text=True).stdout.strip() or None,
+        'params': {k: v for k, v in vars(args).items() if k not in ('child', 'port', 'json', 'baseline')},
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        bad = compare(results, baseline, args.tolerance, report['params'])
+        for line in bad:
+            print(line, file=sys.stderr)
+        if bad:
+            raise SystemExit(1)
+        print(f"no regression against {args.baseline} (commit {baseline.get('commit')})")
+
+
+if __name__ == '__main__':
+    main()
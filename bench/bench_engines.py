@@ -0,0 +1,109 @@
+# bench_engines.py - thread engine vs async engine on a simulated fleet
+#
+#   python bench/bench_engines.py --devices 1000 2000 5000 --latency 0.02
+#
+# Starts bench/routeros_sim.py in a subprocess, then runs each engine in its
+# own child process (so peak RSS is per engine) for a few cycles and reports
+# cold (connect + login) and warm cycle times.
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def fleet(n, port):
+    return [{'name': f'sim{i}', 'ip': '127.0.0.1', 'api_port': port, 'user': f'sim{i}', 'pass': ''}
+            for i in range(n)]
+
+
+def run_child(args):
+    from collector_api import poll_device
+    devices = fleet(args.devices, args.port)
+    cycles = []
+    if args.engine == 'async':
+        from collector_async import AsyncEngine
+        engine = AsyncEngine(max_concurrency=args.concurrency, device_timeout=args.timeout)
+        for _ in range(args.cycles):
+            t0 = time.perf_counter()
+            results, failures = engine.poll_all(devices)
+            cycles.append((time.perf_counter() - t0, len(results), len(failures)))
+        engine.close()
+    else:
+        from functools import partial
+        from concurrent.futures import ThreadPoolExecutor
+        from connection_pool import ConnectionManager
+        cm = ConnectionManager(socket_timeout=args.timeout)
+        poll = partial(poll_device, connections=cm)
+        with ThreadPoolExecutor(max_workers=min(16, len(devices))) as ex:
+            for _ in range(args.cycles):
+                t0 = time.perf_counter()
+                ok = bad = 0
+                for fut in [ex.submit(poll, d) for d in devices]:
+                    try:
+                        fut.result()
+                        ok += 1
+                    except Exception:
+                        bad += 1
+                cycles.append((time.perf_counter() - t0, ok, bad))
+        cm.close_all()
+    print(json.dumps({
+        'engine': args.engine,
+        'devices': args.devices,
+        'cycles': [{'seconds': round(s, 3), 'ok': ok, 'failed': bad} for s, ok, bad in cycles],
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Collector engine benchmark")
+    p.add_argument('--devices', type=int, nargs='+', default=[1000, 2000, 5000])
+    p.add_argument('--engines', nargs='+', default=['thread', 'async'])
+    p.add_argument('--ifaces', type=int, default=8)
+    p.add_argument('--latency', type=float, default=0.02, help="simulated per-command latency (s)")
+    p.add_argument('--cycles', type=int, default=3)
+    p.add_argument('--concurrency', type=int, default=512)
+    p.add_argument('--timeout', type=float, default=10.0)
+    p.add_argument('--json', help="write results to this file")
+    p.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    p.add_argument('--engine', help=argparse.SUPPRESS)
+    p.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = p.parse_args()
+    if args.child:
+        args.devices = args.devices[0]
+        return run_child(args)
+
+    sim = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bench', 'routeros_sim.py'),
+                            '--ifaces', str(args.ifaces), '--latency', str(args.latency)],
+                           stdout=subprocess.PIPE, text=True)
+    port = int(sim.stdout.readline())
+    rows = []
+    try:
+        for n in args.devices:
+            for engine in args.engines:
+                out = subprocess.run([sys.executable, __file__, '--child', '--engine', engine,
+                                      '--devices', str(n), '--port', str(port),
+                                      '--cycles', str(args.cycles), '--concurrency', str(args.concurrency),
+                                      '--timeout', str(args.timeout)],
+                                     capture_output=True, text=True, check=True)
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                rows.append(r)
+                warm = [c['seconds'] for c in r['cycles'][1:]] or [r['cycles'][0]['seconds']]
+                print(f"{engine:>6} devices={n:<5} cold={r['cycles'][0]['seconds']:7.2f}s "
+                      f"warm={min(warm):7.2f}s ok={r['cycles'][-1]['ok']:<5} "
+                      f"failed={r['cycles'][-1]['failed']:<4} rss={r['max_rss_mb']}MB", flush=True)
+    finally:
+        sim.terminate()
+        sim.wait()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'ifaces': args.ifaces, 'latency': args.latency, 'results': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# bench_exporter.py - /metrics scrape cost at fleet scale
+#
+#   python bench/bench_exporter.py --series 100000 --per-device 50
+#
+# "labels" is the previous layout: prometheus_client Gauges with a `state`
+# label, rendered by generate_latest() (after `--churn` state changes,
+# each of which leaves a stale series behind). "table" is exporter.py:
+# lines formatted on device update, joined at scrape time.
+import os
+import sys
+import time
+import gzip
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prometheus_client import CollectorRegistry, Gauge, generate_latest  # noqa: E402
+from exporter import InterfaceTable  # noqa: E402
+
+NL = b'\n'
+STATES = ('UP', 'UP', 'UP', 'DEGRADED', 'DOWN')
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+
+def main():
+    p = argparse.ArgumentParser(description="metrics exporter scrape benchmark")
+    p.add_argument('--series', type=int, default=100000, help="interfaces")
+    p.add_argument('--per-device', type=int, default=50)
+    p.add_argument('--churn', type=float, default=0.05, help="fraction of interfaces that changed state once")
+    p.add_argument('--repeat', type=int, default=3)
+    args = p.parse_args()
+    rnd = random.Random(1)
+    n_dev = max(1, args.series // args.per_device)
+    fleet = [(f"R{d}", [(f"ether{i}", rnd.choice(STATES), (rnd.random() * 1e9, rnd.random() * 1e9, 0.0, 0.0))
+                        for i in range(args.per_device)]) for d in range(n_dev)]
+
+    reg = CollectorRegistry()
+    up = Gauge('noc_interface_up', 'up', ['device', 'iface', 'state'], registry=reg)
+    rx = Gauge('noc_interface_rx_bps', 'rx', ['device', 'iface'], registry=reg)
+    tx = Gauge('noc_interface_tx_bps', 'tx', ['device', 'iface'], registry=reg)
+    err = Gauge('noc_interface_err_per_sec', 'err', ['device', 'iface'], registry=reg)
+    t0 = time.perf_counter()
+    for device, rows in fleet:
+        for iface, state, rates in rows:
+            up.labels(device, iface, state).set(1 if state == 'UP' else 0)
+            rx.labels(device, iface).set(rates[0])
+            tx.labels(device, iface).set(rates[1])
+            err.labels(device, iface).set(rates[2])
+    t_upd_old = time.perf_counter() - t0
+    for device, rows in fleet:
+        for iface, state, _ in rows:
+            if rnd.random() < args.churn:
+                up.labels(device, iface, 'DOWN' if state == 'UP' else 'UP').set(0)
+    t_old, body_old = timed(lambda: generate_latest(reg), args.repeat)
+
+    table = InterfaceTable()
+    t0 = time.perf_counter()
+    for device, rows in fleet:
+        table.update_device(device, rows)
+        table.observe_poll(device, 0.1)
+    t_upd_new = time.perf_counter() - t0
+    t_new, body_new = timed(table.render, args.repeat)
+    t_gz, gz = timed(lambda: gzip.compress(body_new, compresslevel=1), 1)
+
+    n = table.series()
+    print(f"interfaces={n} devices={n_dev}")
+    print(f"labels: update={t_upd_old:6.2f}s  scrape={t_old * 1e3:8.1f} ms  body={len(body_old) / 1e6:6.1f} MB "
+          f"lines={body_old.count(NL)}")
+    print(f"table:  update={t_upd_new:6.2f}s  scrape={t_new * 1e3:8.1f} ms  body={len(body_new) / 1e6:6.1f} MB "
+          f"lines={body_new.count(NL)}  gzip(1)={t_gz * 1e3:.0f} ms -> {len(gz) / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# bench_history.py - range query latency on the interface history store
+#
+#   python bench/bench_history.py --series 200 --days 30
+#
+# Loads `days` of 15 s samples for one interface (plus 1h rollups for
+# `series` others so the tables are not trivially small), then times range
+# queries at each resolution.
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from history_store import HistoryStore  # noqa: E402
+
+
+def main():
+    p = argparse.ArgumentParser(description="HistoryStore query benchmark")
+    p.add_argument('--series', type=int, default=200)
+    p.add_argument('--days', type=int, default=30)
+    p.add_argument('--interval', type=int, default=15)
+    p.add_argument('--repeat', type=int, default=50)
+    args = p.parse_args()
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_hist_'), 'h.db')
+    retention = {r: (args.days + 1) * 86400 for r in ('raw', '1m', '5m', '1h')}
+    h = HistoryStore(path, retention=retention)
+    now = int(time.time())
+    start = now - args.days * 86400
+
+    t0 = time.perf_counter()
+    n = 0
+    for ts in range(start, now, args.interval):
+        h.append('core1', 'sfp-sfpplus1', ts, 1e9, 5e8, 0.1, 0.0)
+        n += 1
+        if n % 20000 == 0:
+            h.flush()
+    for s in range(args.series):
+        for ts in range(start, now, 3600):
+            h.append(f'dev{s}', 'ether1', ts, 1e6, 1e6, 0, 0)
+        h.flush()
+    h.flush()
+    print(f"loaded {n} samples for the measured interface (+{args.series} series) "
+          f"in {time.perf_counter() - t0:.1f}s, db={os.path.getsize(path) / 1e6:.1f}MB")
+
+    for label, span, res in (('1h window', 3600, 'raw'), ('1 day', 86400, None),
+                             ('7 days', 7 * 86400, None), (f'{args.days} days', args.days * 86400, None),
+                             (f'{args.days} days raw', args.days * 86400, 'raw')):
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            used, rows = h.query('core1', 'sfp-sfpplus1', now - span, now, resolution=res)
+            times.append(time.perf_counter() - t0)
+        times.sort()
+        print(f"{label:>14}: resolution={used:<4} points={len(rows):<7} "
+              f"p50={times[len(times) // 2] * 1000:.2f}ms max={times[-1] * 1000:.2f}ms")
+    h.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# bench_retention.py - event retention throughput and impact on collector writes
+#
+#   python bench/bench_retention.py --events 2000000
+#
+# Loads `events` old flapping transitions into event_log, then moves them
+# into monthly partitions while a writer thread commits collector-sized
+# batches; reports move rate, compaction ratio and the writer's commit
+# latency with and without the retention job running.
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from state_store import StateStore  # noqa: E402
+from event_retention import EventRetention  # noqa: E402
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))] if values else 0.0
+
+
+def writer(store, stop, lat):
+    k = 0
+    while not stop.is_set():
+        snaps = [(f'dev{d}', 'ether1', {'ts': k, 'state': 'UP'}) for d in range(200)]
+        t0 = time.perf_counter()
+        store.write_cycle(snaps, [('dev1', 'ether1', 'state_change UP -> DOWN : {}', 'DOWN')])
+        lat.append(time.perf_counter() - t0)
+        k += 1
+        time.sleep(0.02)
+
+
+def main():
+    p = argparse.ArgumentParser(description="event retention benchmark")
+    p.add_argument('--events', type=int, default=2_000_000)
+    p.add_argument('--devices', type=int, default=500)
+    p.add_argument('--batch', type=int, default=500)
+    args = p.parse_args()
+    tmp = tempfile.mkdtemp(prefix='bench_retention_')
+    path = os.path.join(tmp, 'state.db')
+    store = StateStore(path, batched=True)
+    now = int(time.time())
+    start = now - 90 * 86400
+    rnd = random.Random(1)
+    con = store._connect()
+    for base in range(0, args.events, 200000):
+        rows = []
+        for k in range(base, min(args.events, base + 200000)):
+            t = ('UP -> DOWN', 'DOWN -> UP')[k % 2]
+            rows.append((f'dev{rnd.randrange(args.devices)}', f'ether{k % 4}', start + k * (80 * 86400) // args.events,
+                         f"state_change {t} : {{}}", t.split()[-1]))
+        con.executemany("INSERT INTO event_log(device, iface, ts, event, state) VALUES (?,?,?,?,?)", rows)
+        con.commit()
+    con.close()
+    size0 = os.path.getsize(path)
+
+    lat = []
+    stop = threading.Event()
+    w = threading.Thread(target=writer, args=(store, stop, lat))
+    w.start()
+    time.sleep(2)
+    idle = list(lat)
+    lat.clear()
+    r = EventRetention(path, os.path.join(tmp, 'archive'), hot_days=7, batch=args.batch)
+    t0 = time.perf_counter()
+    moved = r.run_once()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    w.join()
+    runs = 0
+    for key in r.partitions():
+        c = __import__('sqlite3').connect(r.partition_path(key))
+        runs += c.execute("SELECT count(*) FROM events").fetchone()[0]
+        c.close()
+    part_size = sum(os.path.getsize(r.partition_path(k)) for k in r.partitions())
+    print(f"moved {moved} events in {elapsed:.1f}s ({moved / elapsed:.0f}/s) into {len(r.partitions())} partitions: "
+          f"{runs} run-length records ({moved / max(runs, 1):.1f}x), {part_size / 1e6:.0f}MB vs hot table "
+          f"{size0 / 1e6:.0f}MB before")
+    print(f"writer commits idle:      p50={pct(idle, 50) * 1000:.2f}ms p99={pct(idle, 99) * 1000:.2f}ms")
+    print(f"writer commits retention: p50={pct(lat, 50) * 1000:.2f}ms p99={pct(lat, 99) * 1000:.2f}ms "
+          f"max={max(lat) * 1000:.2f}ms ({len(lat)} commits)")
+    r.close()
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# bench_snapshots.py - bytes and WAL written per cycle by iface_state snapshots
+#
+#   python bench/bench_snapshots.py --devices 1000 --ifaces 50 --cycles 40
+#
+# Replays `cycles` poll cycles (15 s apart on a simulated clock) of a
+# devices x ifaces fleet through a batched StateStore, one flush per cycle:
+# every counter moves each cycle and --changes of the interfaces change
+# link state. Compares JSON text payloads written every cycle (the old
+# format), snapshot_codec records written every cycle, and records written
+# on change with --checkpoint. Reports, per steady-state cycle, rows and
+# payload bytes written, WAL bytes appended (autocheckpoint off, WAL
+# truncated between cycles) and time in save + flush; plus database size.
+import os
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import state_store  # noqa: E402
+import snapshot_codec  # noqa: E402
+from state_store import StateStore  # noqa: E402
+
+INTERVAL = 15
+
+
+def fleet(devices, ifaces):
+    return {(f'dev{d}', f'ether{i}'): {
+        'ts': 0, 'name': f'ether{i}', 'disabled': False, 'carrier': True,
+        'rx_bytes': 0, 'tx_bytes': 0, 'rx_errors': 0, 'tx_errors': 0, 'rx_drops': 0, 'tx_drops': 0,
+        'link_downs': 0, 'speed_mbps': 1000, 'flaps': '', 'state': 'UP', 'reason': 'carrier OK', 'state_since': 0,
+    } for d in range(devices) for i in range(ifaces)}
+
+
+def advance(snaps, now, changes, rnd):
+    for key, s in snaps.items():
+        cur = dict(s, ts=now, rx_bytes=s['rx_bytes'] + rnd.randrange(1, 10**8),
+                   tx_bytes=s['tx_bytes'] + rnd.randrange(1, 10**8), rx_drops=s['rx_drops'] + (rnd.random() < .1))
+        if rnd.random() < changes:
+            up = not s['carrier']
+            cur.update(carrier=up, state='UP' if up else 'DOWN', reason='carrier OK' if up else 'no carrier',
+                       state_since=now, link_downs=s['link_downs'] + (not up))
+        snaps[key] = cur
+
+
+def run(mode, path, args):
+    clock = [1_700_000_000]
+    state_store.time = types.SimpleNamespace(time=lambda: clock[0])  # simulated poll clock
+    if mode == 'json':
+        state_store.snapshot_codec = types.SimpleNamespace(encode=json.dumps)
+    store = StateStore(path, batched=True, checkpoint=args.checkpoint if mode == 'on-change' else None)
+    store._con.execute("PRAGMA wal_autocheckpoint=0")
+    rnd = random.Random(args.seed)
+    snaps = fleet(args.devices, args.ifaces)
+    totals = {'rows': 0, 'bytes': 0, 'wal': 0, 'seconds': 0.0}
+    try:
+        for c in range(args.cycles):
+            clock[0] += INTERVAL
+            advance(snaps, clock[0], args.changes, rnd)
+            t0 = time.perf_counter()
+            for (device, iface), snap in snaps.items():
+                store.save_iface_snapshot(device, iface, snap)
+            written = sum(len(v[-1]) for v in store._pending_states.values())
+            rows, _ = store.flush()
+            elapsed = time.perf_counter() - t0
+            wal = os.path.getsize(path + '-wal')
+            store._con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if c == 0:
+                continue  # first cycle writes every row whatever the mode
+            totals['rows'] += rows
+            totals['bytes'] += written
+            totals['wal'] += wal
+            totals['seconds'] += elapsed
+    finally:
+        store.close()
+        state_store.time = time
+        state_store.snapshot_codec = snapshot_codec
+    n = args.cycles - 1
+    return {'mode': mode, 'rows': totals['rows'] / n, 'payload_kb': totals['bytes'] / n / 1024,
+            'wal_mb': totals['wal'] / n / 2**20, 'ms': totals['seconds'] / n * 1000,
+            'db_mb': os.path.getsize(path) / 2**20}
+
+
+def main():
+    p = argparse.ArgumentParser(description="Snapshot persistence volume benchmark")
+    p.add_argument('--devices', type=int, default=1000)
+    p.add_argument('--ifaces', type=int, default=50)
+    p.add_argument('--cycles', type=int, default=40)
+    p.add_argument('--changes', type=float, default=0.002, help="fraction of interfaces changing state per cycle")
+    p.add_argument('--checkpoint', type=float, default=300.0)
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--dir', default=None, help="directory for the test databases (default: tmp)")
+    args = p.parse_args()
+    tmp = args.dir or tempfile.mkdtemp(prefix='bench_snapshots_')
+    print(f"{args.devices * args.ifaces} interfaces, {args.cycles - 1} steady-state cycles, per cycle:")
+    base = None
+    for mode in ('json', 'binary', 'on-change'):
+        path = os.path.join(tmp, f'{mode}.db')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        r = run(mode, path, args)
+        base = base or r
+        print(f"{mode:>9}: {r['rows']:8.0f} rows {r['payload_kb']:9.0f} KB payload "
+              f"{r['wal_mb']:7.1f} MB WAL ({r['wal_mb'] / base['wal_mb']:5.1%}) "
+              f"{r['ms']:7.0f} ms save+flush, db {r['db_mb']:.1f} MB", flush=True)
+
+
+if __name__ == '__main__':
+    main()
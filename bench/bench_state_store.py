@@ -0,0 +1,103 @@
+# bench_state_store.py - per-call StateStore vs batched WAL StateStore
+#
+#   python bench/bench_state_store.py --devices 200 --ifaces 40 --cycles 5
+#
+# Each cycle writes one snapshot per interface plus a few events, the way
+# the collector does. Reports rows/s and p50/p99 commit latency; a reader
+# thread keeps querying iface_state to surface "database is locked" errors.
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from state_store import StateStore  # noqa: E402
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))] if values else 0.0
+
+
+def snapshot(i, cycle):
+    return {'ts': cycle * 15, 'name': f'ether{i}', 'carrier': True, 'disabled': False,
+            'rx_bytes': cycle * 10**6 + i, 'tx_bytes': cycle * 2 * 10**6 + i,
+            'rx_errors': 0, 'tx_errors': 0, 'rx_drops': 0, 'tx_drops': 0, 'link_downs': 0,
+            'speed_mbps': 1000, 'flaps': ''}
+
+
+def run(mode, path, devices, ifaces, cycles, events_per_cycle):
+    store = StateStore(path, batched=(mode == 'batched'))
+    stop = threading.Event()
+    reads = {'ok': 0, 'locked': 0}
+
+    def reader():
+        con = store._connect()
+        while not stop.is_set():
+            try:
+                con.execute("SELECT count(*) FROM iface_state").fetchone()
+                reads['ok'] += 1
+            except sqlite3.OperationalError:
+                reads['locked'] += 1
+            time.sleep(0.005)
+        con.close()
+
+    rt = threading.Thread(target=reader, daemon=True)
+    rt.start()
+    commits, rows = [], 0
+    t_start = time.perf_counter()
+    for c in range(cycles):
+        for d in range(devices):
+            for i in range(ifaces):
+                t0 = time.perf_counter()
+                store.save_iface_snapshot(f'dev{d}', f'ether{i}', snapshot(i, c))
+                if mode == 'legacy':
+                    commits.append(time.perf_counter() - t0)
+                rows += 1
+        for e in range(events_per_cycle):
+            t0 = time.perf_counter()
+            store.append_event(f'dev{e}', 'ether1', 'state_change UP -> DOWN : {}')
+            if mode == 'legacy':
+                commits.append(time.perf_counter() - t0)
+            rows += 1
+        if mode == 'batched':
+            t0 = time.perf_counter()
+            store.flush()
+            commits.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - t_start
+    stop.set()
+    rt.join()
+    store.close()
+    return {
+        'mode': mode, 'rows': rows, 'seconds': round(elapsed, 3),
+        'rows_per_s': round(rows / elapsed, 1), 'commits': len(commits),
+        'commit_p50_ms': round(pct(commits, 50) * 1000, 3),
+        'commit_p99_ms': round(pct(commits, 99) * 1000, 3),
+        'reads_ok': reads['ok'], 'reads_locked': reads['locked'],
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="StateStore write benchmark")
+    p.add_argument('--devices', type=int, default=200)
+    p.add_argument('--ifaces', type=int, default=40)
+    p.add_argument('--cycles', type=int, default=3)
+    p.add_argument('--events', type=int, default=20, help="events per cycle")
+    p.add_argument('--dir', default=None, help="directory for the test databases (default: tmp)")
+    args = p.parse_args()
+    tmp = args.dir or tempfile.mkdtemp(prefix='bench_state_')
+    for mode in ('legacy', 'batched'):
+        path = os.path.join(tmp, f'{mode}.db')
+        if os.path.exists(path):
+            os.remove(path)
+        r = run(mode, path, args.devices, args.ifaces, args.cycles, args.events)
+        print(f"{r['mode']:>8}: {r['rows']} rows in {r['seconds']}s = {r['rows_per_s']} rows/s, "
+              f"{r['commits']} commits p50={r['commit_p50_ms']}ms p99={r['commit_p99_ms']}ms, "
+              f"reader ok={r['reads_ok']} locked={r['reads_locked']}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
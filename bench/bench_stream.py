@@ -0,0 +1,110 @@
+# bench_stream.py - event stream fan-out to many subscribers
+#
+#   python bench/bench_stream.py --subscribers 1000 --events 2000
+#
+# Connects `subscribers` SSE clients (one in ten filtered to a single
+# device), publishes `events` transitions at --rate per second and reports
+# delivery latency (publish -> client read), server thread CPU time and the
+# Python memory the server holds per connection (tracemalloc).
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import selectors
+import threading
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from event_stream import StreamServer  # noqa: E402
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))] if values else 0.0
+
+
+def main():
+    p = argparse.ArgumentParser(description="event stream fan-out benchmark")
+    p.add_argument('--subscribers', type=int, default=1000)
+    p.add_argument('--events', type=int, default=2000)
+    p.add_argument('--rate', type=float, default=200.0, help="events per second")
+    p.add_argument('--devices', type=int, default=100)
+    args = p.parse_args()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    tracemalloc.start()
+    server = StreamServer(port=0, addr='127.0.0.1', keepalive=60).start()
+    base = tracemalloc.take_snapshot()
+    sel = selectors.DefaultSelector()
+    clients = []
+    for i in range(args.subscribers):
+        s = socket.create_connection(('127.0.0.1', server.port))
+        query = '?device=dev0' if i % 10 == 0 else ''
+        s.sendall(f"GET /api/v1/stream{query} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+        s.setblocking(False)
+        clients.append(s)
+        sel.register(s, selectors.EVENT_READ, [b'', 0])
+    while server.subscribers() < args.subscribers:
+        time.sleep(0.01)
+    held = tracemalloc.take_snapshot().compare_to(base, 'filename')
+    per_conn = sum(d.size_diff for d in held if 'event_stream' in d.traceback[0].filename) / args.subscribers
+    tracemalloc.stop()
+
+    latencies = []
+    expected = sum(args.events if i % 10 else (args.events + args.devices - 1) // args.devices
+                   for i in range(args.subscribers))
+    received = [0]
+    done = threading.Event()
+
+    def reader():
+        while received[0] < expected:
+            for key, _ in sel.select(timeout=5):
+                try:
+                    data = key.fileobj.recv(1 << 16)
+                except BlockingIOError:
+                    continue
+                now = time.perf_counter()
+                buf = key.data[0] + data
+                *frames, key.data[0] = buf.split(b'\n\n')
+                ours = [f for f in frames if b'event: transition' in f]
+                if ours:
+                    # one latency sample per read: the newest frame it contained
+                    last = ours[-1]
+                    latencies.append(now - json.loads(last[last.find(b'data: ') + 6:])['t'])
+                    received[0] += len(ours)
+            if not sel.get_map():
+                break
+        done.set()
+
+    t_reader = threading.Thread(target=reader, daemon=True)
+    t_reader.start()
+    cpu0 = time.thread_time()
+    t0 = time.perf_counter()
+    for k in range(args.events):
+        target = t0 + k / args.rate
+        delay = target - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        dev = f'dev{k % args.devices}'
+        server.buffer.publish('transition', {'device': dev, 'iface': 'ether1', 'state': 'DOWN',
+                                             't': time.perf_counter()}, dev, 'DOWN')
+    done.wait(60)
+    elapsed = time.perf_counter() - t0
+    print(f"{args.subscribers} subscribers, {args.events} events at {args.rate:.0f}/s: "
+          f"delivered {received[0]}/{expected} in {elapsed:.1f}s")
+    print(f"latency p50={pct(latencies, 50) * 1000:.2f}ms p99={pct(latencies, 99) * 1000:.2f}ms "
+          f"max={max(latencies) * 1000:.2f}ms")
+    print(f"server memory per connection: {per_conn / 1024:.2f} KiB (Python objects, excluding kernel buffers)")
+    print(f"publisher thread cpu: {(time.thread_time() - cpu0) * 1000:.0f}ms, "
+          f"subscribers still connected: {server.subscribers()}")
+    for s in clients:
+        s.close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# bench_summary.py - fleet summary at 100k interfaces
+#
+#   python bench/bench_summary.py --devices 2500 --ifaces 40
+#
+# Compares the old way of answering "how many interfaces are DOWN per
+# device" (read every iface_state row and parse its JSON) with the
+# incrementally kept FleetSummary: cost of one device update, of
+# rendering the whole summary, and of GET /api/v1/summary.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from state_store import StateStore  # noqa: E402
+from fleet_summary import FleetSummary  # noqa: E402
+
+STATES = ('UP',) * 17 + ('DOWN', 'DEGRADED', 'ADMIN_DOWN')
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return out, times[len(times) // 2] * 1000, times[-1] * 1000
+
+
+def main():
+    p = argparse.ArgumentParser(description="fleet summary benchmark")
+    p.add_argument('--devices', type=int, default=2500)
+    p.add_argument('--ifaces', type=int, default=40)
+    p.add_argument('--repeat', type=int, default=20)
+    args = p.parse_args()
+    rnd = random.Random(1)
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_summary_'), 'state.db')
+    store = StateStore(path, batched=True)
+    summary = FleetSummary()
+    fleet = {}
+    now = int(time.time())
+    for d in range(args.devices):
+        rows = []
+        for i in range(args.ifaces):
+            state = rnd.choice(STATES)
+            rates = (rnd.random() * 1e9, rnd.random() * 1e9, rnd.random() * 5, 0.0)
+            rows.append((f'ether{i}', state, rates, 1000))
+            store.save_iface_snapshot(f'dev{d}', f'ether{i}', {'ts': now, 'state': state, 'reason': None,
+                                                               'rx_bytes': 10**9, 'tx_bytes': 10**9,
+                                                               'speed_mbps': 1000, 'flaps': ''})
+        fleet[f'dev{d}'] = rows
+        summary.update_device(f'dev{d}', rows)
+    store.flush()
+    n = args.devices * args.ifaces
+    print(f"{n} interfaces on {args.devices} devices")
+
+    def old_way():
+        counts = {}
+        for device, _, payload in store.load_all_snapshots():
+            c = counts.setdefault(device, {})
+            c[payload['state']] = c.get(payload['state'], 0) + 1
+        return counts
+
+    _, p50, mx = timed(old_way, 3)
+    print(f"{'old: parse all snapshots':>28}: p50={p50:.1f}ms max={mx:.1f}ms")
+    _, p50, mx = timed(lambda: summary.update_device('dev7', fleet['dev7']), args.repeat * 10)
+    print(f"{'update one device':>28}: p50={p50:.3f}ms max={mx:.3f}ms")
+
+    def render():
+        summary.update_device('dev7', fleet['dev7'])  # force a re-render
+        return summary.render()[1]
+
+    body, p50, mx = timed(render, args.repeat)
+    print(f"{'render (once per second)':>28}: p50={p50:.1f}ms max={mx:.1f}ms, {len(body) / 1024:.0f} KiB")
+    store.save_summary('collector', now, body)
+
+    os.environ['STATE_DB_PATH'] = path
+    os.environ['HISTORY_DB_PATH'] = os.path.join(os.path.dirname(path), 'history.db')
+    os.environ.pop('API_KEY', None)
+    import api_server
+    client = api_server.app.test_client()
+    resp, p50, mx = timed(lambda: client.get('/api/v1/summary'), args.repeat)
+    assert json.loads(resp.data)['interfaces'] == n
+    print(f"{'GET /api/v1/summary':>28}: p50={p50:.2f}ms max={mx:.2f}ms")
+    etag = resp.headers['ETag']
+    resp, p50, mx = timed(lambda: client.get('/api/v1/summary', headers={'If-None-Match': etag}), args.repeat)
+    print(f"{'GET /api/v1/summary 304':>28}: status={resp.status_code} p50={p50:.2f}ms max={mx:.2f}ms")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
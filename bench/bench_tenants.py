@@ -0,0 +1,129 @@
+# bench_tenants.py - tenant-scoped event queries with one dominant tenant
+#
+#   python bench/bench_tenants.py --events 5000000
+#
+# Loads `events` rows into the SaaS events table, 90% of them owned by one
+# tenant and the rest spread over --tenants small ones, then times the
+# queries behind /api/v1/tenants/<id>/events for the big and a small tenant,
+# first with the original scaffold index only (tenant_id, device, ts) and
+# then with the tenant_store indexes. Also times batched ingestion through
+# TenantStore against one commit per event.
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tenant_store import TenantStore, ensure_schema, select_events  # noqa: E402
+
+OLD_INDEX = 'CREATE INDEX IF NOT EXISTS events_tenant_device_ts ON events(tenant_id, device, ts)'
+
+
+def load(path, n, tenants, devices, ifaces, span):
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA journal_mode=WAL")
+    ensure_schema(con)
+    for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='events'"
+                               " AND sql IS NOT NULL").fetchall():
+        con.execute(f"DROP INDEX {name}")
+    con.executemany("INSERT INTO tenants(name) VALUES (?)", [(f't{i}',) for i in range(1, tenants + 1)])
+    rnd = random.Random(1)
+    start = int(time.time()) - span
+    chunk = 200000
+    for base in range(0, n, chunk):
+        rows = []
+        for k in range(base, min(n, base + chunk)):
+            tid = 1 if rnd.random() < 0.9 else rnd.randrange(2, tenants + 1)
+            rows.append((tid, f'dev{tid}-{rnd.randrange(devices)}', f'ether{rnd.randrange(ifaces)}',
+                         start + k * span // n, 'state_change UP -> DOWN : {}'))
+        con.executemany("INSERT INTO events(tenant_id, device, iface, ts, event) VALUES (?,?,?,?,?)", rows)
+        con.commit()
+    con.execute(OLD_INDEX)
+    con.execute("ANALYZE")
+    con.commit()
+    return con
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return times[len(times) // 2] * 1000, times[-1] * 1000
+
+
+def run_cases(con, args):
+    now = int(time.time())
+    for tid, label in ((1, 'big'), (2, 'small')):
+        dev = con.execute("SELECT device FROM events WHERE tenant_id=? LIMIT 1", (tid,)).fetchone()[0]
+        row = select_events(con, tid, limit=1)[0]
+        cases = (
+            ('latest 200', lambda: select_events(con, tid, limit=200)),
+            ('last day', lambda: select_events(con, tid, since=now - 86400, limit=200)),
+            ('device', lambda: select_events(con, tid, device=dev, limit=200)),
+            ('device+iface', lambda: select_events(con, tid, device=dev, iface='ether1', limit=200)),
+            ('next page', lambda: select_events(con, tid, before=(row[3], row[0]), limit=200)),
+        )
+        for name, fn in cases:
+            med, worst = timed(fn, args.repeat)
+            print(f"  {label:5} {name:14} median {med:8.2f} ms   max {worst:8.2f} ms", flush=True)
+
+
+def bench_ingest(directory, n):
+    path = os.path.join(directory, 'ingest.db')
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    ensure_schema(con)
+    t0 = time.perf_counter()
+    for i in range(n):
+        con.execute("INSERT INTO events(tenant_id, device, iface, ts, event) VALUES (1, 'R1', 'ether1', ?, 'x')",
+                    (i,))
+        con.commit()
+    single = time.perf_counter() - t0
+    con.close()
+    store = TenantStore(path, rate=1e9, burst=10 ** 9)
+    t0 = time.perf_counter()
+    for i in range(n):
+        store.append('t1', 'R1', 'ether1', 'x', ts=i + 1)
+    store.flush()
+    batched = time.perf_counter() - t0
+    store.close()
+    print(f"ingest {n} events: one commit each {n / single:,.0f}/s, TenantStore batched {n / batched:,.0f}/s")
+
+
+def main():
+    p = argparse.ArgumentParser(description="tenant query benchmark")
+    p.add_argument('--events', type=int, default=5_000_000)
+    p.add_argument('--tenants', type=int, default=50)
+    p.add_argument('--devices', type=int, default=200, help="devices per tenant")
+    p.add_argument('--ifaces', type=int, default=24)
+    p.add_argument('--ingest', type=int, default=20000)
+    p.add_argument('--repeat', type=int, default=20)
+    p.add_argument('--dir', default=None, help="directory for the test databases (default: tmp)")
+    args = p.parse_args()
+    directory = args.dir or tempfile.mkdtemp(prefix='bench_tenants_')
+    path = os.path.join(directory, 'saas.db')
+    span = 365 * 86400
+    t0 = time.perf_counter()
+    con = load(path, args.events, args.tenants, args.devices, args.ifaces, span)
+    print(f"events: {args.events} rows (90% tenant 1), loaded in {time.perf_counter() - t0:.1f}s", flush=True)
+    print("scaffold index (tenant_id, device, ts):")
+    run_cases(con, args)
+    t0 = time.perf_counter()
+    ensure_schema(con)
+    con.execute("ANALYZE")
+    con.commit()
+    print(f"tenant_store indexes (built in {time.perf_counter() - t0:.1f}s):")
+    run_cases(con, args)
+    con.close()
+    bench_ingest(directory, args.ingest)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# routeros_sim.py - asyncio RouterOS API simulator for benchmarks
+#
+# One listening port serves a whole simulated fleet: the login name picks
+# the device, so `user` in each device config doubles as its identity.
+# Counters are a function of time since start, so every poll sees traffic;
+# --wrap, --flap and --errors make some interfaces wrap 32-bit counters,
+# flap or have error bursts, --hang drops replies so polls time out.
+#
+#   python bench/routeros_sim.py --port 0 --ifaces 8 --latency 0.02 --jitter 0.01 --flap 0.01
+import os
+import sys
+import time
+import zlib
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collector_async import encode_sentence, read_sentence, parse_reply  # noqa: E402
+
+
+WRAP = 2 ** 32
+
+
+class RouterOsSimulator:
+    """Simulated fleet. Per-interface behaviour is picked by a hash of
+    (seed, device, iface), so a run is reproducible: `flap` of the
+    interfaces go down for `flap_down` seconds every `flap_period`, `errors`
+    of them count 100 errors/s for 10 s every minute, and with `wrap`
+    byte counters are 32-bit and start just below the wrap. Every command
+    waits latency + uniform(0, jitter); `hang` is the chance a command is
+    never answered (the connection then stays silent until closed)."""
+
+    def __init__(self, ifaces=8, latency=0.0, jitter=0.0, hang=0.0, wrap=False, flap=0.0, errors=0.0,
+                 flap_period=30, flap_down=3, seed=1):
+        self.ifaces = ifaces
+        self.latency = latency
+        self.jitter = jitter
+        self.hang = hang
+        self.wrap = wrap
+        self.flap = flap
+        self.errors = errors
+        self.flap_period = flap_period
+        self.flap_down = flap_down
+        self.seed = seed
+        self.start = time.time()
+        self.connections = 0
+        self.commands = 0
+        self.hung = 0
+        self._rnd = random.Random(seed)
+        self._traits = {}
+
+    def _trait(self, device, i):
+        t = self._traits.get((device, i))
+        if t is None:
+            h = zlib.crc32(f'{self.seed}/{device}/{i}'.encode())
+            u = (h & 0xffff) / 0x10000
+            t = self._traits[(device, i)] = (
+                1e6 * (1 + h % 100) / 8,                        # bytes/s
+                u < self.flap,                                  # flaps
+                self.flap <= u < self.flap + self.errors,       # error bursts
+                (h >> 16) % self.flap_period,                   # phase
+            )
+        return t
+
+    def interface_rows(self, device, now=None):
+        t = (now or time.time()) - self.start
+        rows = []
+        for i in range(1, self.ifaces + 1):
+            rate, flaps, bursts, phase = self._trait(device, i)
+            rx, tx = int(rate * t), int(rate * t / 2)
+            if self.wrap:
+                rx, tx = (WRAP - 10 ** 8 + rx) % WRAP, (WRAP - 10 ** 8 + tx) % WRAP
+            running, downs, errs = 'true', 0, 0
+            if flaps:
+                cycles, pos = divmod(t + phase, self.flap_period)
+                downs = int(cycles)
+                running = 'false' if pos < self.flap_down else 'true'
+            if bursts:
+                minutes, pos = divmod(t + phase, 60)
+                errs = int(minutes) * 1000 + int(min(pos, 10) * 100)
+            rows.append({
+                'name': f'ether{i}', 'running': running, 'disabled': 'false',
+                'rx-byte': str(rx), 'tx-byte': str(tx),
+                'rx-error': str(errs), 'tx-error': '0', 'rx-drop': '0', 'tx-drop': '0',
+                'link-downs': str(downs),
+            })
+        return rows
+
+    def ethernet_rows(self, device):
+        return [{'name': f'ether{i}', 'speed': '1Gbps'} for i in range(1, self.ifaces + 1)]
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        device = None
+        try:
+            while True:
+                words = await read_sentence(reader)
+                cmd = words[0].decode()
+                _, attrs, tag = parse_reply(words)
+                tail = [f'.tag={tag}'] if tag is not None else []
+                self.commands += 1
+                if self.latency or self.jitter:
+                    await asyncio.sleep(self.latency + self._rnd.random() * self.jitter)
+                if self.hang and device is not None and self._rnd.random() < self.hang:
+                    self.hung += 1
+                    while await reader.read(4096):
+                        pass
+                    break
+                if cmd == '/login':
+                    device = attrs.get('name')
+                    writer.write(encode_sentence(['!done'] + tail))
+                    continue
+                if device is None:
+                    writer.write(encode_sentence(['!fatal', 'not logged in']))
+                    break
+                if cmd == '/interface/print':
+                    rows = self.interface_rows(device)
+                elif cmd == '/interface/ethernet/print':
+                    rows = self.ethernet_rows(device)
+                elif cmd == '/system/identity/print':
+                    rows = [{'name': device}]
+                else:
+                    writer.write(encode_sentence(['!trap', '=message=no such command'] + tail))
+                    writer.write(encode_sentence(['!done'] + tail))
+                    continue
+                keys = attrs.get('.proplist')
+                keys = keys.split(',') if keys else None
+                out = bytearray()
+                for row in rows:
+                    items = row.items() if keys is None else ((k, row[k]) for k in keys if k in row)
+                    out += encode_sentence(['!re'] + [f'={k}={v}' for k, v in items] + tail)
+                out += encode_sentence(['!done'] + tail)
+                writer.write(bytes(out))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=0, ready=None):
+        server = await asyncio.start_server(self.handle, host, port, backlog=4096)
+        port = server.sockets[0].getsockname()[1]
+        if ready is not None:
+            ready(port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    p = argparse.ArgumentParser(description="RouterOS API fleet simulator")
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=0)
+    p.add_argument('--ifaces', type=int, default=8, help="interfaces per device")
+    p.add_argument('--latency', type=float, default=0.0, help="seconds added to every command")
+    p.add_argument('--jitter', type=float, default=0.0, help="extra random 0..jitter seconds per command")
+    p.add_argument('--hang', type=float, default=0.0, help="fraction of commands never answered")
+    p.add_argument('--wrap', action='store_true', help="32-bit byte counters starting near the wrap")
+    p.add_argument('--flap', type=float, default=0.0, help="fraction of interfaces that flap")
+    p.add_argument('--flap-period', type=int, default=30)
+    p.add_argument('--errors', type=float, default=0.0, help="fraction of interfaces with error bursts")
+    p.add_argument('--seed', type=int, default=1)
+    args = p.parse_args()
+    sim = RouterOsSimulator(ifaces=args.ifaces, latency=args.latency, jitter=args.jitter, hang=args.hang,
+                            wrap=args.wrap, flap=args.flap, errors=args.errors, flap_period=args.flap_period,
+                            seed=args.seed)
+    try:
+        asyncio.run(sim.serve(args.host, args.port, ready=lambda port: print(port, flush=True)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,11 @@
 # classifier.py
+import re
+from collections import namedtuple
+from functools import lru_cache
 from datetime import datetime, timezone
 
+from flap_tracker import downs_within
+
 # thresholds come from config or defaults
 DEFAULTS = {
     "err_per_sec": 1.0,
@@ -31,17 +36,25 @@ def compute_deltas(prev, cur, interval_seconds):
     deltas['err_rate'] = (deltas['rx_errors'] + deltas['tx_errors']) / max(1, interval_seconds)
     return deltas
 
+_SPEED_RE = re.compile(r'^\s*([0-9]+(?:\.[0-9]+)?)\s*([gm]?)\s*$')
+
 def _parse_speed_to_mbps(speed_str):
     """Robust speed parser: '1Gbps','2.5Gbps','1000Mbps','10G','100M' -> Mbps (int).
     Returns 0 if unknown.
     """
     if not speed_str:
         return 0
-    s = str(speed_str).strip().lower().replace('bps','').replace('b/s','')
+    if isinstance(speed_str, int):
+        return speed_str
+    return _parse_speed_str(str(speed_str))
+
+@lru_cache(maxsize=256)
+def _parse_speed_str(speed_str):
+    # a fleet only reports a handful of distinct speed strings
+    s = speed_str.strip().lower().replace('bps','').replace('b/s','')
     s = s.replace('mbit','m').replace('gbit','g')
     # Extract number and unit
-    import re
-    m = re.match(r'^\s*([0-9]+(?:\.[0-9]+)?)\s*([gm]?)\s*$', s)
+    m = _SPEED_RE.match(s)
     if not m:
         return 0
     val = float(m.group(1))
@@ -69,22 +82,20 @@ def classify_interface(cur_snapshot, prev_snapshot, thresholds):
     # compute error rate
     err_rate = 0.0
     if prev_snapshot:
-        dt = max(1, cur_snapshot.get('ts',0) - prev_snapshot.get('ts',0))
+        dt = max(1, cur_snapshot.get('ts',0) - prev_snapshot.get('counters_ts', prev_snapshot.get('ts',0)))
         deltas = compute_deltas(prev_snapshot, cur_snapshot, dt)
         err_rate = deltas.get('err_rate', 0.0)
-        # windowed flapping: we use downs_ts list within cur_snapshot
-        downs_ts = list(cur_snapshot.get('downs_ts') or [])
+        # windowed flapping: downs recorded in the cur_snapshot flap tracker
+        # ('flaps', or a legacy 'downs_ts' list) within the window
         now = cur_snapshot.get('ts', 0)
         window = int(t.get('flaps_window', 300))
-        # purge old
-        downs_ts = [x for x in downs_ts if now - x <= window]
+        flaps = cur_snapshot.get('flaps', cur_snapshot.get('downs_ts'))
+        downs = downs_within(flaps, now, window)
         # If link_downs increased this interval, add events now
         ld_cur = int(cur_snapshot.get('link_downs', 0) or 0)
         ld_prev = int(prev_snapshot.get('link_downs', 0) or 0)
         inc = max(0, ld_cur - ld_prev)
-        if inc:
-            downs_ts.extend([now]*inc)
-        flap_detected = len(downs_ts) >= int(t.get('flaps_count', 3))
+        flap_detected = downs + inc >= int(t.get('flaps_count', 3))
     else:
         flap_detected = False
 
@@ -106,3 +117,125 @@ def classify_interface(cur_snapshot, prev_snapshot, thresholds):
 
     # else OK
     return "UP", {"reason":"carrier OK", "err_rate": err_rate}
+
+# reasons that come from the link fields alone (no counters needed)
+LINK_REASONS = ('admin disabled', 'no carrier')
+
+BatchResult = namedtuple('BatchResult', 'states infos rx_bps tx_bps err_rate drop_rate')
+
+CUR_COLUMNS = ('ts', 'carrier', 'disabled', 'rx_bytes', 'tx_bytes', 'rx_errors', 'tx_errors',
+               'rx_drops', 'tx_drops', 'link_downs', 'speed_mbps', 'expected_speed_mbps', 'flaps')
+PREV_COLUMNS = ('ts', 'rx_bytes', 'tx_bytes', 'rx_errors', 'tx_errors', 'rx_drops', 'tx_drops', 'link_downs')
+
+def to_columns(snapshots, prevs=None):
+    """Turn snapshot dicts (and their prev snapshots, None when unknown) into
+    the column dicts classify_batch takes."""
+    cur = {k: [] for k in CUR_COLUMNS}
+    for s in snapshots:
+        cur['ts'].append(s.get('ts', 0))
+        cur['carrier'].append(s.get('carrier', True))
+        cur['disabled'].append(s.get('disabled'))
+        for k in ('rx_bytes', 'tx_bytes', 'rx_errors', 'tx_errors', 'rx_drops', 'tx_drops', 'link_downs'):
+            cur[k].append(int(s.get(k, 0) or 0))
+        cur['speed_mbps'].append(s.get('speed_mbps'))
+        cur['expected_speed_mbps'].append(s.get('expected_speed_mbps'))
+        cur['flaps'].append(s.get('flaps', s.get('downs_ts')))
+    prev = None
+    if prevs is not None:
+        prev = {k: [] for k in PREV_COLUMNS}
+        prev['present'] = []
+        for p in prevs:
+            prev['present'].append(bool(p))
+            p = p or {}
+            # link updates carry counters read earlier than their ts
+            prev['ts'].append(p.get('counters_ts', p.get('ts', 0)))
+            for k in PREV_COLUMNS[1:]:
+                prev[k].append(int(p.get(k, 0) or 0))
+    return cur, prev
+
+def classify_batch(cur, prev, thresholds, max_counter=None):
+    """Classify a whole batch of interfaces given as columns.
+
+    `cur` maps each name in CUR_COLUMNS to a list (one entry per interface);
+    `prev` maps PREV_COLUMNS plus 'present' (False where there is no previous
+    snapshot) to lists, or is None. 'flaps' entries may be FlapTracker
+    objects, their text form or legacy downs_ts lists. Results match classify_interface row by
+    row; rates (rx/tx bps, errors/s, drops/s) are None where there is no prev.
+    Thresholds are resolved once and counter deltas use _counter_delta's
+    wrap rule, so this is the one pass the collector needs per batch.
+    """
+    t = DEFAULTS.copy()
+    t.update(thresholds or {})
+    err_limit = float(t['err_per_sec'])
+    window = int(t.get('flaps_window', 300))
+    flaps_count = int(t.get('flaps_count', 3))
+    n = len(cur['ts'])
+    if prev is None:
+        prev = {'present': [False] * n}
+        for k in PREV_COLUMNS:
+            prev[k] = [0] * n
+
+    def delta(p, c):
+        d = c - p
+        if d < 0:
+            if not max_counter:
+                return 0
+            d = (max_counter - p) + c + 1
+        return d if d > 0 else 0
+
+    states, infos = [], []
+    rx_bps, tx_bps, err_out, drop_out = [], [], [], []
+    for (ts, carrier, disabled, rxb, txb, rxe, txe, rxd, txd, ld, speed, expected, downs,
+         has_prev, pts, prxb, ptxb, prxe, ptxe, prxd, ptxd, pld) in zip(
+            cur['ts'], cur['carrier'], cur['disabled'], cur['rx_bytes'], cur['tx_bytes'],
+            cur['rx_errors'], cur['tx_errors'], cur['rx_drops'], cur['tx_drops'], cur['link_downs'],
+            cur['speed_mbps'], cur['expected_speed_mbps'], cur['flaps'],
+            prev['present'], prev['ts'], prev['rx_bytes'], prev['tx_bytes'], prev['rx_errors'],
+            prev['tx_errors'], prev['rx_drops'], prev['tx_drops'], prev['link_downs']):
+        if has_prev:
+            dt = ts - pts
+            if dt < 1:
+                dt = 1
+            err_rate = (delta(prxe, rxe) + delta(ptxe, txe)) / dt
+            rx_bps.append(delta(prxb, rxb) * 8 / dt)
+            tx_bps.append(delta(ptxb, txb) * 8 / dt)
+            err_out.append(err_rate)
+            drop_out.append((delta(prxd, rxd) + delta(ptxd, txd)) / dt)
+        else:
+            err_rate = 0.0
+            rx_bps.append(None)
+            tx_bps.append(None)
+            err_out.append(None)
+            drop_out.append(None)
+
+        if disabled:
+            states.append("ADMIN_DOWN")
+            infos.append({"reason": "admin disabled"})
+            continue
+        if not carrier:
+            states.append("DOWN")
+            infos.append({"reason": "no carrier"})
+            continue
+        if has_prev:
+            flaps = ld - pld if ld > pld else 0
+            if downs:
+                flaps += downs_within(downs, ts, window)
+            if flaps >= flaps_count:
+                states.append("DOWN")
+                infos.append({"reason": "flapping", "err_rate": err_rate})
+                continue
+        if err_rate > err_limit:
+            states.append("DOWN")
+            infos.append({"reason": f"high_error_rate {err_rate:.2f}/s", "err_rate": err_rate})
+            continue
+        if expected:
+            if isinstance(speed, str):
+                speed = _parse_speed_to_mbps(speed)
+            speed = int(speed or 0)
+            if speed and int(expected) != speed:
+                states.append("DEGRADED")
+                infos.append({"reason": f"speed_mismatch {speed} != expected {expected}"})
+                continue
+        states.append("UP")
+        infos.append({"reason": "carrier OK", "err_rate": err_rate})
+    return BatchResult(states, infos, rx_bps, tx_bps, err_out, drop_out)
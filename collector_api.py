@@ -2,179 +2,580 @@
 import time
 import json
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+from functools import partial
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from routeros_api import RouterOsApiPool
-from state_store import StateStore
-from classifier import classify_interface
+from state_store import StateStore, StateCache
+from pipeline import Pipeline, STAGE_SECONDS
+from scheduler import PollScheduler
+from inventory import DeviceInventory
+from sharding import ShardMembership
+from event_stream import StreamServer
+from fleet_summary import FleetSummary
+from event_retention import EventRetention
+from tenant_store import TenantStore
+from link_listener import LinkListener
+from instrumentation import Instrumentation
+from history_store import HistoryStore
+from connection_pool import ConnectionManager, CONNECTION_ERRORS, DeviceBackoff, device_params, count_calls
+from classifier import classify_batch, to_columns, _parse_speed_to_mbps, LINK_REASONS
+from flap_tracker import FlapTracker
 from alerter import alert_for_event, alert_for_event_extended
-from prometheus_client import start_http_server, Gauge
+from alert_dispatch import AlertDispatcher
+from correlator import IncidentCorrelator
+from prometheus_client import Gauge
+import exporter
 
 log = logging.getLogger("collector")
 
 # Prometheus metrics
-IF_UP = Gauge('noc_interface_up', '1 if interface is up (UP), 0 otherwise', ['device','iface','state'])
-IF_RX_BPS = Gauge('noc_interface_rx_bps', 'Interface rx bits/sec', ['device','iface'])
-IF_TX_BPS = Gauge('noc_interface_tx_bps', 'Interface tx bits/sec', ['device', 'iface'])
-IF_ERR_RATE = Gauge('noc_interface_err_per_sec', 'Interface errors per second', ['device','iface'])
-
-def _parse_speed_to_mbps(speed):
-    # Keep in sync with classifier
-    if isinstance(speed, int):
-        return speed
-    from classifier import _parse_speed_to_mbps as _p
-    return _p(speed)
-
-def poll_device(dev_cfg):
-    """Return dict: { 'device': name, 'ifaces': {iface: snapshot, ...} }"""
-    name = dev_cfg['name']
-    host = dev_cfg['host']
-    user = dev_cfg['user']
-    password = dev_cfg['password']
-    port = dev_cfg.get('port', 8728)
+# (per-interface series live in exporter.TABLE, rendered at scrape time)
+DEVICE_API_CALLS = Gauge('noc_device_api_calls_per_poll', 'RouterOS API round-trips used by the last poll', ['device'])
+
+shutdown_event = threading.Event()
+
+# classify output for a LinkListener update; persisted like a poll result
+# but not tied to a scheduled poll
+LinkUpdate = namedtuple('LinkUpdate', 'device records')
+
+# Only the properties the snapshot needs; keeps each reply small on big routers
+IFACE_PROPLIST = 'name,disabled,running,rx-byte,tx-byte,rx-error,tx-error,rx-drop,tx-drop,link-downs'
+ETH_PROPLIST = 'name,speed'
+
+def build_snapshots(dev_cfg, iface_rows, eth_rows, now):
+    """Join `/interface` and `/interface/ethernet` rows by name into snapshots."""
     expected_speed = dev_cfg.get('expected_speed_mbps')
     disabled_if = set(dev_cfg.get('disabled_ifaces', []) or [])
+    speeds = {e.get('name'): e.get('speed') for e in eth_rows}
 
-    # try to create API connection with small retry
-    api_pool = None
-    for _retry in range(2):
-        try:
-            api_pool = RouterOsApiPool(host, username=user, password=password, port=port, plaintext_login=True)
-            break
-        except Exception as _e:
-            log.warning("RouterOS API pool creation failed for %s: %s - retrying", host, _e)
-            time.sleep(0.5)
-    if not api_pool:
-        log.error("Could not create RouterOS API pool for %s", host)
-        raise
-    api = api_pool.get_api()
+    ifaces = {}
+    for i in iface_rows:
+        ifname = i.get('name')
+        if not ifname or ifname in disabled_if:
+            continue
+        # Basic fields
+        snap = {
+            'ts': now,
+            'name': ifname,
+            'disabled': i.get('disabled', 'false') in ('true', True),
+            'carrier': i.get('running', 'false') in ('true', True),
+            'rx_bytes': int(i.get('rx-byte', 0) or 0),
+            'tx_bytes': int(i.get('tx-byte', 0) or 0),
+            'rx_errors': int(i.get('rx-error', 0) or 0),
+            'tx_errors': int(i.get('tx-error', 0) or 0),
+            'rx_drops': int(i.get('rx-drop', 0) or 0),
+            'tx_drops': int(i.get('tx-drop', 0) or 0),
+            'link_downs': int(i.get('link-downs', 0) or 0),
+        }
+        # Ethernet-specific
+        if ifname in speeds:
+            snap['speed_mbps'] = _parse_speed_to_mbps(speeds[ifname])
+        if expected_speed:
+            snap['expected_speed_mbps'] = int(expected_speed)
+        ifaces[ifname] = snap
+    return ifaces
+
+def _poll_api(api, dev_cfg):
+    """Two round-trips per device regardless of port count."""
+    name = dev_cfg['name']
+    counter = count_calls(api)
+    calls_before = counter.calls
+    iface_rows = api.get_resource('/interface').call('print', {'.proplist': IFACE_PROPLIST})
     try:
-        # Fetch interfaces
-        iface_res = api.get_resource('/interface')
-        eth_res = api.get_resource('/interface/ethernet')
-
-        ifaces = {}
-        now = int(time.time())
-        for i in iface_res.get():
-            ifname = i.get('name')
-            if not ifname or ifname in disabled_if:
-                continue
-            # Basic fields
-            snap = {
-                'ts': now,
-                'name': ifname,
-                'disabled': i.get('disabled', 'false') in ('true', True),
-                'carrier': i.get('running', 'false') in ('true', True),
-                'rx_bytes': int(i.get('rx-byte', 0) or 0),
-                'tx_bytes': int(i.get('tx-byte', 0) or 0),
-                'rx_errors': int(i.get('rx-error', 0) or 0),
-                'tx_errors': int(i.get('tx-error', 0) or 0),
-                'rx_drops': int(i.get('rx-drop', 0) or 0),
-                'tx_drops': int(i.get('tx-drop', 0) or 0),
-                'link_downs': int(i.get('link-downs', 0) or 0),
-            }
-            # Ethernet-specific
+        eth_rows = api.get_resource('/interface/ethernet').call('print', {'.proplist': ETH_PROPLIST})
+    except CONNECTION_ERRORS:
+        raise
+    except Exception as e:
+        # devices without ethernet ports (CHR, LTE) reject the menu
+        log.debug("%s: /interface/ethernet unavailable: %s", name, e)
+        eth_rows = []
+    DEVICE_API_CALLS.labels(device=name).set(counter.calls - calls_before)
+    return {'device': name, 'ifaces': build_snapshots(dev_cfg, iface_rows, eth_rows, int(time.time()))}
+
+def poll_device(dev_cfg, connections=None):
+    """Return dict: { 'device': name, 'ifaces': {iface: snapshot, ...} }
+
+    With a ConnectionManager the device session is kept open between polls;
+    a reused session that turns out to be dead is replaced once and retried.
+    Without one, a session is opened and closed for this poll only.
+    """
+    if connections is None:
+        p = device_params(dev_cfg)
+        api_pool = RouterOsApiPool(p['host'], username=p['user'], password=p['password'], port=p['port'], plaintext_login=True)
+        try:
+            return _poll_api(api_pool.get_api(), dev_cfg)
+        finally:
             try:
-                e = eth_res.get(**{'name': ifname})
-                if e:
-                    e = e[0]
-                    snap['speed_mbps'] = _parse_speed_to_mbps(e.get('speed'))
+                api_pool.disconnect()
             except Exception:
                 pass
-            if expected_speed:
-                snap['expected_speed_mbps'] = int(expected_speed)
-            ifaces[ifname] = snap
-        return {'device': name, 'ifaces': ifaces}
-    finally:
+
+    for attempt in (1, 2):
+        sess = None
+        try:
+            with connections.session(dev_cfg) as sess:
+                return _poll_api(sess.api, dev_cfg)
+        except CONNECTION_ERRORS as e:
+            if attempt == 2 or sess is None or not sess.reused:
+                raise
+            log.info("stale RouterOS session for %s (%s), reconnecting", sess.key, e)
+
+def classify_result(r, db, thresholds, summary=None, timer=None):
+    """Classify stage: classify every interface of one device result in one
+    batch and export its metrics (and update `summary`, a FleetSummary).
+    `timer` (an instrumentation.CycleTimer) gets the classify and export
+    laps. Returns (device, records) for the persist stage."""
+    device_name = r['device']
+    ifaces = r.get('ifaces') or {}
+    names = list(ifaces)
+    curs = [ifaces[n] for n in names]
+    prevs = [db.get_last_state(device_name, n) for n in names]
+    trackers = []
+    for cur, prev in zip(curs, prevs):
+        # flap ring carried from the previous snapshot (legacy downs_ts converted)
+        flaps = FlapTracker.from_snapshot(prev)
+        if prev:
+            inc = max(0, int(cur.get('link_downs',0)) - int(prev.get('link_downs',0)))
+            flaps.record(cur['ts'], inc)
+        cur['flaps'] = flaps.to_text()
+        trackers.append(flaps)
+
+    cur_cols, prev_cols = to_columns(curs, prevs)
+    cur_cols['flaps'] = trackers  # already decoded
+    res = classify_batch(cur_cols, prev_cols, thresholds)
+    # transitions compare against the state stored with the prev snapshot;
+    # snapshots saved before states were persisted are classified once here
+    legacy = [p for p in prevs if p and 'state' not in p]
+    legacy_states = iter(classify_batch(*to_columns(legacy), thresholds).states if legacy else ())
+
+    records = []
+    metrics = []
+    for k, (ifname, cur, prev) in enumerate(zip(names, curs, prevs)):
+        state = res.states[k]
+        rates = (res.rx_bps[k], res.tx_bps[k], res.err_rate[k], res.drop_rate[k]) if prev else None
+        if not prev:
+            prev_state = None
+        elif 'state' in prev:
+            prev_state = prev['state']
+        else:
+            prev_state = next(legacy_states)
+        cur['state'] = state
+        cur['reason'] = res.infos[k].get('reason')
+        if prev_state == state and prev.get('state_since'):
+            cur['state_since'] = prev['state_since']
+        else:
+            cur['state_since'] = cur['ts']
+        db.remember(device_name, ifname, cur)
+        records.append((ifname, cur, prev_state, state, res.infos[k], rates))
+        metrics.append((ifname, state, rates))
+    if timer is not None:
+        timer.lap('classify')
+    # replaces the device's series, so interfaces that are gone stop being exported
+    exporter.TABLE.update_device(device_name, metrics)
+    if summary is not None:
+        summary.update_device(device_name, [(m[0], m[1], m[2], c.get('speed_mbps')) for m, c in zip(metrics, curs)])
+    gone = db.retain(device_name, names)
+    if gone:
+        log.info("%s: interfaces no longer reported: %s", device_name, ", ".join(gone))
+    if timer is not None:
+        timer.lap('export')
+    return device_name, records
+
+def classify_link_event(r, db, thresholds, summary=None):
+    """Classify stage for a LinkListener update (see link_listener.link_update).
+
+    Each changed interface becomes its last snapshot with the new link
+    fields, classified against that snapshot. Counters are carried over
+    with `counters_ts` (when they were read), so the next poll computes
+    rates over the right interval and none are derived here. Interfaces
+    not polled yet are left to the next poll. Returns a LinkUpdate or None."""
+    device_name, ts = r['device'], r['ts']
+    names, curs, prevs = [], [], []
+    for ifname, change in r['ifaces'].items():
+        prev = db.get_last_state(device_name, ifname)
+        if not prev or 'state' not in prev:
+            continue
+        cur = dict(prev, ts=ts, counters_ts=prev.get('counters_ts', prev['ts']))
+        cur.update(change)
+        names.append(ifname)
+        curs.append(cur)
+        prevs.append(prev)
+    if not names:
+        return None
+    res = classify_batch(*to_columns(curs, prevs), thresholds)
+    records, moves = [], {}
+    for k, (ifname, cur, prev) in enumerate(zip(names, curs, prevs)):
+        state, info = res.states[k], res.infos[k]
+        if info.get('reason') not in LINK_REASONS and prev.get('reason') not in LINK_REASONS:
+            # link up before and after: error rates, flaps and speed need the
+            # counters, so the state the last poll derived from them stands
+            state, info = prev['state'], {'reason': prev.get('reason')}
+        cur['state'] = state
+        cur['reason'] = info.get('reason')
+        cur['state_since'] = prev['state_since'] if state == prev['state'] and prev.get('state_since') else ts
+        db.remember(device_name, ifname, cur)
+        records.append((ifname, cur, prev['state'], state, info, None))
+        if state != prev['state']:
+            moves[ifname] = (prev['state'], state)
+    if moves:
+        exporter.TABLE.set_states(device_name, {i: new for i, (_, new) in moves.items()})
+        if summary is not None:
+            summary.move_states(device_name, moves.values())
+    return LinkUpdate(device_name, records)
+
+def persist_result(item, db, config, history=None, alerts=None, correlator=None, stream=None, tenant_event=None,
+                   timer=None):
+    """Persist stage: store snapshots, log transitions and send alerts
+    (queued on `alerts`, an AlertDispatcher, when given). With a correlator
+    transitions are handed to it and alerted as per-device incidents.
+    `stream` (a BroadcastBuffer) gets each transition and a rate summary
+    of the device; `tenant_event(device, iface, text, ts)` copies logged
+    events to the tenant store. `timer` gets store/history/alert/stream laps."""
+    device_name, records = item
+    if correlator is not None:
+        alert = correlator.add
+    else:
+        alert = alerts.submit if alerts is not None else partial(alert_for_event_extended, config=config)
+    for ifname, cur, prev_state, state, info, rates in records:
+        # store current snapshot
+        db.save_state(device_name, ifname, cur)
+        if timer is not None:
+            timer.lap('store')
+        if history is not None and rates:
+            history.append(device_name, ifname, cur['ts'], *rates)
+            if timer is not None:
+                timer.lap('history')
+
+        # transitions and initial alert logic
+        if prev_state is not None:
+            if prev_state != state:
+                text = f"state_change {prev_state} -> {state} : {info}"
+                db.append_event(device_name, ifname, text, state)
+                if tenant_event is not None:
+                    tenant_event(device_name, ifname, text, cur['ts'])
+                if timer is not None:
+                    timer.lap('store')
+                alert(device_name, ifname, state, info)
+                if timer is not None:
+                    timer.lap('alert')
+                if stream is not None:
+                    stream.publish('transition', {'device': device_name, 'iface': ifname, 'ts': cur['ts'],
+                                                  'prev': prev_state, 'state': state, 'info': info},
+                                   device_name, state)
+        else:
+            # First time seen: if not UP, alert
+            if state != "UP":
+                text = f"initial_state {state} : {info}"
+                db.append_event(device_name, ifname, text, state)
+                if tenant_event is not None:
+                    tenant_event(device_name, ifname, text, cur['ts'])
+                if timer is not None:
+                    timer.lap('store')
+                alert(device_name, ifname, state, info)
+                if timer is not None:
+                    timer.lap('alert')
+                if stream is not None:
+                    stream.publish('transition', {'device': device_name, 'iface': ifname, 'ts': cur['ts'],
+                                                  'prev': None, 'state': state, 'info': info},
+                                   device_name, state)
+    if stream is not None and records and not isinstance(item, LinkUpdate):
+        stream.publish('rates', rate_summary(device_name, records), device_name)
+    if timer is not None:
+        timer.lap('stream')  # transition publishes and the rate summary
+
+
+def rate_summary(device_name, records):
+    """Per-cycle summary of a device for the event stream: state counts,
+    totals and {iface: [rx_bps, tx_bps]}."""
+    states, ifaces = {}, {}
+    rx = tx = err = 0.0
+    for ifname, cur, _, state, _, rates in records:
+        states[state] = states.get(state, 0) + 1
+        if rates:
+            ifaces[ifname] = [round(rates[0], 1), round(rates[1], 1)]
+            rx += rates[0]
+            tx += rates[1]
+            err += rates[2]
+    return {'device': device_name, 'ts': records[0][1]['ts'], 'states': states, 'rx_bps': round(rx, 1),
+            'tx_bps': round(tx, 1), 'err_per_sec': round(err, 3), 'ifaces': ifaces}
+
+def thread_submit(executor, poll):
+    """Non-blocking submit for the thread engine, same contract as
+    AsyncEngine.submit: on_result(result) or on_error(dev_cfg, reason) per device."""
+    poll_hist = STAGE_SECONDS.labels(stage='poll')
+
+    def work(d, on_result, on_error):
+        t0 = time.perf_counter()
+        ok = False
         try:
-            api_pool.disconnect()
-        except Exception:
-            pass
+            r = poll(d)
+            ok = True
+        except DeviceBackoff as e:
+            # expected while a device stays unreachable: the failure was logged when it happened
+            log.debug("poll skipped for %s: %s", d.get('name'), e)
+            if on_error is not None:
+                on_error(d, str(e))
+            return
+        except Exception as e:
+            log.exception("poll_device failed for %s: %s", d.get('name'), e)
+            if on_error is not None:
+                on_error(d, str(e) or type(e).__name__)
+            return
+        finally:
+            dt = time.perf_counter() - t0
+            poll_hist.observe(dt)
+            exporter.TABLE.observe_poll(d.get('name'), dt, ok)
+        on_result(r)
+
+    def submit(devices, on_result, on_error=None):
+        for d in devices:
+            executor.submit(work, d, on_result, on_error)
+    return submit
+
+def unsettled(records, fast_for):
+    """True while any interface is DOWN/DEGRADED for less than `fast_for` seconds
+    (long-dead ports and admin-disabled ones do not keep a device on the fast interval)."""
+    for _, cur, _, state, _, _ in records:
+        if state in ('DOWN', 'DEGRADED') and cur['ts'] - cur.get('state_since', cur['ts']) < fast_for:
+            return True
+    return False
 
 def start_collector(config):
     logging.basicConfig(
         level=getattr(logging, (config.get('logging',{}).get('level','INFO')).upper()),
         format='%(asctime)s %(levelname)s %(name)s: %(message)s'
     )
-    devices = config['devices']
-    poll_interval = int(config.get('poll_interval', 15))
+    inventory = DeviceInventory.from_config(config)
+    membership = ShardMembership.from_config(config)
+    if membership is not None:
+        membership.beat(force=True)
+        exporter.TABLE.set_const_labels({'shard': membership.worker_id})
+        log.info("sharded mode: worker %s", membership.worker_id)
+
+    def current_devices():
+        devs = inventory.devices() if inventory is not None else config['devices']
+        return membership.owned(devs) if membership is not None else devs
+
+    devices = current_devices()
     thresholds = config.get('thresholds', {}) or {}
     prom = config.get('prometheus', {}) or {}
     db_path = config.get('db_path', 'iface_state.db')
 
-    db = StateStore(db_path)
+    checkpoint = float(config.get('state_checkpoint', 300))  # 0: write every snapshot
+    db = StateCache(StateStore(db_path, batched=bool(config.get('db_batched', True)), checkpoint=checkpoint or None))
+    log.info("state cache warmed with %d interfaces", db.warm())
+
+    instr = Instrumentation.from_config(config)
+    if instr is not None and instr.install_signal():
+        log.info("instrumentation on; SIGUSR1 writes a %.0fs profile to %s", instr.profile_seconds, instr.profile_dir)
 
     if prom.get('enabled'):
         prom_port = int(prom.get('port') or prom.get('listen_port') or 8000)
         prom_addr = prom.get('listen_addr') or prom.get('addr') or '0.0.0.0'
-        try:
-            # start_http_server signature may vary; try (port, addr)
-            start_http_server(prom_port, prom_addr)
-        except TypeError:
-            start_http_server(prom_port)
+        exporter.start_http_server(prom_port, prom_addr, routes=instr.routes() if instr is not None else None)
         log.info(f"Prometheus exporter on {prom_addr}:{prom_port}")
 
-    executor = ThreadPoolExecutor(max_workers=min(16, max(1, len(devices))))
+    executor = ThreadPoolExecutor(max_workers=16 if inventory or membership else min(16, max(1, len(devices))))
+    connections = ConnectionManager.from_config(config)
+    engine = (config.get('engine') or 'thread').lower()
+    if engine == 'async':
+        from collector_async import AsyncEngine
+        async_engine = AsyncEngine.from_config(config)
+        log.info("async engine: max_concurrency=%d device_timeout=%.1fs",
+                 async_engine.max_concurrency, async_engine.device_timeout)
+        submit = async_engine.submit
+    else:
+        async_engine = None
+        submit = thread_submit(executor, partial(poll_device, connections=connections))
+
+    history = HistoryStore.from_config(config)
+    alerts = AlertDispatcher.from_config(config)
+    correlator = IncidentCorrelator.from_config(
+        config, alerts.submit if alerts is not None else partial(alert_for_event_extended, config=config))
+
+    def restore_incidents(name):
+        # open incidents are only known from what was stored as non-UP
+        correlator.restore(name, [(i, snap.get('state'), {'reason': snap.get('reason')})
+                                  for i, snap in db.snapshots(name)])
+
+    if correlator is not None:
+        for dev in devices:  # owned ones only: other shards resolve the rest
+            restore_incidents(dev['name'])
+
+    tenants = TenantStore.from_config(config)
+    tenant_of = {}  # device name -> tenant name, for devices with a 'tenant' key
+
+    def tenant_event(device, iface, text, ts):
+        tenant = tenant_of.get(device)
+        if tenant is not None:
+            tenants.append(tenant, device, iface, text, ts)
+
+    def flush_stores():
+        db.flush()
+        if history is not None:
+            history.flush()
+        if tenants is not None:
+            tenants.flush()
+
+    retention = EventRetention.from_config(config)
+    if retention is not None:
+        retention.start()
+    summary = FleetSummary.from_config(config)
+    summary_worker = membership.worker_id if membership is not None else 'collector'
+
+    def set_tenants(devs):
+        nonlocal tenant_of  # swapped whole; the persist thread reads it
+        tenant_of = {d['name']: str(d['tenant']) for d in devs if d.get('tenant')}
+
+    scheduler = PollScheduler.from_config(config)
+    scheduler.sync(devices)
+    set_tenants(devices)
+    fast_for = float((config.get('schedule', {}) or {}).get('fast_for', 600))
+    stream = StreamServer.from_config(config)
+    if stream is not None:
+        stream.start()
+        log.info("event stream on port %d", stream.port)
+    persist = partial(persist_result, db=db, config=config, history=history, alerts=alerts,
+                      correlator=correlator, stream=stream.buffer if stream is not None else None,
+                      tenant_event=tenant_event if tenants is not None else None)
+
+    def persist_and_reschedule(item):
+        if isinstance(item, LinkUpdate):
+            persist(item)
+            return
+        timer = instr.timer(item[0]) if instr is not None else None
+        if timer is not None:
+            timer.lap('queue')
+        # a device stays in flight until its result is persisted
+        try:
+            persist(item, timer=timer)
+        finally:
+            elapsed = scheduler.done(item[0], fast=unsettled(item[1], fast_for))
+            if elapsed is not None:
+                exporter.CYCLE_SECONDS.observe(elapsed)
+            if instr is not None:
+                instr.finish(item[0])
+
+    def cycle_failed(name, reason):
+        scheduler.done(name)
+        if instr is not None:
+            instr.finish(name, error=reason)
+        if summary is not None:
+            summary.poll_failed(name, reason)
+
+    def poll_failed(dev_cfg, reason):
+        cycle_failed(dev_cfg['name'], reason)
+
+    def apply_devices():
+        # unchanged devices keep their timers, sessions and cached state
+        devs = current_devices()
+        added, updated, removed = scheduler.sync(devs)
+        set_tenants(devs)
+        if correlator is not None:
+            correlator.set_sites(devs)
+        if listener is not None:
+            listener.sync(devs)
+        if membership is not None:
+            for name in added:
+                db.reload_device(name)  # last written by the shard that owned it before
+                if correlator is not None:
+                    restore_incidents(name)
+        for name in removed:
+            connections.invalidate(name)
+            if async_engine is not None:
+                async_engine.forget(name)
+            db.drop_device(name)
+            if correlator is not None:
+                correlator.restore(name, [])  # its new owner resolves what is still open
+            exporter.TABLE.remove_device(name)
+            if summary is not None:
+                summary.remove_device(name)
+        log.info("devices: %d added, %d updated, %d removed", len(added), len(updated), len(removed))
+
+    def classify(r):
+        if r.get('listen'):
+            return classify_link_event(r, db, thresholds, summary)
+        timer = instr.timer(r['device']) if instr is not None else None
+        if timer is not None:
+            timer.lap('queue')
+        try:
+            return classify_result(r, db, thresholds, summary, timer)
+        except Exception as e:
+            # no persist item follows: end the cycle here or the device stays in flight
+            cycle_failed(r['device'], f"classify failed: {e}")
+            raise
+
+    pipeline = Pipeline(classify, persist_and_reschedule,
+                        queue_size=int(config.get('pipeline_queue_size', 64)),
+                        persist_idle=flush_stores)
+    listener = LinkListener.from_config(config, connections, pipeline.emit, scheduler.poke)
+    if listener is not None:
+        listener.sync(devices)
+        log.info("listening for link changes; counters polled every %.0fs", listener.poll_interval)
+    emit = instr.emitter(pipeline.emit) if instr is not None else pipeline.emit
+    next_prune = 0
+    next_tenant_reload = time.time() + tenants.reload_interval if tenants is not None else 0
+    next_housekeeping = 0
+    # heartbeats are checked every pass, which must come at least that often
+    tick = min(1.0, membership.heartbeat) if membership is not None else 1.0
 
     while not shutdown_event.is_set():
-        start = time.time()
+        due = scheduler.pop_due()
+        if due:
+            if instr is not None:
+                instr.dispatched(due)
+            submit(due, emit, poll_failed)
 
-        futures = [executor.submit(poll_device, d) for d in devices]
-        results = []
-        for fut in as_completed(futures):
-            try:
-                results.append(fut.result())
-            except Exception as e:
-                log.exception("poll_device failed: %s", e)
-
-        for r in results:
-            device_name = r['device']
-            for ifname, cur in (r.get('ifaces') or {}).items():
-                prev = db.get_last_state(device_name, ifname)
-
-                # maintain downs_ts window list in current snapshot
-                downs_ts = list((prev or {}).get('downs_ts') or [])
-                # If link_downs increased, push timestamps now (collector-level safety as well)
-                if prev:
-                    inc = max(0, int(cur.get('link_downs',0)) - int(prev.get('link_downs',0)))
-                    if inc:
-                        downs_ts.extend([cur['ts']]*inc)
-                    # Purge old entries (> 24h, conservative; classifier prunes again by window)
-                    downs_ts = [x for x in downs_ts if cur['ts'] - x <= 86400]
-                cur['downs_ts'] = downs_ts
-
-                state, info = classify_interface(cur, prev, thresholds)
-
-                # metrics (derive rates against prev)
-                try:
-                    IF_UP.labels(device=device_name, iface=ifname, state=state).set(1 if state == 'UP' else 0)
-                    if prev:
-                        interval = max(1, cur['ts'] - prev.get('ts', cur['ts']))
-                        rx_bps = ((cur.get('rx_bytes',0) - prev.get('rx_bytes',0)) * 8) / interval
-                        tx_bps = ((cur.get('tx_bytes',0) - prev.get('tx_bytes',0)) * 8) / interval
-                        err_per_sec = ((cur.get('rx_errors',0) - prev.get('rx_errors',0)) + (cur.get('tx_errors',0) - prev.get('tx_errors',0))) / interval
-                        IF_RX_BPS.labels(device=device_name, iface=ifname).set(max(0, rx_bps))
-                        IF_TX_BPS.labels(device=device_name, iface=ifname).set(max(0, tx_bps))
-                        IF_ERR_RATE.labels(device=device_name, iface=ifname).set(max(0, err_per_sec))
-                except Exception as e:
-                    log.warning("Prom metric update error: %s", e)
-
-                # store current snapshot
-                db.save_state(device_name, ifname, cur)
-
-                # transitions and initial alert logic
-                if prev:
-                    from classifier import classify_interface as _cf
-                    prev_state, _ = _cf(prev, None, thresholds)  # classify previous in isolation
-                    if prev_state != state:
-                        db.append_event(device_name, ifname, f"state_change {prev_state} -> {state} : {info}")
-                        alert_for_event_extended(device_name, ifname, state, info, config)
-                else:
-                    # First time seen: if not UP, alert
-                    if state != "UP":
-                        db.append_event(device_name, ifname, f"initial_state {state} : {info}")
-                        alert_for_event_extended(device_name, ifname, state, info, config)
-
-        # sleep until next poll
-        duration = time.time() - start
-        to_sleep = max(1, poll_interval - duration)
-        time.sleep(to_sleep)
+        if membership is not None and membership.beat():  # no-op until due
+            apply_devices()
+        if time.time() >= next_housekeeping:
+            if inventory is not None and inventory.refresh():
+                apply_devices()
+            if correlator is not None:
+                correlator.flush()
+            if summary is not None:
+                changed, body = summary.render()
+                if changed:
+                    db.save_summary(summary_worker, time.time(), body)
+            connections.evict_idle()
+            log.debug("connection pool: %s", connections.stats())
+            if history is not None and time.time() >= next_prune:
+                log.debug("history prune removed %d rows", history.prune())
+                next_prune = time.time() + 3600
+            if tenants is not None and time.time() >= next_tenant_reload:
+                log.debug("tenant quota overrides changed: %d", tenants.reload())
+                next_tenant_reload = time.time() + tenants.reload_interval
+            next_housekeeping = time.time() + 1
+
+        shutdown_event.wait(scheduler.next_delay(max_wait=tick))
+
+    if listener is not None:
+        listener.stop()
+    # let polls already dispatched finish
+    deadline = time.monotonic() + 15
+    while scheduler.in_flight() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    pipeline.close()
+    db.close()
+    if history is not None:
+        history.close()
+    if correlator is not None:
+        correlator.flush(force=True)
+    if alerts is not None:
+        alerts.close()
+    if inventory is not None:
+        inventory.close()
+    if membership is not None:
+        membership.leave()
+    if stream is not None:
+        stream.stop()
+    if retention is not None:
+        retention.close()
+    if tenants is not None:
+        tenants.close()
+    connections.close_all()
+    executor.shutdown(wait=False)
+    if async_engine is not None:
+        async_engine.close()
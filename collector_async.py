@@ -0,0 +1,305 @@
+# collector_async.py
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import binascii
+from connection_pool import device_params
+from pipeline import STAGE_SECONDS
+import exporter
+
+log = logging.getLogger("collector.async")
+
+
+class RouterOsError(Exception):
+    """!trap / !fatal reply or malformed data from a RouterOS device."""
+
+
+def encode_length(n):
+    if n < 0x80:
+        return bytes([n])
+    if n < 0x4000:
+        return (n | 0x8000).to_bytes(2, 'big')
+    if n < 0x200000:
+        return (n | 0xC00000).to_bytes(3, 'big')
+    if n < 0x10000000:
+        return (n | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + n.to_bytes(4, 'big')
+
+
+def encode_sentence(words):
+    out = bytearray()
+    for w in words:
+        if isinstance(w, str):
+            w = w.encode()
+        out += encode_length(len(w))
+        out += w
+    out += b'\x00'
+    return bytes(out)
+
+
+async def read_word(reader):
+    b = (await reader.readexactly(1))[0]
+    if b < 0x80:
+        n = b
+    elif b < 0xC0:
+        n = ((b & 0x3F) << 8) | (await reader.readexactly(1))[0]
+    elif b < 0xE0:
+        n = ((b & 0x1F) << 16) | int.from_bytes(await reader.readexactly(2), 'big')
+    elif b < 0xF0:
+        n = ((b & 0x0F) << 24) | int.from_bytes(await reader.readexactly(3), 'big')
+    elif b == 0xF0:
+        n = int.from_bytes(await reader.readexactly(4), 'big')
+    else:
+        raise RouterOsError(f"malformed word length 0x{b:02x}")
+    return await reader.readexactly(n) if n else b''
+
+
+async def read_sentence(reader):
+    words = []
+    while True:
+        w = await read_word(reader)
+        if not w:
+            if words:
+                return words
+            continue
+        words.append(w)
+
+
+def parse_reply(words):
+    """Split a reply sentence into (type, attrs, tag)."""
+    kind = words[0].decode(errors='replace')
+    attrs, tag = {}, None
+    for w in words[1:]:
+        if w.startswith(b'='):
+            k, _, v = w[1:].partition(b'=')
+            attrs[k.decode(errors='replace')] = v.decode(errors='replace')
+        elif w.startswith(b'.tag='):
+            tag = w[5:].decode()
+    return kind, attrs, tag
+
+
+class AsyncRouterOsClient:
+    """RouterOS API client on asyncio streams.
+
+    Commands are tagged, so several can be in flight on one connection and
+    their replies are read back in a single pass (`run_many`).
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._tag = 0
+
+    @classmethod
+    async def connect(cls, host, port, user, password):
+        reader, writer = await asyncio.open_connection(host, port)
+        client = cls(reader, writer)
+        try:
+            await client.login(user, password)
+        except BaseException:
+            client.close()
+            raise
+        return client
+
+    async def login(self, user, password):
+        # RouterOS >= 6.43 accepts plaintext login; older ones answer with a
+        # challenge in =ret= that must be MD5-hashed with the password.
+        done = (await self.run_many([['/login', f'=name={user}', f'=password={password}']]))[0]
+        ret = done[1].get('ret')
+        if ret:
+            h = hashlib.md5(b'\x00' + password.encode() + binascii.unhexlify(ret)).hexdigest()
+            await self.run_many([['/login', f'=name={user}', f'=response=00{h}']])
+
+    async def run_many(self, commands):
+        """Send tagged commands at once; return [(rows, done_attrs), ...] in order."""
+        tags = []
+        out = bytearray()
+        for words in commands:
+            self._tag += 1
+            tag = str(self._tag)
+            tags.append(tag)
+            out += encode_sentence(list(words) + [f'.tag={tag}'])
+        self.writer.write(bytes(out))
+        await self.writer.drain()
+
+        pending = {t: ([], None, None) for t in tags}
+        remaining = len(tags)
+        while remaining:
+            kind, attrs, tag = parse_reply(await read_sentence(self.reader))
+            if kind == '!fatal':
+                raise RouterOsError(f"fatal: {attrs or 'connection closed by device'}")
+            if tag not in pending:
+                continue
+            rows, done, err = pending[tag]
+            if kind == '!re':
+                rows.append(attrs)
+            elif kind == '!trap':
+                pending[tag] = (rows, done, attrs.get('message', 'trap'))
+            elif kind == '!done':
+                pending[tag] = (rows, attrs, err)
+                remaining -= 1
+        result = []
+        for t in tags:
+            rows, done, err = pending[t]
+            if err:
+                raise RouterOsError(err)
+            result.append((rows, done))
+        return result
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class AsyncEngine:
+    """Polls a whole fleet from one event loop.
+
+    Concurrency is bounded by a global semaphore and every device gets a
+    hard timeout, after which its coroutine is cancelled and its connection
+    closed, so a hung router only costs itself. Sessions are kept open
+    between cycles and dropped on any error.
+    """
+
+    def __init__(self, max_concurrency=512, device_timeout=10.0):
+        self.max_concurrency = max_concurrency
+        self.device_timeout = device_timeout
+        self._clients = {}
+        self._loop = asyncio.new_event_loop()
+        self._sem = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-engine", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, config):
+        c = (config or {}).get('async', {}) or {}
+        return cls(max_concurrency=int(c.get('max_concurrency', 512)),
+                   device_timeout=float(c.get('device_timeout', 10)))
+
+    async def _client(self, dev_cfg):
+        """Return (client, reused) for the device."""
+        p = device_params(dev_cfg)
+        client = self._clients.pop(p['name'], None)
+        if client is not None and client.params == p and not client.writer.is_closing():
+            return client, True
+        if client is not None:
+            client.close()
+        client = await AsyncRouterOsClient.connect(p['host'], p['port'], p['user'], p['password'])
+        client.params = p
+        return client, False
+
+    async def _poll(self, dev_cfg):
+        from collector_api import build_snapshots, DEVICE_API_CALLS
+        for attempt in (1, 2):
+            client, reused = await self._client(dev_cfg)
+            try:
+                iface_rows, eth_rows, calls = await self._fetch(client)
+                break
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                client.close()
+                if attempt == 2 or not reused:
+                    raise
+                log.info("stale RouterOS session for %s (%s), reconnecting", dev_cfg['name'], e)
+            except BaseException:
+                client.close()
+                raise
+        self._clients[dev_cfg['name']] = client
+        DEVICE_API_CALLS.labels(device=dev_cfg['name']).set(calls)
+        return {'device': dev_cfg['name'],
+                'ifaces': build_snapshots(dev_cfg, iface_rows, eth_rows, int(time.time()))}
+
+    async def _fetch(self, client):
+        from collector_api import IFACE_PROPLIST, ETH_PROPLIST
+        try:
+            (iface_rows, _), (eth_rows, _) = await client.run_many([
+                ['/interface/print', f'=.proplist={IFACE_PROPLIST}'],
+                ['/interface/ethernet/print', f'=.proplist={ETH_PROPLIST}'],
+            ])
+        except RouterOsError:
+            # devices without ethernet ports reject the second menu
+            (iface_rows, _), = await client.run_many([['/interface/print', f'=.proplist={IFACE_PROPLIST}']])
+            return iface_rows, [], 3
+        return iface_rows, eth_rows, 2
+
+    async def poll_one(self, dev_cfg):
+        """Poll one device under the global limit and per-device timeout."""
+        async with self._sem:
+            return await asyncio.wait_for(self._poll(dev_cfg), self.device_timeout)
+
+    async def _poll_reported(self, d):
+        """poll_one with metrics and logging; returns (result, None) or (None, reason)."""
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            r = await self.poll_one(d)
+            ok = True
+            return r, None
+        except asyncio.TimeoutError:
+            log.warning("poll timeout for %s after %.1fs", d['name'], self.device_timeout)
+            return None, 'timeout'
+        except Exception as e:
+            log.warning("poll failed for %s: %s", d['name'], e)
+            return None, str(e) or type(e).__name__
+        finally:
+            dt = time.perf_counter() - t0
+            STAGE_SECONDS.labels(stage='poll').observe(dt)
+            exporter.TABLE.observe_poll(d['name'], dt, ok)
+
+    async def _poll_all(self, devices, on_result=None):
+        results, failures = [], {}
+
+        async def one(d):
+            r, err = await self._poll_reported(d)
+            if err is not None:
+                failures[d['name']] = err
+            elif on_result is not None:
+                # may block on pipeline backpressure; keep the loop free
+                await asyncio.to_thread(on_result, r)
+            else:
+                results.append(r)
+
+        await asyncio.gather(*(one(d) for d in devices))
+        return results, failures
+
+    async def _poll_cb(self, d, on_result, on_error):
+        r, err = await self._poll_reported(d)
+        try:
+            if err is None:
+                await asyncio.to_thread(on_result, r)
+            elif on_error is not None:
+                on_error(d, err)
+        except Exception as e:
+            log.exception("result callback failed for %s: %s", d['name'], e)
+
+    def submit(self, devices, on_result, on_error=None):
+        """Start polling `devices` without waiting: each result goes to
+        on_result(result), each failure to on_error(dev_cfg, reason)."""
+        for d in devices:
+            asyncio.run_coroutine_threadsafe(self._poll_cb(d, on_result, on_error), self._loop)
+
+    def poll_all(self, devices, on_result=None):
+        """Blocking wrapper: poll every device, return (results, failures)."""
+        fut = asyncio.run_coroutine_threadsafe(self._poll_all(devices, on_result), self._loop)
+        return fut.result()
+
+    def forget(self, name):
+        """Close the kept session of a device that left the inventory."""
+        def _drop():
+            client = self._clients.pop(name, None)
+            if client is not None:
+                client.close()
+        self._loop.call_soon_threadsafe(_drop)
+
+    def close(self):
+        async def _close():
+            for c in self._clients.values():
+                c.close()
+            self._clients.clear()
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
@@ -0,0 +1,271 @@
+# connection_pool.py
+import time
+import random
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from routeros_api import RouterOsApiPool
+from routeros_api.exceptions import RouterOsApiConnectionError, RouterOsApiFatalCommunicationError
+from prometheus_client import Counter, Gauge, Histogram
+
+log = logging.getLogger("collector.pool")
+
+# Errors that mean the TCP session is unusable and must be thrown away
+CONNECTION_ERRORS = (RouterOsApiConnectionError, RouterOsApiFatalCommunicationError, socket.error, EOFError)
+
+POOL_CONNECT_SECONDS = Histogram('noc_routeros_connect_seconds', 'RouterOS TCP connect + login latency')
+POOL_SESSIONS = Counter('noc_routeros_sessions_total', 'RouterOS session acquisitions', ['result'])
+POOL_OPEN = Gauge('noc_routeros_sessions_open', 'RouterOS sessions currently kept open')
+POOL_REUSE_RATIO = Gauge('noc_routeros_session_reuse_ratio', 'Fraction of session acquisitions served by an open session')
+
+
+def device_params(dev_cfg):
+    """Normalize device config keys: host/ip, port/api_port, password/pass."""
+    return {
+        'name': dev_cfg['name'],
+        'host': dev_cfg.get('host') or dev_cfg.get('ip'),
+        'user': dev_cfg.get('user') or dev_cfg.get('username') or 'admin',
+        'password': dev_cfg.get('password', dev_cfg.get('pass', '')) or '',
+        'port': int(dev_cfg.get('port') or dev_cfg.get('api_port') or 8728),
+    }
+
+
+def _set_nodelay(pool):
+    # routeros_api sends every word with its own send(); without TCP_NODELAY
+    # each command pays Nagle + delayed-ACK latency on a long-lived session.
+    try:
+        pool.socket.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (AttributeError, OSError):
+        pass
+
+
+class CallCounter:
+    """Wraps a routeros_api communicator and counts API round-trips."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+
+    def call(self, *args, **kwargs):
+        self.calls += 1
+        return self.inner.call(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+def count_calls(api):
+    """Install a CallCounter on `api` (once) and return it."""
+    if not isinstance(api.communicator, CallCounter):
+        api.communicator = CallCounter(api.communicator)
+    return api.communicator
+
+
+class DeviceBackoff(Exception):
+    """Raised when a device is still inside its reconnect backoff window."""
+
+
+class Session:
+    """One open RouterOS API session for a device."""
+    __slots__ = ('key', 'params', 'pool', 'api', 'opened', 'last_used', 'uses', 'lock')
+
+    def __init__(self, key, params, pool, api):
+        self.key = key
+        self.params = params
+        self.pool = pool
+        self.api = api
+        self.opened = self.last_used = time.monotonic()
+        self.uses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def reused(self):
+        return self.uses > 1
+
+    def close(self):
+        try:
+            self.pool.disconnect()
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    """Long-lived RouterOS sessions keyed by device name.
+
+    Sessions stay open between polls. A session idle for more than
+    `check_after` seconds is probed before reuse, failed connects back off
+    exponentially (with jitter) and sessions idle for `idle_timeout` are closed.
+    """
+
+    def __init__(self, idle_timeout=300, check_after=60, backoff_base=1.0, backoff_max=300.0,
+                 socket_timeout=10.0, plaintext_login=True):
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.socket_timeout = socket_timeout
+        self.plaintext_login = plaintext_login
+        self._sessions = {}
+        self._backoff = {}  # key -> (failures, not_before)
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.failed = 0
+        self.connect_seconds = {}  # key -> last connect+login latency
+
+    @classmethod
+    def from_config(cls, config):
+        c = (config or {}).get('connections', {}) or {}
+        return cls(
+            idle_timeout=float(c.get('idle_timeout', 300)),
+            check_after=float(c.get('check_after', 60)),
+            backoff_base=float(c.get('backoff_base', 1.0)),
+            backoff_max=float(c.get('backoff_max', 300)),
+            socket_timeout=float(c.get('socket_timeout', 10)),
+            plaintext_login=bool(c.get('plaintext_login', True)),
+        )
+
+    def _key_lock(self, key):
+        with self._lock:
+            lk = self._key_locks.get(key)
+            if lk is None:
+                lk = self._key_locks[key] = threading.Lock()
+            return lk
+
+    def _connect(self, key, params):
+        failures, not_before = self._backoff.get(key, (0, 0.0))
+        now = time.monotonic()
+        if now < not_before:
+            raise DeviceBackoff(f"{key}: reconnect backoff for {not_before - now:.1f}s more")
+        pool = RouterOsApiPool(params['host'], username=params['user'], password=params['password'],
+                               port=params['port'], plaintext_login=self.plaintext_login)
+        pool.socket_timeout = self.socket_timeout
+        t0 = time.perf_counter()
+        try:
+            api = pool.get_api()
+        except Exception:
+            failures += 1
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (failures - 1)))
+            delay *= random.uniform(0.5, 1.5)
+            self._backoff[key] = (failures, time.monotonic() + delay)
+            self.failed += 1
+            POOL_SESSIONS.labels(result='failed').inc()
+            try:
+                pool.disconnect()
+            except Exception:
+                pass
+            raise
+        elapsed = time.perf_counter() - t0
+        _set_nodelay(pool)
+        count_calls(api)
+        self._backoff.pop(key, None)
+        self.connect_seconds[key] = elapsed
+        POOL_CONNECT_SECONDS.observe(elapsed)
+        return Session(key, params, pool, api)
+
+    def _alive(self, sess):
+        if not sess.pool.connected:
+            return False
+        if time.monotonic() - sess.last_used < self.check_after:
+            return True
+        try:
+            sess.api.get_resource('/system/identity').get()
+            return True
+        except Exception as e:
+            log.debug("session probe failed for %s: %s", sess.key, e)
+            return False
+
+    def acquire(self, dev_cfg):
+        """Return an open Session for the device, reconnecting when needed."""
+        params = device_params(dev_cfg)
+        key = params['name']
+        with self._key_lock(key):
+            sess = self._sessions.get(key)
+            if sess is not None and (sess.params != params or not self._alive(sess)):
+                self._discard(key)
+                sess = None
+            if sess is None:
+                sess = self._connect(key, params)
+                with self._lock:
+                    self._sessions[key] = sess
+                self.opened += 1
+                POOL_SESSIONS.labels(result='opened').inc()
+            else:
+                self.reused += 1
+                POOL_SESSIONS.labels(result='reused').inc()
+            sess.uses += 1
+            self._update_gauges()
+            return sess
+
+    @contextmanager
+    def session(self, dev_cfg):
+        """Context manager yielding a Session; drops it on connection errors."""
+        sess = self.acquire(dev_cfg)
+        with sess.lock:
+            try:
+                yield sess
+            except CONNECTION_ERRORS:
+                self.invalidate(sess.key, sess)
+                raise
+            finally:
+                sess.last_used = time.monotonic()
+
+    def invalidate(self, key, sess=None):
+        """Close the session for `key` (only if it is still `sess`, when given)."""
+        with self._lock:
+            cur = self._sessions.get(key)
+            if cur is None or (sess is not None and cur is not sess):
+                return
+            del self._sessions[key]
+        cur.close()
+        self._update_gauges()
+
+    def _discard(self, key):
+        with self._lock:
+            sess = self._sessions.pop(key, None)
+        if sess:
+            sess.close()
+
+    def evict_idle(self):
+        """Close sessions idle for longer than idle_timeout. Returns count closed."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            stale = [k for k, s in self._sessions.items() if s.last_used < cutoff and not s.lock.locked()]
+            closed = [self._sessions.pop(k) for k in stale]
+        for s in closed:
+            s.close()
+        if closed:
+            log.info("closed %d idle RouterOS sessions", len(closed))
+            self._update_gauges()
+        return len(closed)
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for s in sessions:
+            s.close()
+        self._update_gauges()
+
+    def reuse_ratio(self):
+        total = self.opened + self.reused
+        return (self.reused / total) if total else 0.0
+
+    def _update_gauges(self):
+        POOL_OPEN.set(len(self._sessions))
+        POOL_REUSE_RATIO.set(self.reuse_ratio())
+
+    def stats(self):
+        lat = list(self.connect_seconds.values())
+        return {
+            'open': len(self._sessions),
+            'opened': self.opened,
+            'reused': self.reused,
+            'failed': self.failed,
+            'reuse_ratio': self.reuse_ratio(),
+            'connect_seconds_avg': (sum(lat) / len(lat)) if lat else None,
+            'connect_seconds_max': max(lat) if lat else None,
+            'backoff': len(self._backoff),
+        }
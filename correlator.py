@@ -0,0 +1,181 @@
+# correlator.py
+import time
+import logging
+import threading
+from collections import Counter as Tally
+from prometheus_client import Counter
+
+log = logging.getLogger("collector.correlator")
+
+INCIDENT_EVENTS = Counter('noc_incident_events_total', 'Correlated incident events sent', ['action'])
+TRANSITIONS_SUPPRESSED = Counter('noc_transitions_suppressed_total',
+                                 'Interface transitions folded into an incident or deduplicated')
+
+# worst first; picks the incident state and PagerDuty severity
+SEVERITY = ('DOWN', 'DEGRADED', 'ADMIN_DOWN')
+
+
+class IncidentCorrelator:
+    """Fold per-interface transitions into one incident per device or site.
+
+    The first transition of a group opens a `window` second collection
+    window; later transitions only update each interface's latest state. On
+    flush the group's interfaces are compared with what was last alerted,
+    repeated states are dropped, and `send` is called once with a summary
+    (action 'trigger', or 'resolve' when nothing in the group is left
+    non-UP). `send(device, iface, state, details, summary=, action=,
+    dedup_key=)` matches AlertDispatcher.submit; the dedup_key is stable per
+    group so providers update a single open incident.
+
+    With `per_device` (sharded collectors) sites are ignored: a site's
+    devices may be spread over several workers, each of which would
+    trigger and resolve the same site incident on its own, while a device
+    incident moves with the device on a handover.
+    """
+
+    def __init__(self, send, window=30, sites=None, max_listed=10, per_device=False):
+        self.send = send
+        self.window = window
+        self.per_device = per_device
+        self.sites = {} if per_device else dict(sites or {})  # device name -> site
+        self.max_listed = max_listed
+        self._lock = threading.Lock()
+        self._pending = {}  # group -> (opened, {(device, iface): (state, info)})
+        self._active = {}  # group -> {(device, iface): (state, info)} currently non-UP and alerted
+
+    @classmethod
+    def from_config(cls, config, send):
+        """Correlator for config['correlation'], or None when disabled."""
+        c = (config or {}).get('correlation', {}) or {}
+        if not c.get('enabled', True):
+            return None
+        per_device = bool((config.get('sharding', {}) or {}).get('enabled', False))
+        return cls(send, window=float(c.get('window', 30)), sites=sites_of(config.get('devices', [])),
+                   max_listed=int(c.get('max_listed', 10)), per_device=per_device)
+
+    def group_of(self, device):
+        return self.sites.get(device, device)
+
+    def set_sites(self, devices):
+        """Take sites from the current device configs (inventory, reloads).
+        A device that changed site leaves its old group's incident as
+        recovered and is raised again in the new group on the next flush."""
+        if self.per_device:
+            return
+        sites = sites_of(devices)
+        now = time.time()
+        with self._lock:
+            moved = {}  # (device, iface) -> (old group, state, info)
+            for group, active in self._active.items():
+                for (device, iface), (state, info) in active.items():
+                    if sites.get(device, device) != group:
+                        moved[(device, iface)] = (group, state, info)
+            self.sites = sites
+            for key, (group, state, info) in moved.items():
+                for g, change in ((group, ('UP', {})), (self.group_of(key[0]), (state, info))):
+                    self._pending.setdefault(g, (now, {}))[1][key] = change
+
+    def add(self, device, iface, state, info, ts=None):
+        """Record one interface transition (or initial non-UP state)."""
+        group = self.group_of(device)
+        with self._lock:
+            pending = self._pending.get(group)
+            if pending is None:
+                pending = self._pending[group] = (ts or time.time(), {})
+            elif (device, iface) in pending[1]:
+                TRANSITIONS_SUPPRESSED.inc()
+            pending[1][(device, iface)] = (state, info)
+
+    def flush(self, now=None, force=False):
+        """Emit incidents for groups whose window has elapsed (all with force).
+        Returns the number of incident events sent."""
+        now = now or time.time()
+        with self._lock:
+            due = [g for g, (opened, _) in self._pending.items() if force or now - opened >= self.window]
+            work = [(g, self._pending.pop(g)[1]) for g in due]
+        sent = 0
+        for group, changes in work:
+            event = self._fold(group, changes)
+            if event is None:
+                continue
+            try:
+                self.send(*event[:4], **event[4])
+            except Exception as e:
+                log.exception("incident send failed for %s: %s", group, e)
+                continue
+            INCIDENT_EVENTS.labels(action=event[4]['action']).inc()
+            sent += 1
+        return sent
+
+    def _fold(self, group, changes):
+        with self._lock:
+            active = self._active.setdefault(group, {})
+            was_open = bool(active)
+            new, recovered = [], []
+            for key, (state, info) in changes.items():
+                before = active.get(key)
+                if state == 'UP':
+                    if before is None:
+                        TRANSITIONS_SUPPRESSED.inc()  # flapped back within the window
+                        continue
+                    del active[key]
+                    recovered.append(key)
+                elif before is not None and before[0] == state:
+                    TRANSITIONS_SUPPRESSED.inc()  # same state already alerted
+                else:
+                    active[key] = (state, info)
+                    new.append(key)
+            if not new and not recovered:
+                return None
+            snapshot = dict(active)
+            if not active:
+                del self._active[group]
+        if len(new) + len(recovered) > 1:
+            TRANSITIONS_SUPPRESSED.inc(len(new) + len(recovered) - 1)
+        dedup_key = f"noc-{group}"
+        if not snapshot:
+            if not was_open:
+                return None
+            summary = f"{group}: recovered, all interfaces UP"
+            return (group, '*', 'UP', {'recovered': [f"{d}/{i}" for d, i in recovered]},
+                    {'summary': summary, 'action': 'resolve', 'dedup_key': dedup_key})
+        counts = Tally(state for state, _ in snapshot.values())
+        worst = next(s for s in SEVERITY + tuple(counts) if counts.get(s))
+        names = sorted(f"{d}/{i}" for d, i in snapshot)
+        listed = ", ".join(names[:self.max_listed])
+        if len(names) > self.max_listed:
+            listed += f", ... +{len(names) - self.max_listed}"
+        summary = (f"{group}: " + ", ".join(f"{n} {s}" for s, n in counts.most_common())
+                   + f" ({listed})")
+        if recovered:
+            summary += f"; {len(recovered)} recovered"
+        details = {
+            'interfaces': {f"{d}/{i}": {'state': s, **(info or {})} for (d, i), (s, info) in snapshot.items()},
+            'new': sorted(f"{d}/{i}" for d, i in new),
+            'recovered': sorted(f"{d}/{i}" for d, i in recovered),
+        }
+        return (group, '*', worst, details, {'summary': summary, 'action': 'trigger', 'dedup_key': dedup_key})
+
+    def restore(self, device, states):
+        """Replace `device`'s alerted interfaces with its stored states,
+        [(iface, state, info)], so recoveries after a restart or a shard
+        handover still resolve the incident opened before."""
+        group = self.group_of(device)
+        with self._lock:
+            active = self._active.setdefault(group, {})
+            for key in [k for k in active if k[0] == device]:
+                del active[key]
+            for iface, state, info in states:
+                if state and state != 'UP':
+                    active[(device, iface)] = (state, info)
+            if not active:
+                del self._active[group]
+
+    def open_incidents(self):
+        with self._lock:
+            return {g: dict(a) for g, a in self._active.items()}
+
+
+def sites_of(devices):
+    """device name -> site for device configs that set one."""
+    return {d.get('name'): d['site'] for d in devices if d.get('site')}
@@ -0,0 +1,324 @@
+# event_retention.py
+import os
+import gzip
+import time
+import shutil
+import sqlite3
+import logging
+import argparse
+import threading
+import calendar
+from prometheus_client import Counter, Gauge
+from state_store import _BUMP_VERSION
+
+log = logging.getLogger("collector.retention")
+
+EVENTS_MOVED = Counter('noc_retention_events_moved_total', 'Events moved from the hot table into partitions')
+EVENTS_COMPACTED = Counter('noc_retention_events_compacted_total',
+                           'Moved events folded into an existing run-length record')
+PARTITIONS_DROPPED = Counter('noc_retention_partitions_dropped_total', 'Expired event partitions removed',
+                             ['action'])
+HOT_BACKLOG = Gauge('noc_retention_backlog_events', 'Events past hot_days still waiting in the hot table')
+
+
+def period_key(ts, period='month'):
+    """'202610' (month) or '20261018' (day) of a unix ts, UTC."""
+    t = time.gmtime(ts)
+    return f"{t.tm_year:04d}{t.tm_mon:02d}" + (f"{t.tm_mday:02d}" if period == 'day' else '')
+
+
+def period_bounds(key):
+    """[start, end) unix ts of a period key."""
+    y, m = int(key[:4]), int(key[4:6])
+    if len(key) == 8:
+        start = calendar.timegm((y, m, int(key[6:]), 0, 0, 0))
+        return start, start + 86400
+    ny, nm = (y + 1, 1) if m == 12 else (y, m + 1)
+    return calendar.timegm((y, m, 1, 0, 0, 0)), calendar.timegm((ny, nm, 1, 0, 0, 0))
+
+
+def _kind(event):
+    # "state_change UP -> DOWN : {...}" -> "state_change UP -> DOWN"
+    return event.split(' : ', 1)[0] if event else ''
+
+
+class EventRetention:
+    """Moves old rows of an event table into per-period partition databases.
+
+    The source table (event_log of the state DB, or saas.db's events) keeps
+    the last `hot_days`; older rows are moved, `batch` rows per short
+    transaction, into `<dir>/<table>_<period>.db`. On the way, repeated
+    identical transitions of the same key (every column but id/ts/event,
+    e.g. device+iface) less than `gap` seconds apart are folded into one
+    run-length record (first ts, last ts, count, latest text). Partitions
+    whose period ended more than `keep_days` ago are dropped by deleting
+    their file, or gzipped when `archive` is set, so expiry never deletes
+    row by row.
+
+    Each partition records the (ts, id) of the last row moved into it in
+    the same transaction as the rows; a crash between that commit and the
+    delete in the hot table is resumed without duplicates.
+    """
+
+    def __init__(self, path, directory='event_archive', table='event_log', period='month', hot_days=7,
+                 keep_days=365, archive=False, batch=500, gap=3600, interval=60.0, clock=time.time):
+        self.path = path
+        self.dir = directory
+        self.table = table
+        self.period = period
+        self.hot_days = hot_days
+        self.keep_days = keep_days
+        self.archive = archive
+        self.batch = batch
+        self.gap = gap
+        self.interval = interval
+        self.clock = clock
+        os.makedirs(directory, exist_ok=True)
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA busy_timeout=30000")
+        cols = [r[1] for r in self._con.execute(f"PRAGMA table_info({table})")]
+        if not cols:
+            raise ValueError(f"{path} has no table {table}")
+        self.columns = [c for c in cols if c != 'id']
+        self.key_columns = [c for c in self.columns if c not in ('ts', 'event')]
+        self._con.execute(f"CREATE INDEX IF NOT EXISTS {table}_ts ON {table}(ts)")
+        # StateStore's change counter for the table (its API ETag), when there is one
+        self._counter = 'events' if table == 'event_log' and self._con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='store_meta'").fetchone() else None
+        self._attached = None  # period key of the partition attached as `p`
+        self._runs = {}        # (key columns..., kind) -> (rowid, last_ts) in the attached partition
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Retention job for config['retention'] on the state DB, or None when disabled."""
+        r = (config or {}).get('retention', {}) or {}
+        if not r.get('enabled', False):
+            return None
+        return cls(config.get('db_path', 'iface_state.db'), directory=r.get('dir', 'event_archive'),
+                   period=r.get('period', 'month'), hot_days=float(r.get('hot_days', 7)),
+                   keep_days=float(r.get('keep_days', 365)), archive=bool(r.get('archive', False)),
+                   batch=int(r.get('batch', 500)), gap=int(r.get('gap', 3600)),
+                   interval=float(r.get('interval', 60)))
+
+    def partition_path(self, key):
+        return os.path.join(self.dir, f"{self.table}_{key}.db")
+
+    def partitions(self):
+        """Period keys of the partition files on disk, oldest first."""
+        prefix = f"{self.table}_"
+        return sorted(f[len(prefix):-3] for f in os.listdir(self.dir)
+                      if f.startswith(prefix) and f.endswith('.db'))
+
+    def _attach(self, key):
+        if self._attached == key:
+            return
+        self._detach()
+        self._con.execute("ATTACH DATABASE ? AS p", (self.partition_path(key),))
+        cols = ', '.join(self.columns)
+        self._con.execute(f"""CREATE TABLE IF NOT EXISTS p.events (
+            id INTEGER PRIMARY KEY, {cols}, last_ts integer, count integer, kind text)""")
+        self._con.execute("CREATE INDEX IF NOT EXISTS p.events_ts ON events(ts)")
+        keys = ', '.join(self.key_columns + ['kind', 'last_ts'])
+        self._con.execute(f"CREATE INDEX IF NOT EXISTS p.events_run ON events({keys})")
+        self._con.execute("CREATE TABLE IF NOT EXISTS p.moved (ts integer, id integer)")
+        self._attached = key
+        self._runs = {}
+
+    def _detach(self):
+        if self._attached is not None:
+            self._con.execute("DETACH DATABASE p")
+            self._attached = None
+            self._runs = {}
+
+    def step(self):
+        """Move at most `batch` expired rows (one partition). Returns the number moved."""
+        cutoff = int(self.clock() - self.hot_days * 86400)
+        t = self.table
+        row = self._con.execute(f"SELECT min(ts) FROM {t} WHERE ts < ?", (cutoff,)).fetchone()
+        if row[0] is None:
+            return 0
+        key = period_key(row[0], self.period)
+        end = min(period_bounds(key)[1], cutoff)
+        self._attach(key)
+        con = self._con
+        cols = ', '.join(self.columns)
+        rows = con.execute(f"SELECT id, {cols} FROM {t} WHERE ts < ? ORDER BY ts, id LIMIT ?",
+                           (end, self.batch)).fetchall()
+        done = con.execute("SELECT ts, id FROM p.moved").fetchone()
+        ts_i = self.columns.index('ts') + 1
+        ev_i = self.columns.index('event') + 1 if 'event' in self.columns else None
+        key_i = [self.columns.index(c) + 1 for c in self.key_columns]
+        folded = 0
+        placeholders = ', '.join('?' * (len(self.columns) + 3))
+        # deferred: only the partition is written, the hot table stays unlocked
+        con.execute("BEGIN")
+        try:
+            for r in rows:
+                if done and (r[ts_i], r[0]) <= tuple(done):
+                    continue  # moved before a crash, only the delete was lost
+                ts = r[ts_i]
+                kind = _kind(r[ev_i]) if ev_i else ''
+                rk = tuple(r[i] for i in key_i) + (kind,)
+                run = self._runs.get(rk)
+                if run is None:
+                    where = ' AND '.join(f"{c} IS ?" for c in self.key_columns + ['kind'])
+                    run = con.execute(f"SELECT id, last_ts FROM p.events WHERE {where} "
+                                      f"ORDER BY last_ts DESC LIMIT 1", rk).fetchone()
+                if run is not None and ts - run[1] <= self.gap:
+                    con.execute("UPDATE p.events SET last_ts=?, count=count+1"
+                                + (", event=?" if ev_i else "") + " WHERE id=?",
+                                (ts, r[ev_i], run[0]) if ev_i else (ts, run[0]))
+                    self._runs[rk] = (run[0], ts)
+                    folded += 1
+                else:
+                    cur = con.execute(f"INSERT INTO p.events({cols}, last_ts, count, kind) VALUES ({placeholders})",
+                                      r[1:] + (ts, 1, kind))
+                    self._runs[rk] = (cur.lastrowid, ts)
+            last = rows[-1]
+            con.execute("DELETE FROM p.moved")
+            con.execute("INSERT INTO p.moved(ts, id) VALUES (?, ?)", (last[ts_i], last[0]))
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            self._runs = {}
+            raise
+        # separate short transaction on the hot table only
+        # rows were taken in (ts, id) order, so they are exactly this range
+        con.execute("BEGIN")
+        try:
+            con.execute(f"DELETE FROM {t} WHERE (ts, id) <= (?, ?)", (last[ts_i], last[0]))
+            if self._counter is not None:
+                con.execute(_BUMP_VERSION, (self._counter,))
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        EVENTS_MOVED.inc(len(rows))
+        EVENTS_COMPACTED.inc(folded)
+        return len(rows)
+
+    def backlog(self):
+        """Rows past hot_days still in the hot table."""
+        cutoff = int(self.clock() - self.hot_days * 86400)
+        return self._con.execute(f"SELECT count(*) FROM {self.table} WHERE ts < ?", (cutoff,)).fetchone()[0]
+
+    def expire(self):
+        """Drop (or gzip) partitions that ended more than keep_days ago.
+        Returns their period keys."""
+        limit = self.clock() - self.keep_days * 86400
+        gone = []
+        for key in self.partitions():
+            if period_bounds(key)[1] > limit:
+                break
+            if self._attached == key:
+                self._detach()
+            path = self.partition_path(key)
+            if self.archive:
+                with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst)
+            os.remove(path)
+            for suffix in ('-wal', '-shm', '-journal'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            PARTITIONS_DROPPED.labels(action='archived' if self.archive else 'deleted').inc()
+            log.info("event partition %s %s", key, 'archived' if self.archive else 'dropped')
+            gone.append(key)
+        return gone
+
+    def run_once(self, max_seconds=None):
+        """Expire partitions, then move batches until caught up (or max_seconds).
+        Returns the number of rows moved."""
+        self.expire()
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        moved = 0
+        while not self._stop.is_set():
+            n = self.step()
+            moved += n
+            if not n or (deadline and time.monotonic() >= deadline):
+                break
+            time.sleep(0.01)  # let collector writes in between batches
+        HOT_BACKLOG.set(self.backlog())
+        return moved
+
+    def start(self):
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    moved = self.run_once(max_seconds=self.interval / 2)
+                    if moved:
+                        log.info("retention: moved %d events to partitions", moved)
+                except sqlite3.Error as e:
+                    log.warning("retention step failed: %s", e)
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="event-retention")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def close(self):
+        self.stop()
+        self._detach()
+        self._con.close()
+
+
+def archived_events(directory, table='event_log', device=None, iface=None, since=None, until=None, limit=100):
+    """Run-length records from the partitions overlapping [since, until],
+    newest first: dicts with the source columns plus last_ts and count."""
+    prefix = f"{table}_"
+    keys = sorted((f[len(prefix):-3] for f in os.listdir(directory) if f.startswith(prefix) and f.endswith('.db')),
+                  reverse=True) if os.path.isdir(directory) else []
+    out = []
+    for key in keys:
+        start, end = period_bounds(key)
+        if (since is not None and end <= since) or (until is not None and start > until):
+            continue
+        where, params = [], []
+        for col, val in (('device', device), ('iface', iface)):
+            if val is not None:
+                where.append(f"{col}=?")
+                params.append(val)
+        if since is not None:
+            where.append("last_ts>=?")
+            params.append(int(since))
+        if until is not None:
+            where.append("ts<=?")
+            params.append(int(until))
+        sql = "SELECT * FROM events" + (" WHERE " + " AND ".join(where) if where else "")
+        sql += " ORDER BY ts DESC LIMIT ?"
+        con = sqlite3.connect(f"file:{os.path.join(directory, prefix + key + '.db')}?mode=ro", uri=True)
+        con.row_factory = sqlite3.Row
+        try:
+            out.extend(dict(r) for r in con.execute(sql, params + [limit - len(out)]))
+        finally:
+            con.close()
+        if len(out) >= limit:
+            break
+    return out
+
+
+def main():
+    p = argparse.ArgumentParser(description="Mueve/compacta/expira eventos antiguos en particiones por periodo")
+    p.add_argument('--db', default=os.environ.get('STATE_DB_PATH', 'iface_state.db'))
+    p.add_argument('--table', default='event_log', help="event_log (estado) o events (saas.db)")
+    p.add_argument('--dir', default='event_archive')
+    p.add_argument('--period', choices=('month', 'day'), default='month')
+    p.add_argument('--hot-days', type=float, default=7)
+    p.add_argument('--keep-days', type=float, default=365)
+    p.add_argument('--archive', action='store_true', help="gzip de las particiones expiradas en vez de borrarlas")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    r = EventRetention(args.db, args.dir, args.table, args.period, args.hot_days, args.keep_days, args.archive)
+    moved = r.run_once()
+    print(f"{moved} events moved, partitions: {', '.join(r.partitions()) or '-'}")
+    r.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+# event_stream.py
+import os
+import json
+import time
+import socket
+import logging
+import selectors
+import threading
+from urllib.parse import urlsplit, parse_qs
+from prometheus_client import Counter, Gauge
+
+log = logging.getLogger("collector.stream")
+
+STREAM_SUBSCRIBERS = Gauge('noc_stream_subscribers', 'Connected event stream subscribers')
+STREAM_EVENTS = Counter('noc_stream_events_total', 'Events published to the stream', ['type'])
+STREAM_DROPPED = Counter('noc_stream_dropped_total', 'Subscribers disconnected for falling too far behind')
+
+_RESPONSE = (b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+             b"Connection: keep-alive\r\nX-Accel-Buffering: no\r\n")
+_PING = b": ping\n\n"
+
+
+def _error(status):
+    return f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode()
+
+
+class BroadcastBuffer:
+    """Ring of the last `size` published events, shared by every subscriber.
+
+    Each event is serialized once into its SSE frame (`id: <epoch>-<seq>`);
+    subscribers only keep the seq they have sent up to, so fan-out costs no
+    per-client copy of the data and no database query. The epoch changes
+    with every collector start, so a Last-Event-ID from a previous run is
+    recognized as a gap.
+    """
+
+    def __init__(self, size=10000):
+        self.size = size
+        self.epoch = int(time.time())
+        self._ring = [None] * size  # seq % size -> (seq, type, device, state, frame)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def subscribe(self, fn):
+        """Call fn() (no arguments) after every publish."""
+        self._listeners.append(fn)
+
+    def publish(self, type_, data, device=None, state=None):
+        """Append one event; returns its seq."""
+        body = json.dumps(data, separators=(',', ':'), default=str)
+        with self._lock:
+            seq = self._seq + 1
+            frame = f"id: {self.epoch}-{seq}\nevent: {type_}\ndata: {body}\n\n".encode()
+            self._ring[seq % self.size] = (seq, type_, device, state, frame)
+            self._seq = seq
+        STREAM_EVENTS.labels(type=type_).inc()
+        for fn in self._listeners:
+            fn()
+        return seq
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def since(self, seq):
+        """(events after `seq`, gap) where gap means some of them already
+        left the ring."""
+        with self._lock:
+            last = self._seq
+            first = max(seq + 1, last - self.size + 1, 1)
+            return [self._ring[s % self.size] for s in range(first, last + 1)], first > seq + 1
+
+    def resume_point(self, last_event_id):
+        """Seq to continue after for a Last-Event-ID, and whether events were
+        missed (unknown id or from another run)."""
+        if not last_event_id:
+            return self._seq, False
+        epoch, _, seq = last_event_id.partition('-')
+        try:
+            epoch, seq = int(epoch), int(seq)
+        except ValueError:
+            return 0, True
+        if epoch != self.epoch or seq > self._seq:
+            return 0, True
+        return seq, False
+
+
+class _Subscriber:
+    __slots__ = ('sock', 'inbuf', 'out', 'cursor', 'devices', 'states', 'types', 'streaming', 'last_write',
+                 'mask')
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbuf = b''
+        self.out = bytearray()
+        self.cursor = 0
+        self.devices = self.states = self.types = None
+        self.streaming = False
+        self.last_write = time.monotonic()
+        self.mask = selectors.EVENT_READ
+
+    def wants(self, type_, device, state):
+        return ((self.types is None or type_ in self.types)
+                and (self.devices is None or device in self.devices)
+                and (self.states is None or state in self.states))
+
+
+class StreamServer:
+    """Server-Sent Events endpoint (GET /api/v1/stream) on its own port.
+
+    One selector thread serves every subscriber with non-blocking sockets,
+    so a connection costs a socket, a cursor and its unsent bytes rather
+    than a thread. Query filters (comma separated): device, state (only
+    transitions carry one), type (transition, rates). Reconnecting clients
+    resume from Last-Event-ID (header or ?last_event_id=); if the ring no
+    longer holds what they missed a `reset` event tells them to reload over
+    the REST API. Subscribers more than `max_pending` bytes behind are
+    disconnected.
+
+    With an `api_key` (by default the API_KEY of api_server) clients must
+    send it as X-API-Key or ?api_key= (EventSource cannot set headers).
+    Cross-origin access is only granted to `allow_origin`.
+    """
+
+    path = '/api/v1/stream'
+
+    def __init__(self, buffer=None, port=9103, addr='0.0.0.0', keepalive=15.0, max_pending=256 * 1024,
+                 api_key=None, allow_origin=None):
+        self.buffer = buffer or BroadcastBuffer()
+        self.keepalive = keepalive
+        self.max_pending = max_pending
+        self.api_key = api_key
+        self._response = (_RESPONSE + (f"Access-Control-Allow-Origin: {allow_origin}\r\n".encode()
+                                       if allow_origin else b"") + b"\r\nretry: 3000\n\n")
+        self._sel = selectors.DefaultSelector()
+        self._lsock = socket.create_server((addr, port), backlog=1024, reuse_port=False)
+        self._lsock.setblocking(False)
+        self.port = self._lsock.getsockname()[1]
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._woken = False  # a wake byte is pending; only changed under _wake_lock
+        self._wake_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._clients = {}  # fileno -> _Subscriber
+        self._thread = None
+        self._sel.register(self._lsock, selectors.EVENT_READ, 'accept')
+        self._sel.register(self._wake_r, selectors.EVENT_READ, 'wake')
+        self.buffer.subscribe(self._wake)
+
+    @classmethod
+    def from_config(cls, config):
+        """Server for config['stream'], or None when it is not enabled."""
+        s = (config or {}).get('stream', {}) or {}
+        if not s.get('enabled', False):
+            return None
+        return cls(BroadcastBuffer(int(s.get('buffer', 10000))), port=int(s.get('port', 9103)),
+                   addr=s.get('listen_addr', '0.0.0.0'), keepalive=float(s.get('keepalive', 15)),
+                   max_pending=int(s.get('max_pending', 256 * 1024)),
+                   api_key=s.get('api_key') or os.environ.get('API_KEY'), allow_origin=s.get('allow_origin'))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="event-stream")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def subscribers(self):
+        return sum(1 for c in list(self._clients.values()) if c.streaming)
+
+    def _wake(self):
+        with self._wake_lock:
+            if self._woken:
+                return
+            self._woken = True
+            try:
+                self._wake_w.send(b'\0')
+            except (BlockingIOError, OSError):
+                pass
+
+    def _run(self):
+        next_ping = time.monotonic() + self.keepalive
+        try:
+            while not self._stop.is_set():
+                for key, mask in self._sel.select(timeout=1.0):
+                    if key.data == 'accept':
+                        self._accept()
+                    elif key.data == 'wake':
+                        self._drain_wake()
+                        pending = {}  # subscribers at the same cursor share one ring read
+                        for c in list(self._clients.values()):
+                            if c.streaming:
+                                self._pump(c, pending)
+                    else:
+                        if mask & selectors.EVENT_READ:
+                            self._read(key.data)
+                        if mask & selectors.EVENT_WRITE:
+                            self._flush(key.data)
+                now = time.monotonic()
+                if now >= next_ping:
+                    next_ping = now + self.keepalive
+                    for c in list(self._clients.values()):
+                        if c.streaming and not c.out and now - c.last_write >= self.keepalive:
+                            c.out += _PING
+                            self._flush(c)
+        finally:
+            for c in list(self._clients.values()):
+                self._close(c)
+            self._sel.close()
+            self._lsock.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _drain_wake(self):
+        # drain and clear together: a wake in between would otherwise have its
+        # byte drained while the flag stays set, and no later wake would send one
+        with self._wake_lock:
+            try:
+                while self._wake_r.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
+            self._woken = False
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._lsock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            c = _Subscriber(sock)
+            self._clients[sock.fileno()] = c
+            self._sel.register(sock, selectors.EVENT_READ, c)
+
+    def _read(self, c):
+        try:
+            data = c.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(c)
+            return
+        if c.streaming:
+            return  # nothing expected from the client once streaming
+        c.inbuf += data
+        if b'\r\n\r\n' not in c.inbuf:
+            if len(c.inbuf) > 8192:
+                self._reject(c, '431 Request Header Fields Too Large')
+            return
+        self._start(c, c.inbuf.split(b'\r\n\r\n', 1)[0].decode('latin-1'))
+        c.inbuf = b''
+
+    def _start(self, c, head):
+        lines = head.split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) < 2 or parts[0] != 'GET':
+            return self._reject(c, '405 Method Not Allowed')
+        url = urlsplit(parts[1])
+        if url.path != self.path:
+            return self._reject(c, '404 Not Found')
+        headers = {}
+        for line in lines[1:]:
+            k, _, v = line.partition(':')
+            headers[k.strip().lower()] = v.strip()
+        query = parse_qs(url.query)
+
+        def arg(name):
+            return query.get(name, [None])[-1]
+
+        if self.api_key and self.api_key not in (headers.get('x-api-key'), arg('api_key')):
+            return self._reject(c, '401 Unauthorized')
+        for attr, name, upper in (('devices', 'device', False), ('states', 'state', True), ('types', 'type', False)):
+            v = arg(name)
+            if v:
+                setattr(c, attr, frozenset(x.upper() if upper else x for x in v.split(',') if x))
+        c.cursor, gap = self.buffer.resume_point(headers.get('last-event-id') or arg('last_event_id'))
+        c.streaming = True
+        STREAM_SUBSCRIBERS.inc()
+        c.out += self._response
+        if gap:
+            c.out += b"event: reset\ndata: {}\n\n"
+        self._pump(c)
+
+    def _pump(self, c, pending=None):
+        if pending is None:
+            events, gap = self.buffer.since(c.cursor)
+        else:
+            got = pending.get(c.cursor)
+            if got is None:
+                got = pending[c.cursor] = self.buffer.since(c.cursor)
+            events, gap = got
+        if gap:
+            c.out += b"event: reset\ndata: {}\n\n"
+        for seq, type_, device, state, frame in events:
+            if c.wants(type_, device, state):
+                c.out += frame
+        if events:
+            c.cursor = events[-1][0]
+        if len(c.out) > self.max_pending:
+            STREAM_DROPPED.inc()
+            log.warning("stream subscriber too slow, disconnecting (%d bytes pending)", len(c.out))
+            self._close(c)
+            return
+        self._flush(c)
+
+    def _flush(self, c):
+        if c.out:
+            try:
+                n = c.sock.send(c.out)
+            except (BlockingIOError, InterruptedError):
+                n = 0
+            except OSError:
+                self._close(c)
+                return
+            del c.out[:n]
+            c.last_write = time.monotonic()
+        if c.sock.fileno() < 0:
+            return
+        mask = selectors.EVENT_READ | (selectors.EVENT_WRITE if c.out else 0)
+        if mask != c.mask:
+            c.mask = mask
+            self._sel.modify(c.sock, mask, c)
+        if not c.out and not c.streaming:
+            self._close(c)  # error response sent
+
+    def _reject(self, c, status):
+        c.out += _error(status)
+        self._flush(c)
+
+    def _close(self, c):
+        if self._clients.pop(c.sock.fileno(), None) is None:
+            return
+        if c.streaming:
+            STREAM_SUBSCRIBERS.dec()
+        try:
+            self._sel.unregister(c.sock)
+        except (KeyError, ValueError):
+            pass
+        c.sock.close()
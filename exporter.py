@@ -0,0 +1,175 @@
+# exporter.py
+import gzip
+import logging
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from prometheus_client import Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.utils import floatToGoString
+
+log = logging.getLogger("collector.exporter")
+
+# numeric enum for noc_interface_state
+STATE_CODES = {'UP': 0, 'DEGRADED': 1, 'DOWN': 2, 'ADMIN_DOWN': 3}
+UNKNOWN_STATE = 4
+
+CYCLE_SECONDS = Histogram('noc_collector_cycle_seconds',
+                          'Time from dispatching a device poll until its result is persisted',
+                          buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 15, 30, 60))
+
+# (name, type, help) of the families rendered from the table; the first five
+# are per interface, the rest per device
+_FAMILIES = (
+    ('noc_interface_up', 'gauge', '1 if interface is up (UP), 0 otherwise'),
+    ('noc_interface_state', 'gauge', 'Interface state: 0=UP 1=DEGRADED 2=DOWN 3=ADMIN_DOWN 4=unknown'),
+    ('noc_interface_rx_bps', 'gauge', 'Interface rx bits/sec'),
+    ('noc_interface_tx_bps', 'gauge', 'Interface tx bits/sec'),
+    ('noc_interface_err_per_sec', 'gauge', 'Interface errors per second'),
+    ('noc_device_poll_seconds', 'gauge', 'Duration of the last poll of the device'),
+    ('noc_device_poll_success', 'gauge', '1 if the last poll of the device succeeded'),
+    ('noc_device_poll_failures_total', 'counter', 'Failed polls of the device'),
+)
+_HEADERS = tuple(f"# HELP {n} {h}\n# TYPE {n} {t}\n" for n, t, h in _FAMILIES)
+
+
+def _escape(v):
+    return v.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+class InterfaceTable:
+    """Current-cycle interface and device-poll metrics, rendered at scrape time.
+
+    Each device's interface rows are replaced as a whole on update, so
+    interfaces that disappear stop being exported, and there is one series
+    per interface and metric: the state is a numeric value, not a label.
+    Exposition lines are formatted when a device is updated (in the classify
+    stage), so a scrape only joins per-device text instead of formatting
+    every sample through prometheus_client.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices = {}  # device -> tuple of 5 text chunks, one per interface family
+        self._polls = {}    # device -> [last poll seconds, last ok (1/0), failures total]
+        self._rows = {}     # device -> rows of the last update_device
+        self._const = ''    # rendered constant labels (e.g. shard="w1",) prefixed to every series
+
+    def set_const_labels(self, labels):
+        """Labels added to every series, e.g. {'shard': worker_id}; set before the first update."""
+        self._const = ''.join(f'{k}="{_escape(str(v))}",' for k, v in sorted(labels.items()))
+
+    def update_device(self, device, rows):
+        """Replace `device`'s interfaces with rows of (iface, state, rates or None),
+        rates being (rx_bps, tx_bps, err_rate, ...)."""
+        up, state_l, rx, tx, err = [], [], [], [], []
+        dev = f'{self._const}device="{_escape(device)}"'
+        for iface, state, rates in rows:
+            labels = f'{{{dev},iface="{_escape(iface)}"}} '
+            up.append(f"noc_interface_up{labels}{'1.0' if state == 'UP' else '0.0'}\n")
+            state_l.append(f"noc_interface_state{labels}{STATE_CODES.get(state, UNKNOWN_STATE)}.0\n")
+            if rates:
+                rx.append(f"noc_interface_rx_bps{labels}{floatToGoString(rates[0])}\n")
+                tx.append(f"noc_interface_tx_bps{labels}{floatToGoString(rates[1])}\n")
+                err.append(f"noc_interface_err_per_sec{labels}{floatToGoString(rates[2])}\n")
+        chunks = tuple(''.join(x) for x in (up, state_l, rx, tx, err))
+        with self._lock:
+            self._devices[device] = (len(up), chunks)
+            self._rows[device] = rows
+
+    def set_states(self, device, states):
+        """Change the state of some of `device`'s interfaces ({iface: state}),
+        keeping their last rates (link changes between counter polls)."""
+        with self._lock:
+            rows = self._rows.get(device)
+        if rows is not None:
+            self.update_device(device, [(i, states.get(i, s), r) for i, s, r in rows])
+
+    def observe_poll(self, device, seconds, ok=True):
+        with self._lock:
+            p = self._polls.get(device)
+            if p is None:
+                p = self._polls[device] = [0.0, 1, 0]
+            p[0] = seconds
+            p[1] = 1 if ok else 0
+            if not ok:
+                p[2] += 1
+
+    def remove_device(self, device):
+        with self._lock:
+            self._devices.pop(device, None)
+            self._polls.pop(device, None)
+            self._rows.pop(device, None)
+
+    def retain_devices(self, devices):
+        """Drop every device not in `devices` (e.g. removed from the config)."""
+        keep = set(devices)
+        with self._lock:
+            for d in [d for d in self._devices if d not in keep]:
+                del self._devices[d]
+                self._rows.pop(d, None)
+            for d in [d for d in self._polls if d not in keep]:
+                del self._polls[d]
+
+    def series(self):
+        """Number of exported interfaces."""
+        with self._lock:
+            return sum(n for n, _ in self._devices.values())
+
+    def render(self):
+        """Exposition text of every table family."""
+        with self._lock:
+            chunks = [c for _, c in self._devices.values()]
+            polls = [(f'{self._const}device="{_escape(d)}"', p[0], p[1], p[2]) for d, p in self._polls.items()]
+        out = []
+        for k in range(5):
+            out.append(_HEADERS[k])
+            out.extend(c[k] for c in chunks)
+        out.append(_HEADERS[5])
+        out.extend(f'noc_device_poll_seconds{{{d}}} {floatToGoString(s)}\n' for d, s, _, _ in polls)
+        out.append(_HEADERS[6])
+        out.extend(f'noc_device_poll_success{{{d}}} {ok}.0\n' for d, _, ok, _ in polls)
+        out.append(_HEADERS[7])
+        out.extend(f'noc_device_poll_failures_total{{{d}}} {n}.0\n' for d, _, _, n in polls)
+        return ''.join(out).encode('utf-8')
+
+
+TABLE = InterfaceTable()
+
+
+def scrape(table=TABLE, registry=REGISTRY):
+    """Full /metrics body: the table plus everything in the prometheus_client registry."""
+    return table.render() + generate_latest(registry)
+
+
+def start_http_server(port, addr='0.0.0.0', table=TABLE, registry=REGISTRY, routes=None):
+    """Serve scrape() on /metrics from a daemon thread; returns the server.
+    `routes` maps extra paths to fn(query, headers) -> (status, content type, body)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.partition('?')
+            route = (routes or {}).get(path)
+            if route is not None:
+                try:
+                    status, ctype, body = route(parse_qs(query), self.headers)
+                except Exception as e:
+                    log.exception("%s failed: %s", path, e)
+                    status, ctype, body = 500, 'text/plain', b'internal error\n'
+            else:
+                status, ctype, body = 200, CONTENT_TYPE_LATEST, scrape(table, registry)
+            self.send_response(status)
+            self.send_header('Content-Type', ctype)
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body, compresslevel=1)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
@@ -0,0 +1,102 @@
+# flap_tracker.py
+import base64
+import struct
+from array import array
+
+
+class FlapTracker:
+    """Link-down history of one interface in a fixed-size ring.
+
+    Each slot holds (ts, downs) for one poll that saw link-downs, so a port
+    that flapped a thousand times in one interval still takes one slot.
+    `count_within` scans at most `slots` entries (O(1) per interface). With
+    slots >= flaps_count the flapping decision is exact: if older slots
+    inside the window were overwritten, the count is already >= slots.
+    """
+    __slots__ = ('ts', 'downs', 'head')
+
+    SLOTS = 16
+
+    def __init__(self, slots=SLOTS):
+        self.ts = array('I', bytes(4 * slots))
+        self.downs = array('I', bytes(4 * slots))
+        self.head = 0  # next slot to write
+
+    def record(self, ts, count=1):
+        """Add `count` link-downs seen at `ts`."""
+        if count <= 0:
+            return
+        ts = int(ts)
+        last = (self.head - 1) % len(self.ts)
+        if self.downs[last] and self.ts[last] == ts:
+            self.downs[last] = min(0xFFFFFFFF, self.downs[last] + count)
+            return
+        self.ts[self.head] = ts
+        self.downs[self.head] = min(0xFFFFFFFF, count)
+        self.head = (self.head + 1) % len(self.ts)
+
+    def count_within(self, now, window):
+        """Link-downs recorded in the last `window` seconds before `now`."""
+        total = 0
+        for ts, n in zip(self.ts, self.downs):
+            if n and now - ts <= window:
+                total += n
+        return total
+
+    def __len__(self):
+        return sum(1 for n in self.downs if n)
+
+    def pack(self):
+        """Occupied slots, oldest first, as little-endian (ts, downs) uint32 pairs."""
+        size = len(self.ts)
+        pairs = []
+        for k in range(size):
+            i = (self.head + k) % size
+            if self.downs[i]:
+                pairs += (self.ts[i], self.downs[i])
+        return struct.pack(f'<{len(pairs)}I', *pairs)
+
+    @classmethod
+    def unpack(cls, data, slots=SLOTS):
+        t = cls(slots)
+        vals = struct.unpack(f'<{len(data) // 4}I', data)
+        for k in range(0, len(vals), 2):
+            t.record(vals[k], vals[k + 1])
+        return t
+
+    def to_text(self):
+        """Base64 of pack(); '' when there is nothing recorded."""
+        return base64.b64encode(self.pack()).decode('ascii')
+
+    @classmethod
+    def from_text(cls, text, slots=SLOTS):
+        if not text:
+            return cls(slots)
+        return cls.unpack(base64.b64decode(text), slots)
+
+    @classmethod
+    def from_downs_ts(cls, downs_ts, slots=SLOTS):
+        """Convert the legacy `downs_ts` list (one timestamp per down)."""
+        t = cls(slots)
+        for ts in sorted(downs_ts or []):
+            t.record(int(ts))
+        return t
+
+    @classmethod
+    def from_snapshot(cls, snap, slots=SLOTS):
+        """Tracker for a stored snapshot: `flaps` text, legacy `downs_ts`, or empty."""
+        snap = snap or {}
+        if 'flaps' in snap:
+            return cls.from_text(snap['flaps'], slots)
+        return cls.from_downs_ts(snap.get('downs_ts'), slots)
+
+
+def downs_within(value, now, window):
+    """Count downs in window from a FlapTracker, its text form or a legacy list."""
+    if not value:
+        return 0
+    if isinstance(value, str):
+        value = FlapTracker.from_text(value)
+    if isinstance(value, FlapTracker):
+        return value.count_within(now, window)
+    return sum(1 for x in value if now - x <= window)
@@ -0,0 +1,169 @@
+# fleet_summary.py
+import json
+import time
+import heapq
+import logging
+import threading
+
+log = logging.getLogger("collector.summary")
+
+
+class FleetSummary:
+    """Interface state counts and top talkers, kept up to date per device.
+
+    `update_device()` is called from the classify stage with a device's
+    classified interfaces; it replaces that device's counts and its own
+    top-`top_n` lists and adjusts the fleet counts by the difference, so
+    the cost is proportional to the device, never to the fleet. `render()`
+    merges the per-device top lists (at most top_n entries each) and
+    serializes the result; the collector does that once per housekeeping
+    tick and stores it for /api/v1/summary.
+    """
+
+    def __init__(self, top_n=10):
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._counts = {}    # device -> {state: n}
+        self._fleet = {}     # state -> n
+        self._errors = {}    # device -> [(err/s, iface)] best first
+        self._util = {}      # device -> [(utilization 0..1, iface)]
+        self._failed = {}    # device -> {'reason', 'since', 'failures'}
+        self._version = 0
+        self._rendered = None  # (version, text)
+
+    @classmethod
+    def from_config(cls, config):
+        s = (config or {}).get('summary', {}) or {}
+        if not s.get('enabled', True):
+            return None
+        return cls(top_n=int(s.get('top_n', 10)))
+
+    def update_device(self, device, rows):
+        """rows: (iface, state, rates or None, speed_mbps or None), rates being
+        (rx_bps, tx_bps, err_rate, ...). A successful poll also clears the
+        device from the failed list."""
+        counts, errors, util = {}, [], []
+        for iface, state, rates, speed in rows:
+            counts[state] = counts.get(state, 0) + 1
+            if rates:
+                if rates[2] > 0:
+                    errors.append((rates[2], iface))
+                if speed:
+                    util.append((max(rates[0], rates[1]) / (speed * 1e6), iface))
+        errors = heapq.nlargest(self.top_n, errors)
+        util = heapq.nlargest(self.top_n, util)
+        with self._lock:
+            self._apply(device, counts)
+            self._errors[device] = errors
+            self._util[device] = util
+            self._failed.pop(device, None)
+            self._version += 1
+
+    def move_states(self, device, moves):
+        """Count link changes between polls: moves are (old_state, new_state)
+        of interfaces of an already summarized device."""
+        with self._lock:
+            if device not in self._counts:
+                return
+            counts = dict(self._counts[device])
+            for old, new in moves:
+                if counts.get(old):
+                    counts[old] -= 1
+                    if not counts[old]:
+                        del counts[old]
+                counts[new] = counts.get(new, 0) + 1
+            self._apply(device, counts)
+            self._version += 1
+
+    def poll_failed(self, device, reason, ts=None):
+        with self._lock:
+            f = self._failed.get(device)
+            if f is None:
+                f = self._failed[device] = {'since': int(ts or time.time()), 'failures': 0}
+            f['reason'] = str(reason)
+            f['failures'] += 1
+            self._version += 1
+
+    def remove_device(self, device):
+        with self._lock:
+            self._apply(device, {})
+            self._counts.pop(device, None)
+            self._errors.pop(device, None)
+            self._util.pop(device, None)
+            self._failed.pop(device, None)
+            self._version += 1
+
+    def _apply(self, device, counts):
+        fleet = self._fleet
+        for state, n in self._counts.get(device, {}).items():
+            fleet[state] -= n
+            if not fleet[state]:
+                del fleet[state]
+        for state, n in counts.items():
+            fleet[state] = fleet.get(state, 0) + n
+        self._counts[device] = counts
+
+    def fleet_counts(self):
+        with self._lock:
+            return dict(self._fleet)
+
+    def snapshot(self, now=None):
+        """The summary as a dict (see README, /api/v1/summary)."""
+        # per-device dicts and lists are replaced, never mutated, by
+        # update_device, so references taken under the lock stay consistent
+        with self._lock:
+            fleet = dict(self._fleet)
+            counts = dict(self._counts)
+            errors = list(self._errors.items())
+            util = list(self._util.items())
+            failed = {d: dict(f) for d, f in self._failed.items()}
+        errors = _top(errors, self.top_n)
+        util = _top(util, self.top_n)
+        return {
+            'ts': int(now or time.time()),
+            'fleet': fleet,
+            'interfaces': sum(fleet.values()),
+            'devices': counts,
+            'top_errors': [{'device': d, 'iface': i, 'err_per_sec': round(v, 3)} for v, d, i in errors],
+            'top_utilization': [{'device': d, 'iface': i, 'utilization': round(v, 4)} for v, d, i in util],
+            'failed_polls': failed,
+        }
+
+    def render(self, now=None):
+        """(changed, JSON text); re-serializes only after an update."""
+        with self._lock:
+            version = self._version
+            cached = self._rendered
+        if cached is not None and cached[0] == version:
+            return False, cached[1]
+        text = json.dumps(self.snapshot(now), separators=(',', ':'))
+        self._rendered = (version, text)
+        return True, text
+
+
+def _top(per_device, n):
+    """Fleet top-n [(value, device, iface)] from per-device lists sorted best
+    first. The n-th best device maximum bounds the answer, so only devices
+    reaching it are expanded."""
+    best = heapq.nlargest(n, (lst[0][0] for _, lst in per_device if lst))
+    floor = best[-1] if len(best) == n else float('-inf')
+    return heapq.nlargest(n, ((v, d, i) for d, lst in per_device if lst and lst[0][0] >= floor
+                              for v, i in lst if v >= floor))
+
+
+def merge(bodies, top_n=10):
+    """Combine summaries from several collector shards (dicts) into one."""
+    out = {'ts': 0, 'fleet': {}, 'interfaces': 0, 'devices': {}, 'top_errors': [], 'top_utilization': [],
+           'failed_polls': {}}
+    for b in bodies:
+        out['ts'] = max(out['ts'], b['ts'])
+        for state, n in b['fleet'].items():
+            out['fleet'][state] = out['fleet'].get(state, 0) + n
+        out['interfaces'] += b['interfaces']
+        out['devices'].update(b['devices'])
+        out['failed_polls'].update(b['failed_polls'])
+        out['top_errors'].extend(b['top_errors'])
+        out['top_utilization'].extend(b['top_utilization'])
+    out['top_errors'] = heapq.nlargest(top_n, out['top_errors'], key=lambda e: e['err_per_sec'])
+    out['top_utilization'] = heapq.nlargest(top_n, out['top_utilization'], key=lambda e: e['utilization'])
+    return out
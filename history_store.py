@@ -0,0 +1,195 @@
+# history_store.py
+import time
+import sqlite3
+import logging
+import threading
+
+log = logging.getLogger("collector.history")
+
+# bucket width in seconds per resolution; 'raw' keeps every poll
+RESOLUTIONS = {'raw': 0, '1m': 60, '5m': 300, '1h': 3600}
+DEFAULT_RETENTION = {'raw': 2 * 86400, '1m': 7 * 86400, '5m': 35 * 86400, '1h': 400 * 86400}
+METRICS = ('rx_bps', 'tx_bps', 'err_rate', 'drop_rate')
+
+
+class HistoryStore:
+    """Append-only interface rate history with 1m/5m/1h rollups.
+
+    Rows are fixed-width numerics keyed by (series_id, ts) in WITHOUT ROWID
+    tables; `series` maps (device, iface) to its id, so every range query is
+    a single primary-key range scan. Rollups keep sum/count/max per bucket
+    and are merged with upserts, so they can be fed incrementally.
+    """
+
+    def __init__(self, path="iface_history.db", retention=None):
+        self.path = path
+        self.retention = dict(DEFAULT_RETENTION)
+        self.retention.update(retention or {})
+        self._lock = threading.Lock()
+        self._series = {}
+        self._pending = []  # (series_id, ts, rx_bps, tx_bps, err_rate, drop_rate)
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._init_db()
+
+    @classmethod
+    def from_config(cls, config):
+        h = (config or {}).get('history', {}) or {}
+        if not h.get('enabled', True):
+            return None
+        return cls(h.get('db_path', 'iface_history.db'), retention=h.get('retention'))
+
+    def _init_db(self):
+        con = self._con
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS series (
+            id INTEGER PRIMARY KEY,
+            device text NOT NULL,
+            iface text NOT NULL,
+            UNIQUE (device, iface)
+        )""")
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS history_raw (
+            series_id integer NOT NULL,
+            ts integer NOT NULL,
+            rx_bps real, tx_bps real, err_rate real, drop_rate real,
+            PRIMARY KEY (series_id, ts)
+        ) WITHOUT ROWID""")
+        for res in RESOLUTIONS:
+            if res == 'raw':
+                continue
+            con.execute(f"""
+            CREATE TABLE IF NOT EXISTS history_{res} (
+                series_id integer NOT NULL,
+                ts integer NOT NULL,
+                n integer NOT NULL,
+                rx_sum real, tx_sum real, err_sum real, drop_sum real,
+                rx_max real, tx_max real,
+                PRIMARY KEY (series_id, ts)
+            ) WITHOUT ROWID""")
+        con.commit()
+        self._series = {(d, i): sid for sid, d, i in con.execute("SELECT id, device, iface FROM series")}
+
+    def _series_id(self, device, iface):
+        sid = self._series.get((device, iface))
+        if sid is None:
+            with self._con:
+                self._con.execute("INSERT OR IGNORE INTO series(device, iface) VALUES (?,?)", (device, iface))
+            sid = self._con.execute("SELECT id FROM series WHERE device=? AND iface=?", (device, iface)).fetchone()[0]
+            self._series[(device, iface)] = sid
+        return sid
+
+    def append(self, device, iface, ts, rx_bps, tx_bps, err_rate, drop_rate):
+        """Buffer one sample; written by flush()."""
+        with self._lock:
+            self._pending.append((self._series_id(device, iface), int(ts),
+                                  float(rx_bps), float(tx_bps), float(err_rate), float(drop_rate)))
+
+    def flush(self):
+        """Write buffered samples and fold them into every rollup in one transaction.
+        A sample already stored for the same (series, ts), e.g. a replay, is
+        skipped, so rollups never count it twice. Returns samples written."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            with self._con:
+                insert = self._con.execute
+                rows = [r for r in rows if insert("INSERT OR IGNORE INTO history_raw VALUES (?,?,?,?,?,?)",
+                                                  r).rowcount]
+                for res, width in RESOLUTIONS.items():
+                    if width and rows:
+                        self._con.executemany(_UPSERT.format(res=res), _rollup(rows, width))
+        return len(rows)
+
+    def prune(self, now=None):
+        """Delete rows older than each resolution's retention. Returns rows deleted."""
+        now = int(now or time.time())
+        deleted = 0
+        with self._lock, self._con:
+            for res in RESOLUTIONS:
+                cutoff = now - int(self.retention[res])
+                cur = self._con.execute(f"DELETE FROM history_{res} WHERE ts < ?", (cutoff,))
+                deleted += cur.rowcount
+        return deleted
+
+    def pick_resolution(self, start, end, max_points=1500):
+        return pick_resolution(start, end, self.retention, max_points)
+
+    def query(self, device, iface, start, end, resolution=None):
+        """Rows between start and end (inclusive) for one interface, oldest first."""
+        with self._lock:
+            return select_history(self._con, device, iface, start, end, resolution, self.retention)
+
+    def close(self):
+        self.flush()
+        self._con.close()
+
+
+def pick_resolution(start, end, retention=None, max_points=1500):
+    """Finest resolution still retained for `start` that keeps the result under max_points."""
+    retention = retention or DEFAULT_RETENTION
+    span = max(1, end - start)
+    oldest = time.time() - start
+    for res, width in RESOLUTIONS.items():
+        if oldest > retention[res]:
+            continue
+        if span / max(width, 15) <= max_points:
+            return res
+    return '1h'
+
+
+def select_history(con, device, iface, start, end, resolution=None, retention=None):
+    """(resolution, rows) of one interface between start and end (inclusive),
+    oldest first; works on any connection, e.g. a read-only one."""
+    res = resolution or pick_resolution(start, end, retention)
+    if res not in RESOLUTIONS:
+        raise ValueError(f"unknown resolution {res}")
+    row = con.execute("SELECT id FROM series WHERE device=? AND iface=?", (device, iface)).fetchone()
+    if row is None:
+        return res, []
+    if res == 'raw':
+        cur = con.execute(
+            "SELECT ts, rx_bps, tx_bps, err_rate, drop_rate FROM history_raw "
+            "WHERE series_id=? AND ts BETWEEN ? AND ? ORDER BY ts", (row[0], start, end))
+        return res, [dict(zip(('ts',) + METRICS, r)) for r in cur]
+    cur = con.execute(
+        f"SELECT ts, rx_sum/n, tx_sum/n, err_sum/n, drop_sum/n, rx_max, tx_max FROM history_{res} "
+        "WHERE series_id=? AND ts BETWEEN ? AND ? ORDER BY ts", (row[0], start, end))
+    return res, [dict(zip(('ts',) + METRICS + ('rx_max', 'tx_max'), r)) for r in cur]
+
+
+_UPSERT = """
+INSERT INTO history_{res}(series_id, ts, n, rx_sum, tx_sum, err_sum, drop_sum, rx_max, tx_max)
+VALUES (?,?,?,?,?,?,?,?,?)
+ON CONFLICT(series_id, ts) DO UPDATE SET
+    n = n + excluded.n,
+    rx_sum = rx_sum + excluded.rx_sum,
+    tx_sum = tx_sum + excluded.tx_sum,
+    err_sum = err_sum + excluded.err_sum,
+    drop_sum = drop_sum + excluded.drop_sum,
+    rx_max = max(rx_max, excluded.rx_max),
+    tx_max = max(tx_max, excluded.tx_max)
+"""
+
+
+def _rollup(rows, width):
+    """Pre-aggregate samples per (series, bucket) before upserting."""
+    acc = {}
+    for sid, ts, rx, tx, err, drop in rows:
+        key = (sid, ts - ts % width)
+        a = acc.get(key)
+        if a is None:
+            acc[key] = [1, rx, tx, err, drop, rx, tx]
+        else:
+            a[0] += 1
+            a[1] += rx
+            a[2] += tx
+            a[3] += err
+            a[4] += drop
+            if rx > a[5]:
+                a[5] = rx
+            if tx > a[6]:
+                a[6] = tx
+    return [k + tuple(v) for k, v in acc.items()]
@@ -0,0 +1,246 @@
+# instrumentation.py
+import os
+import sys
+import hmac
+import math
+import time
+import json
+import signal
+import logging
+import threading
+from collections import deque
+from prometheus_client import Counter, Histogram
+
+log = logging.getLogger("collector.instrumentation")
+
+CYCLE_STAGE_SECONDS = Histogram('noc_cycle_stage_seconds', 'Per-device poll cycle time by stage', ['stage'],
+                                buckets=(.0001, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5,
+                                         5, 10, 30))
+SLOW_CYCLES = Counter('noc_slow_cycles_total', 'Device cycles slower than instrumentation.slow_after')
+
+# network (dispatch -> result), queue waits, classify_batch, exporter/summary
+# updates, StateStore writes, history, alert submission, event stream
+STAGES = ('poll', 'queue', 'classify', 'export', 'store', 'history', 'alert', 'stream')
+
+
+class CycleTimer:
+    """Stage times of one device cycle; `lap(stage)` charges the time since
+    the previous lap to `stage`."""
+    __slots__ = ('device', 'start', 'mark', 'stages')
+
+    def __init__(self, device, now):
+        self.device = device
+        self.start = self.mark = now
+        self.stages = {}
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self.mark)
+        self.mark = now
+
+
+class Instrumentation:
+    """Per-device, per-stage timing of every poll cycle.
+
+    The collector starts a CycleTimer when it dispatches a device; the
+    poll, classify and persist stages lap it and `finish()` observes the
+    stages into noc_cycle_stage_seconds. Cycles slower than `slow_after`
+    (default: the poll interval) are kept, with their breakdown, in a
+    window of the last `window`. When instrumentation is off the collector
+    holds None instead and every hook is a single `is not None` test.
+
+    The /debug routes on the metrics port are only served with an
+    `admin_token`, which requests must send as X-Admin-Token.
+    """
+
+    def __init__(self, slow_after=15.0, window=200, profile_dir='.', profile_hz=100, profile_seconds=30,
+                 admin_token=None):
+        self.slow_after = slow_after
+        self.admin_token = admin_token
+        self.slow = deque(maxlen=window)
+        self.profiler = SamplingProfiler(profile_hz)
+        self.profile_dir = profile_dir
+        self.profile_seconds = profile_seconds
+        self._timers = {}  # device -> CycleTimer in progress
+        self._lock = threading.Lock()
+        self._totals = {s: [0, 0.0, 0.0] for s in STAGES}  # stage -> [count, sum, max]
+        self._cycles = [0, 0.0, 0.0]
+        self._hist = {s: CYCLE_STAGE_SECONDS.labels(stage=s) for s in STAGES + ('total',)}
+
+    @classmethod
+    def from_config(cls, config):
+        """Instrumentation for config['instrumentation'], or None when off."""
+        c = (config or {}).get('instrumentation', {}) or {}
+        if not c.get('enabled', False):
+            return None
+        return cls(slow_after=float(c.get('slow_after', config.get('poll_interval', 15))),
+                   window=int(c.get('window', 200)), profile_dir=c.get('profile_dir', '.'),
+                   profile_hz=int(c.get('profile_hz', 100)), profile_seconds=float(c.get('profile_seconds', 30)),
+                   admin_token=c.get('admin_token'))
+
+    def dispatched(self, devices):
+        now = time.perf_counter()
+        for d in devices:
+            self._timers[d['name']] = CycleTimer(d['name'], now)
+
+    def emitter(self, emit):
+        """Wrap the pipeline's emit so the poll stage ends when a result arrives."""
+        def timed_emit(result):
+            t = self._timers.get(result['device'])
+            if t is not None and not result.get('listen'):
+                t.lap('poll')
+            emit(result)
+        return timed_emit
+
+    def timer(self, device):
+        return self._timers.get(device)
+
+    def finish(self, device, error=None):
+        """End `device`'s cycle (error: why the poll failed)."""
+        t = self._timers.pop(device, None)
+        if t is None:
+            return
+        total = time.perf_counter() - t.start
+        with self._lock:
+            for stage, v in t.stages.items():
+                tot = self._totals.setdefault(stage, [0, 0.0, 0.0])
+                tot[0] += 1
+                tot[1] += v
+                tot[2] = max(tot[2], v)
+            c = self._cycles
+            c[0] += 1
+            c[1] += total
+            c[2] = max(c[2], total)
+        for stage, v in t.stages.items():
+            h = self._hist.get(stage)
+            (h or CYCLE_STAGE_SECONDS.labels(stage=stage)).observe(v)
+        self._hist['total'].observe(total)
+        if total >= self.slow_after or error is not None:
+            if total >= self.slow_after:
+                SLOW_CYCLES.inc()
+            entry = {'device': device, 'ts': round(time.time(), 3), 'seconds': round(total, 4),
+                     'stages': {s: round(v, 4) for s, v in sorted(t.stages.items(), key=lambda kv: -kv[1])}}
+            if error is not None:
+                entry['error'] = str(error)
+            self.slow.append(entry)
+
+    def summary(self):
+        """Running per-stage totals and the slow-cycle window (newest first)."""
+        with self._lock:
+            cycles, total, worst = self._cycles
+            stages = {s: {'count': n, 'seconds': round(v, 3), 'max': round(m, 4),
+                          'share': round(v / total, 3) if total else 0.0}
+                      for s, (n, v, m) in self._totals.items() if n}
+        return {'cycles': cycles, 'seconds': round(total, 3), 'avg': round(total / cycles, 4) if cycles else None,
+                'max': round(worst, 4), 'slow_after': self.slow_after, 'stages': stages,
+                'in_flight': len(self._timers), 'slow': list(reversed(self.slow))}
+
+    # -- profiling --------------------------------------------------------
+
+    def profile_to_file(self, seconds=None):
+        """Profile in the background and write `<profile_dir>/profile-<ts>.folded`.
+        Returns the path, or None when a profile is already running."""
+        seconds = seconds or self.profile_seconds
+        path = os.path.join(self.profile_dir, f"profile-{int(time.time())}.folded")
+        if not self.profiler.acquire():
+            return None
+
+        def run():
+            try:
+                text = self.profiler.run(seconds, locked=True)
+                with open(path, 'w') as f:
+                    f.write(text)
+                log.warning("profile written to %s (%d stacks)", path, text.count('\n'))
+            except Exception as e:
+                log.exception("profiling failed: %s", e)
+
+        threading.Thread(target=run, daemon=True, name="profiler").start()
+        return path
+
+    def install_signal(self, signum=getattr(signal, 'SIGUSR1', None)):
+        """`kill -USR1 <pid>` profiles for profile_seconds. Only possible from
+        the main thread; returns whether the handler was installed."""
+        if signum is None:
+            return False
+        try:
+            signal.signal(signum, lambda *_: self.profile_to_file())
+        except ValueError:  # not the main thread (e.g. tests)
+            return False
+        return True
+
+    def routes(self):
+        """Admin endpoints for exporter.start_http_server, or None without an admin_token."""
+        if not self.admin_token:
+            return None
+        token = self.admin_token.encode()
+
+        def admin(fn):
+            def route(query, headers):
+                if not hmac.compare_digest((headers.get('X-Admin-Token') or '').encode(), token):
+                    return 401, 'text/plain', b'admin token required\n'
+                return fn(query)
+            return route
+
+        def cycles(query):
+            return 200, 'application/json', json.dumps(self.summary()).encode()
+
+        def profile(query):
+            # in the background like SIGUSR1: a request never holds a handler thread
+            try:
+                seconds = float(query.get('seconds', ['10'])[-1])
+            except ValueError:
+                seconds = math.nan
+            if not 0 < seconds <= 300:
+                return 400, 'text/plain', b'seconds must be a number in (0, 300]\n'
+            path = self.profile_to_file(seconds)
+            if path is None:
+                return 409, 'text/plain', b'profile already running\n'
+            return 202, 'application/json', json.dumps({'path': path, 'seconds': seconds}).encode()
+
+        return {'/debug/cycles': admin(cycles), '/debug/profile': admin(profile)}
+
+
+class SamplingProfiler:
+    """Samples every thread's Python stack `hz` times a second and returns
+    them folded (`thread;outer;...;inner count` per line), the input format
+    of flamegraph.pl, speedscope and inferno. Nothing runs between profiles."""
+
+    def __init__(self, hz=100):
+        self.interval = 1.0 / max(1, hz)
+        self._busy = threading.Lock()
+
+    def acquire(self):
+        return self._busy.acquire(blocking=False)
+
+    def run(self, seconds, locked=False):
+        if not locked and not self.acquire():
+            raise RuntimeError("profile already running")
+        try:
+            return self._sample(seconds)
+        finally:
+            self._busy.release()
+
+    def _sample(self, seconds):
+        me = threading.get_ident()
+        counts = {}
+        labels = {}  # code object -> frame label
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = (f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                                                f"{code.co_firstlineno})").replace(';', ':')
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(';', ':').replace(' ', '_'))
+                key = ';'.join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            time.sleep(self.interval)
+        return ''.join(f"{k} {v}\n" for k, v in sorted(counts.items()))
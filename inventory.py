@@ -0,0 +1,138 @@
+# inventory.py
+import json
+import sqlite3
+import logging
+
+log = logging.getLogger("collector.inventory")
+
+# columns the collector needs on top of the original devices table
+_EXTRA_COLUMNS = (('api_port', 'INTEGER'), ('role', 'TEXT'), ('options', 'TEXT'))
+
+
+def ensure_schema(con):
+    """Create/upgrade the devices table and its change log (idempotent).
+
+    Triggers append the id of every inserted, updated or deleted device to
+    device_changes, so readers fetch only rows changed since their last seq.
+    """
+    if not con.in_transaction:
+        con.execute("BEGIN IMMEDIATE")  # check-then-ALTER, atomic against other processes
+    con.execute('''CREATE TABLE IF NOT EXISTS devices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hostname TEXT,
+        ip TEXT NOT NULL,
+        username TEXT NOT NULL,
+        password TEXT NOT NULL,
+        enabled INTEGER DEFAULT 1,
+        created_ts INTEGER DEFAULT (strftime('%s','now'))
+    )''')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_devices_enabled ON devices(enabled)')
+    cols = {r[1] for r in con.execute("PRAGMA table_info(devices)")}
+    for col, typ in _EXTRA_COLUMNS:
+        if col not in cols:
+            con.execute(f"ALTER TABLE devices ADD COLUMN {col} {typ}")
+    con.execute('''CREATE TABLE IF NOT EXISTS device_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id INTEGER NOT NULL
+    )''')
+    for event, ref in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        con.execute(f'''CREATE TRIGGER IF NOT EXISTS devices_log_{event.lower()} AFTER {event} ON devices
+            BEGIN INSERT INTO device_changes(device_id) VALUES ({ref}.id); END''')
+    con.commit()
+
+
+def row_to_device(row):
+    """devices row -> collector device config (same keys as config['devices'])."""
+    did, hostname, ip, username, password, enabled, api_port, role, options = row
+    dev = json.loads(options) if options else {}
+    dev.update({'id': did, 'name': hostname or ip, 'host': ip, 'user': username, 'password': password})
+    if api_port:
+        dev['port'] = int(api_port)
+    if role:
+        dev['role'] = role
+    return dev, bool(enabled)
+
+
+_SELECT = "SELECT id, hostname, ip, username, password, enabled, api_port, role, options FROM devices"
+
+
+class DeviceInventory:
+    """Devices from the SQLite `devices` table, kept current incrementally.
+
+    `refresh()` costs one `PRAGMA data_version` while nobody else has
+    committed to the database; after a commit it reads only device_changes
+    entries newer than the last one seen and re-reads just those rows.
+    Static `base` devices (config['devices']) are merged under the table,
+    which wins on name clashes.
+    """
+
+    def __init__(self, path, base=None, keep_changes=10000):
+        self.path = path
+        self.base = {d['name']: d for d in (base or [])}
+        self.keep_changes = keep_changes
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA busy_timeout=30000")
+        ensure_schema(self._con)
+        self._by_id = {}  # id -> device config (enabled rows only)
+        self._data_version = None
+        self._seq = 0
+        self._load_all()
+
+    @classmethod
+    def from_config(cls, config):
+        """Inventory for config['inventory'], or None when it is not enabled."""
+        inv = (config or {}).get('inventory', {}) or {}
+        if not inv.get('enabled', False):
+            return None
+        return cls(inv.get('db_path') or config.get('db_path', 'iface_state.db'), base=config.get('devices'))
+
+    def _load_all(self):
+        con = self._con
+        self._data_version = con.execute("PRAGMA data_version").fetchone()[0]
+        self._seq = con.execute("SELECT coalesce(max(seq), 0) FROM device_changes").fetchone()[0]
+        self._by_id = {}
+        for row in con.execute(_SELECT):
+            dev, enabled = row_to_device(row)
+            if enabled:
+                self._by_id[dev['id']] = dev
+
+    def devices(self):
+        """Current device configs: static ones overlaid by enabled table rows."""
+        merged = dict(self.base)
+        for dev in self._by_id.values():
+            merged[dev['name']] = dev
+        return list(merged.values())
+
+    def refresh(self):
+        """Apply committed changes. Returns the number of device rows that changed."""
+        con = self._con
+        version = con.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return 0
+        self._data_version = version
+        changes = con.execute("SELECT seq, device_id FROM device_changes WHERE seq > ? ORDER BY seq",
+                              (self._seq,)).fetchall()
+        if not changes:
+            return 0
+        ids = list({did: None for _, did in changes})
+        if len(ids) > 500:
+            # bulk import: one full read is cheaper than a huge IN list
+            self._load_all()
+            log.info("inventory: reloaded after %d device changes", len(ids))
+            return len(ids)
+        self._seq = changes[-1][0]
+        rows = {r[0]: r for r in con.execute(f"{_SELECT} WHERE id IN ({','.join('?' * len(ids))})", ids)}
+        for did in ids:
+            row = rows.get(did)
+            dev, enabled = row_to_device(row) if row else (None, False)
+            if enabled:
+                self._by_id[did] = dev
+            else:
+                self._by_id.pop(did, None)
+        with con:
+            con.execute("DELETE FROM device_changes WHERE seq <= ?", (self._seq - self.keep_changes,))
+        log.info("inventory: %d device row(s) changed", len(ids))
+        return len(ids)
+
+    def close(self):
+        self._con.close()
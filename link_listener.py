@@ -0,0 +1,140 @@
+# link_listener.py
+import time
+import socket
+import logging
+import threading
+from prometheus_client import Counter, Gauge
+from connection_pool import DeviceBackoff
+
+log = logging.getLogger("collector.listen")
+
+LISTEN_EVENTS = Counter('noc_listen_events_total', 'Interface changes received over /interface/listen')
+LISTEN_SUBSCRIPTIONS = Gauge('noc_listen_subscriptions', 'Devices with an open /interface/listen')
+LISTEN_RESUBSCRIBES = Counter('noc_listen_resubscribes_total', 'Listen subscriptions lost and opened again')
+
+LISTEN_PROPLIST = 'name,running,disabled'
+
+
+def link_update(device, rows, now=None):
+    """Classify-stage input for listen rows of one device: like a poll
+    result but with only the changed link fields per interface and
+    `'listen': True` (see collector_api.classify_link_event)."""
+    ifaces = {}
+    for row in rows:
+        change = ifaces.setdefault(row['name'], {})
+        if 'running' in row:
+            change['carrier'] = row['running'] in ('true', True)
+        if 'disabled' in row:
+            change['disabled'] = row['disabled'] in ('true', True)
+    return {'device': device, 'listen': True, 'ts': int(now or time.time()), 'ifaces': ifaces}
+
+
+class LinkListener:
+    """Keeps `/interface/listen` open on every device for link changes.
+
+    Each device gets a thread holding its own session from the collector's
+    ConnectionManager (same reconnect backoff, keyed `<name>/listen` so it
+    never blocks a poll). Every running/disabled change is handed to
+    `emit()` at once as a link update, so transitions reach classification
+    and alerting without waiting for the next poll. Changes made while no
+    subscription was open are covered by `resync(name)` (the collector
+    polls the device right away) after each (re)subscribe.
+    """
+
+    def __init__(self, connections, emit, resync=None, poll_interval=60.0, retry=5.0, retry_max=300.0):
+        self.connections = connections
+        self.emit = emit
+        self.resync = resync
+        self.poll_interval = poll_interval
+        self.retry = retry
+        self.retry_max = retry_max
+        self._lock = threading.Lock()
+        self._workers = {}  # name -> (cfg, stop Event, thread)
+        self._live = {}     # name -> Session while subscribed
+
+    @classmethod
+    def from_config(cls, config, connections, emit, resync=None):
+        """Listener for config['listen'], or None when it is not enabled."""
+        c = (config or {}).get('listen', {}) or {}
+        if not c.get('enabled', False):
+            return None
+        return cls(connections, emit, resync, poll_interval=float(c.get('poll_interval', 60)),
+                   retry=float(c.get('retry', 5)), retry_max=float(c.get('retry_max', 300)))
+
+    def sync(self, devices):
+        """Listen on exactly `devices`; changed configs re-subscribe."""
+        wanted = {d['name']: d for d in devices}
+        with self._lock:
+            stale = [n for n, (cfg, _, _) in self._workers.items() if wanted.get(n) != cfg]
+        for name in stale:
+            self._stop(name)
+        with self._lock:
+            for name, cfg in wanted.items():
+                if name not in self._workers:
+                    stop = threading.Event()
+                    t = threading.Thread(target=self._run, args=(cfg, stop), daemon=True, name=f"listen-{name}")
+                    self._workers[name] = (cfg, stop, t)
+                    t.start()
+
+    def subscribed(self):
+        with self._lock:
+            return len(self._live)
+
+    def stop(self):
+        with self._lock:
+            names = list(self._workers)
+        for name in names:
+            self._stop(name)
+
+    def _stop(self, name):
+        with self._lock:
+            _, stop, t = self._workers.pop(name)
+            sess = self._live.get(name)
+        stop.set()
+        if sess is not None:
+            # a blocked recv() is only woken by shutting the socket down
+            try:
+                sess.pool.socket.socket.shutdown(socket.SHUT_RDWR)
+            except (AttributeError, OSError):
+                pass
+        t.join(timeout=5)
+
+    def _run(self, dev_cfg, stop):
+        name = dev_cfg['name']
+        listen_cfg = dict(dev_cfg, name=f"{name}/listen")
+        skip = set(dev_cfg.get('disabled_ifaces', []) or [])
+        failures = 0
+        while not stop.is_set():
+            try:
+                with self.connections.session(listen_cfg) as sess:
+                    sess.pool.set_timeout(None)  # idle listens are normal; TCP keepalive finds dead peers
+                    rows = sess.api.get_resource('/interface').call_async('listen', {'.proplist': LISTEN_PROPLIST})
+                    with self._lock:
+                        self._live[name] = sess
+                    LISTEN_SUBSCRIPTIONS.inc()
+                    try:
+                        if self.resync is not None:
+                            self.resync(name)
+                        failures = 0
+                        for row in rows:
+                            if stop.is_set():
+                                break
+                            if row.get('name') and row['name'] not in skip and '.dead' not in row:
+                                LISTEN_EVENTS.inc()
+                                self.emit(link_update(name, [row]))
+                    finally:
+                        LISTEN_SUBSCRIPTIONS.dec()
+                        with self._lock:
+                            self._live.pop(name, None)
+            except DeviceBackoff:
+                pass
+            except Exception as e:
+                if not stop.is_set():
+                    log.warning("%s: interface listen failed: %s", name, e)
+            # the session still carries the listen (or is dead): never reuse it
+            self.connections.invalidate(listen_cfg['name'])
+            if stop.is_set():
+                break
+            failures += 1
+            LISTEN_RESUBSCRIBES.inc()
+            stop.wait(min(self.retry_max, self.retry * 2 ** (failures - 1)))
@@ -1,22 +1,17 @@
 # simple migration script to create tables for multi-tenant event store
-import sqlite3, os
+#   python migrate_saas.py --tenant-key acme   # also issue a read key for tenant acme
+import sqlite3, os, secrets, argparse
+from tenant_store import ensure_schema, set_api_key
 DB = os.environ.get('SAAS_DB', 'saas.db')
+p = argparse.ArgumentParser(description="Create/upgrade the multi-tenant tables")
+p.add_argument('--tenant-key', metavar='TENANT', help="issue a new API read key for this tenant (replaces the old one)")
+args = p.parse_args()
 con = sqlite3.connect(DB)
-cur = con.cursor()
-cur.execute('''CREATE TABLE IF NOT EXISTS tenants (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT UNIQUE NOT NULL,
-    created_ts INTEGER DEFAULT (strftime('%s','now'))
-)''')
-cur.execute('''CREATE TABLE IF NOT EXISTS events (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    tenant_id INTEGER,
-    device TEXT,
-    iface TEXT,
-    ts INTEGER,
-    event TEXT,
-    FOREIGN KEY(tenant_id) REFERENCES tenants(id)
-)''')
-con.commit()
+# tenants/events plus the (tenant_id, ts) and (tenant_id, device, iface, ts) indexes
+ensure_schema(con)
+if args.tenant_key:
+    key = secrets.token_urlsafe(24)
+    tid = set_api_key(con, args.tenant_key, key)
+    print(f"tenant {args.tenant_key} (id {tid}) key: {key}")
 con.close()
 print("Migrations applied to", DB)
@@ -0,0 +1,94 @@
+# pipeline.py
+import time
+import queue
+import logging
+import threading
+from prometheus_client import Gauge, Histogram
+
+log = logging.getLogger("collector.pipeline")
+
+STAGE_SECONDS = Histogram('noc_pipeline_stage_seconds', 'Per-device time spent in each collector stage', ['stage'],
+                          buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+QUEUE_DEPTH = Gauge('noc_pipeline_queue_depth', 'Items waiting between collector stages', ['queue'])
+
+_STOP = object()
+
+
+class Pipeline:
+    """poll -> classify -> persist, one device result at a time.
+
+    Pollers hand each device result to `emit()` as soon as it is ready; a
+    classify thread and a persist thread drain bounded queues, so a slow
+    router only delays itself and a slow stage pushes back on the one
+    before it instead of buffering without limit.
+
+    `persist_idle` runs whenever the persist queue runs dry (group commit:
+    one transaction per burst of results rather than one per row).
+    """
+
+    def __init__(self, classify, persist, queue_size=64, persist_idle=None):
+        self._classify = classify
+        self._persist = persist
+        self._persist_idle = persist_idle
+        self.classify_q = queue.Queue(maxsize=queue_size)
+        self.persist_q = queue.Queue(maxsize=queue_size)
+        self._threads = [
+            threading.Thread(target=self._run, args=('classify', self.classify_q, self._do_classify),
+                             name="pipeline-classify", daemon=True),
+            threading.Thread(target=self._run, args=('persist', self.persist_q, self._persist, self._persist_idle),
+                             name="pipeline-persist", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def emit(self, result):
+        """Queue one poll result; blocks while the classify stage is full."""
+        self.classify_q.put(result)
+        QUEUE_DEPTH.labels(queue='classify').set(self.classify_q.qsize())
+
+    def _do_classify(self, result):
+        item = self._classify(result)
+        if item is not None:
+            self.persist_q.put(item)
+            QUEUE_DEPTH.labels(queue='persist').set(self.persist_q.qsize())
+
+    def _run(self, stage, q, fn, idle=None):
+        hist = STAGE_SECONDS.labels(stage=stage)
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    return
+                t0 = time.perf_counter()
+                try:
+                    fn(item)
+                except Exception as e:
+                    log.exception("%s stage failed: %s", stage, e)
+                hist.observe(time.perf_counter() - t0)
+                if idle is not None and q.empty():
+                    t0 = time.perf_counter()
+                    try:
+                        idle()
+                    except Exception as e:
+                        log.exception("%s idle hook failed: %s", stage, e)
+                    STAGE_SECONDS.labels(stage='commit').observe(time.perf_counter() - t0)
+            finally:
+                q.task_done()
+
+    def drain(self):
+        """Block until everything emitted so far went through every stage."""
+        self.classify_q.join()
+        self.persist_q.join()
+
+    def run_cycle(self, devices, source):
+        """Run `source(devices, emit)` and wait for its results to be persisted."""
+        source(devices, self.emit)
+        self.drain()
+
+    def close(self):
+        self.drain()
+        self.classify_q.put(_STOP)
+        self.classify_q.join()
+        self.persist_q.put(_STOP)
+        for t in self._threads:
+            t.join(timeout=5)
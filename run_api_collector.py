@@ -1,10 +1,27 @@
 # run_api_collector.py
+import copy
 import json
 import sys
 import argparse
+import multiprocessing
 from dotenv import load_dotenv
 from collector_api import start_collector
 
+
+def shard_config(cfg, worker_id, index=0):
+    """Copy of cfg with sharding on for `worker_id`; the i-th local worker
+    exports Prometheus on port + i."""
+    cfg = copy.deepcopy(cfg)
+    sharding = cfg.setdefault('sharding', {})
+    sharding['enabled'] = True
+    sharding['worker_id'] = worker_id
+    prom = cfg.get('prometheus') or {}
+    if prom.get('enabled') and index:
+        prom['port'] = int(prom.get('port') or prom.get('listen_port') or 8000) + index
+        prom.pop('listen_port', None)
+    return cfg
+
+
 def main():
     # load environment variables from .env (if present)
     load_dotenv()
@@ -12,10 +29,29 @@ def main():
     parser = argparse.ArgumentParser(description="MikroTik NOC collector")
     parser.add_argument("--config", "-c", default="mi_config.json",
                         help="Ruta al archivo de configuración JSON (default: mi_config.json)")
+    parser.add_argument("--worker-id", help="Activa el modo shard con este id de worker")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Lanza N workers locales que se reparten los equipos")
     args = parser.parse_args()
     cfg_path = args.config
     with open(cfg_path, 'r', encoding='utf-8') as f:
         cfg = json.load(f)
+    if args.workers > 1:
+        base = args.worker_id or "w"
+        ctx = multiprocessing.get_context("spawn")
+        procs = [ctx.Process(target=start_collector, args=(shard_config(cfg, f"{base}{i}", i),),
+                             name=f"collector-{base}{i}") for i in range(args.workers)]
+        for p in procs:
+            p.start()
+        try:
+            for p in procs:
+                p.join()
+        except KeyboardInterrupt:
+            for p in procs:
+                p.join()
+        sys.exit(max(p.exitcode or 0 for p in procs))
+    if args.worker_id:
+        cfg = shard_config(cfg, args.worker_id)
     start_collector(cfg)
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+# scheduler.py
+import time
+import heapq
+import zlib
+import logging
+import threading
+from prometheus_client import Counter, Gauge, Histogram
+
+log = logging.getLogger("collector.scheduler")
+
+SCHEDULE_LAG = Histogram('noc_schedule_lag_seconds', 'Delay between a device poll deadline and its dispatch',
+                         buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+MISSED_DEADLINES = Counter('noc_schedule_missed_deadlines_total',
+                           'Poll deadlines skipped because the previous poll of the device had not finished')
+IN_FLIGHT = Gauge('noc_schedule_in_flight', 'Devices being polled or waiting in the pipeline')
+FAST_DEVICES = Gauge('noc_schedule_fast_devices', 'Devices on the fast interval because of non-UP interfaces')
+
+
+class _Entry:
+    __slots__ = ('cfg', 'interval', 'deadline', 'gen', 'in_flight', 'fast', 'dispatched')
+
+    def __init__(self, cfg, interval, deadline):
+        self.cfg = cfg
+        self.interval = interval
+        self.deadline = deadline
+        self.gen = 0
+        self.in_flight = False
+        self.fast = False
+        self.dispatched = None
+
+
+class PollScheduler:
+    """Per-device poll timers on a heap.
+
+    Every device has its own deadline; deadlines advance by the device's
+    interval from the previous deadline (not from when the poll finished),
+    so overruns do not make the whole fleet drift. A device is not
+    dispatched again until `done()` is called for it; deadlines that pass
+    meanwhile are skipped and counted as missed.
+
+    Interval, first match wins: the device's own `poll_interval`, its
+    `role` in `tiers`, `default_interval` (`listen.poll_interval` when link
+    changes come from /interface/listen instead). First deadlines are spread over
+    one interval by a hash of the device name. While `done(..., fast=True)`
+    reports unsettled interfaces the device uses `fast_interval` instead.
+    """
+
+    def __init__(self, default_interval=15, tiers=None, fast_interval=None, clock=time.monotonic):
+        self.default_interval = float(default_interval)
+        self.tiers = {k: float(v) for k, v in (tiers or {}).items()}
+        self.fast_interval = float(fast_interval) if fast_interval else None
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}  # name -> _Entry
+        self._heap = []     # (deadline, name, gen); stale when gen differs from the entry
+        self._n_in_flight = 0
+        self._n_fast = 0
+
+    @classmethod
+    def from_config(cls, config):
+        s = (config or {}).get('schedule', {}) or {}
+        default = s.get('default_interval', config.get('poll_interval', 15))
+        listen = config.get('listen', {}) or {}
+        if listen.get('enabled'):
+            default = listen.get('poll_interval', 60)  # counters (rates) only
+        return cls(default_interval=float(default),
+                   tiers=s.get('tiers'), fast_interval=s.get('fast_interval'))
+
+    def interval_for(self, cfg, fast=False):
+        base = cfg.get('poll_interval') or self.tiers.get(cfg.get('role')) or self.default_interval
+        base = float(base)
+        if fast and self.fast_interval:
+            return min(base, self.fast_interval)
+        return base
+
+    def _push(self, name, e):
+        e.gen += 1
+        heapq.heappush(self._heap, (e.deadline, name, e.gen))
+
+    def sync(self, devices):
+        """Make the scheduled set match `devices`. New devices get a spread first
+        deadline; changed ones keep their timer with the new config and interval;
+        missing ones are dropped. Returns (added, updated, removed) names."""
+        now = self.clock()
+        seen = set()
+        added, updated = [], []
+        with self._lock:
+            for cfg in devices:
+                name = cfg['name']
+                seen.add(name)
+                e = self._entries.get(name)
+                if e is None:
+                    interval = self.interval_for(cfg)
+                    offset = (zlib.crc32(name.encode()) % 1000) / 1000.0 * interval
+                    e = self._entries[name] = _Entry(cfg, interval, now + offset)
+                    self._push(name, e)
+                    added.append(name)
+                elif e.cfg != cfg:
+                    e.cfg = cfg
+                    interval = self.interval_for(cfg, e.fast)
+                    if interval != e.interval:
+                        e.deadline = min(e.deadline, now + interval)
+                        e.interval = interval
+                        if not e.in_flight:
+                            self._push(name, e)
+                    updated.append(name)
+            removed = [n for n in self._entries if n not in seen]
+            for n in removed:
+                e = self._entries.pop(n)
+                self._n_in_flight -= e.in_flight
+                self._n_fast -= e.fast
+            self._gauges()
+        return added, updated, removed
+
+    def pop_due(self, now=None):
+        """Device configs whose deadline has passed; they are in flight until done()."""
+        now = self.clock() if now is None else now
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, name, gen = heapq.heappop(self._heap)
+                e = self._entries.get(name)
+                if e is None or e.gen != gen or e.in_flight:
+                    continue
+                e.in_flight = True
+                e.dispatched = now
+                self._n_in_flight += 1
+                SCHEDULE_LAG.observe(now - deadline)
+                due.append(e.cfg)
+            self._gauges()
+        return due
+
+    def done(self, name, fast=False, now=None):
+        """Poll of `name` finished (successfully or not); schedule its next deadline.
+        `fast` switches the device to fast_interval until a later done() clears it.
+        Returns seconds since the device was dispatched, or None."""
+        now = self.clock() if now is None else now
+        with self._lock:
+            e = self._entries.get(name)
+            if e is None:
+                return None
+            elapsed = now - e.dispatched if e.in_flight else None
+            fast = bool(fast and self.fast_interval)
+            self._n_in_flight -= e.in_flight
+            self._n_fast += fast - e.fast
+            e.in_flight = False
+            e.fast = fast
+            e.interval = self.interval_for(e.cfg, e.fast)
+            e.deadline += e.interval
+            if e.deadline <= now:
+                missed = int((now - e.deadline) // e.interval) + 1
+                MISSED_DEADLINES.inc(missed)
+                e.deadline += missed * e.interval
+            self._push(name, e)
+            self._gauges()
+        return elapsed
+
+    def poke(self, name, now=None):
+        """Make `name` due now (e.g. after link changes may have been missed).
+        No-op while it is in flight; returns whether it was moved."""
+        now = self.clock() if now is None else now
+        with self._lock:
+            e = self._entries.get(name)
+            if e is None or e.in_flight or e.deadline <= now:
+                return False
+            e.deadline = now
+            self._push(name, e)
+        return True
+
+    def next_delay(self, now=None, max_wait=1.0):
+        """Seconds until the earliest deadline, capped at max_wait."""
+        now = self.clock() if now is None else now
+        with self._lock:
+            while self._heap:
+                deadline, name, gen = self._heap[0]
+                e = self._entries.get(name)
+                if e is not None and e.gen == gen and not e.in_flight:
+                    return max(0.0, min(max_wait, deadline - now))
+                heapq.heappop(self._heap)
+        return max_wait
+
+    def in_flight(self):
+        return self._n_in_flight
+
+    def _gauges(self):
+        IN_FLIGHT.set(self._n_in_flight)
+        FAST_DEVICES.set(self._n_fast)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,117 @@
+# sharding.py
+import os
+import time
+import socket
+import bisect
+import sqlite3
+import hashlib
+import logging
+from prometheus_client import Gauge
+
+log = logging.getLogger("collector.sharding")
+
+SHARD_INFO = Gauge('noc_collector_shard_info', 'Always 1; carries the shard (worker id) of this collector', ['shard'])
+SHARD_MEMBERS = Gauge('noc_collector_shard_members', 'Live collector workers in the ring')
+SHARD_DEVICES = Gauge('noc_collector_shard_devices', 'Devices owned by this worker')
+
+
+def _point(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring with `vnodes` points per member: adding or
+    removing a member only moves the devices of the arcs it gains/loses."""
+
+    def __init__(self, members=(), vnodes=64):
+        self.vnodes = vnodes
+        self.members = tuple(sorted(set(members)))
+        points = sorted((_point(f"{m}#{i}"), m) for m in self.members for i in range(vnodes))
+        self._keys = [p for p, _ in points]
+        self._owners = [m for _, m in points]
+
+    def owner(self, name):
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _point(name)) % len(self._keys)
+        return self._owners[i]
+
+
+class ShardMembership:
+    """Worker heartbeats in a table of the shared SQLite state database.
+
+    Each worker upserts its row every `heartbeat` seconds; rows older than
+    `ttl` are considered dead and removed by whoever notices first, so the
+    survivors' rings drop the dead worker and take over its devices.
+    """
+
+    def __init__(self, path, worker_id, heartbeat=2.0, ttl=10.0, vnodes=64, clock=time.time):
+        self.path = path
+        self.worker_id = worker_id
+        self.heartbeat = heartbeat
+        self.ttl = ttl
+        self.vnodes = vnodes
+        self.clock = clock
+        self.ring = HashRing((worker_id,), vnodes)
+        self._next_beat = 0
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA busy_timeout=30000")
+        with self._con:
+            self._con.execute("""
+            CREATE TABLE IF NOT EXISTS collector_members (
+                worker_id text PRIMARY KEY,
+                host text,
+                started real,
+                last_seen real
+            )""")
+        SHARD_INFO.labels(shard=worker_id).set(1)
+
+    @classmethod
+    def from_config(cls, config):
+        """Membership for config['sharding'], or None when sharding is off."""
+        s = (config or {}).get('sharding', {}) or {}
+        if not s.get('enabled', False):
+            return None
+        worker_id = s.get('worker_id') or f"{socket.gethostname()}-{os.getpid()}"
+        return cls(s.get('db_path') or config.get('db_path', 'iface_state.db'), worker_id,
+                   heartbeat=float(s.get('heartbeat', 2)), ttl=float(s.get('ttl', 10)),
+                   vnodes=int(s.get('vnodes', 64)))
+
+    def beat(self, force=False):
+        """Heartbeat when due. Returns True when the ring changed."""
+        now = self.clock()
+        if not force and now < self._next_beat:
+            return False
+        self._next_beat = now + self.heartbeat
+        with self._con:
+            self._con.execute(
+                "INSERT INTO collector_members(worker_id, host, started, last_seen) VALUES (?,?,?,?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET last_seen=excluded.last_seen",
+                (self.worker_id, socket.gethostname(), now, now))
+            # same write transaction as the upsert, so nobody expires in between
+            # (no DELETE ... RETURNING: that needs SQLite 3.35)
+            gone = self._con.execute("SELECT worker_id FROM collector_members WHERE last_seen < ?",
+                                     (now - self.ttl,)).fetchall()
+            if gone:
+                self._con.execute("DELETE FROM collector_members WHERE last_seen < ?", (now - self.ttl,))
+        for (w,) in gone:
+            log.warning("shard %s missed its heartbeats, rebalancing", w)
+        members = [r[0] for r in self._con.execute("SELECT worker_id FROM collector_members")]
+        SHARD_MEMBERS.set(len(members))
+        if tuple(sorted(members)) == self.ring.members:
+            return False
+        log.info("shard ring: %s", ", ".join(sorted(members)))
+        self.ring = HashRing(members, self.vnodes)
+        return True
+
+    def owned(self, devices):
+        """The subset of `devices` this worker polls."""
+        mine = [d for d in devices if self.ring.owner(d['name']) == self.worker_id]
+        SHARD_DEVICES.set(len(mine))
+        return mine
+
+    def leave(self):
+        """Remove our row so the others rebalance right away (clean shutdown)."""
+        with self._con:
+            self._con.execute("DELETE FROM collector_members WHERE worker_id=?", (self.worker_id,))
+        self._con.close()
@@ -0,0 +1,123 @@
+# snapshot_codec.py
+import json
+import struct
+
+# Interface snapshots (collector_api.build_snapshots plus the classify
+# fields) as fixed-layout little-endian records instead of JSON text:
+#
+#   volatile  B version, I ts, 6Q rx/tx bytes, errors, drops, I counters_ts
+#   stable    H flags, B state, I state_since, I link_downs,
+#             I speed_mbps, I expected_speed_mbps
+#   strings   name, reason, flaps (FlapTracker text), extra
+#             keys as JSON; each H length-prefixed, 0xFFFF = None
+#
+# Everything that can change on an idle interface sits in the volatile
+# head, so `stable_part()` of two records compares what classification
+# depends on. Snapshots that do not fit the layout (other value types,
+# tooling payloads) are stored as FORMAT_JSON: one byte then JSON.
+
+FORMAT_JSON = 0
+FORMAT_V1 = 1
+
+VOLATILE = struct.Struct('<BI6QI')
+STABLE = struct.Struct('<HBIIII')
+LENGTH = struct.Struct('<H')
+NONE_LEN = 0xFFFF
+
+COUNTERS = ('rx_bytes', 'tx_bytes', 'rx_errors', 'tx_errors', 'rx_drops', 'tx_drops')
+STATES = ('UP', 'DEGRADED', 'DOWN', 'ADMIN_DOWN')
+STATE_CODES = {s: k + 1 for k, s in enumerate(STATES)}  # 0: no state yet
+
+# flags: booleans, then which optional keys are present
+DISABLED, CARRIER = 1, 2
+OPTIONAL = ('counters_ts', 'state', 'state_since', 'speed_mbps', 'expected_speed_mbps', 'reason', 'flaps')
+HAS = {key: 4 << k for k, key in enumerate(OPTIONAL)}
+REQUIRED = ('ts', 'name', 'disabled', 'carrier', 'link_downs') + COUNTERS
+KNOWN = frozenset(REQUIRED + OPTIONAL)
+
+
+def _json(snap):
+    return bytes((FORMAT_JSON,)) + json.dumps(snap, separators=(',', ':')).encode()
+
+
+def _bytes(b):
+    if b is None:
+        return LENGTH.pack(NONE_LEN)
+    if len(b) >= NONE_LEN:
+        raise ValueError("snapshot field too long")
+    return LENGTH.pack(len(b)) + b
+
+
+def encode(snap):
+    """Binary record of a snapshot dict; decode(encode(s)) == s."""
+    try:
+        disabled, carrier, state = snap['disabled'], snap['carrier'], snap.get('state', 'UP')
+        if type(disabled) is not bool or type(carrier) is not bool or state not in STATE_CODES \
+                or not isinstance(snap['name'], str):
+            return _json(snap)
+        flags = (DISABLED if disabled else 0) | (CARRIER if carrier else 0)
+        for key, bit in HAS.items():
+            if key in snap:
+                flags |= bit
+        code = STATE_CODES[state] if 'state' in snap else 0
+        reason, flaps = snap.get('reason'), snap.get('flaps')
+        extra = None if KNOWN.issuperset(snap) else {k: v for k, v in snap.items() if k not in KNOWN}
+        # struct.error rejects floats, negatives and out-of-range ints
+        return (VOLATILE.pack(FORMAT_V1, snap['ts'], snap['rx_bytes'], snap['tx_bytes'], snap['rx_errors'],
+                              snap['tx_errors'], snap['rx_drops'], snap['tx_drops'], snap.get('counters_ts', 0))
+                + STABLE.pack(flags, code, snap.get('state_since', 0), snap['link_downs'],
+                              snap.get('speed_mbps', 0), snap.get('expected_speed_mbps', 0))
+                + _bytes(snap['name'].encode())
+                + _bytes(reason.encode() if reason is not None else None)
+                + _bytes(flaps.encode() if flaps is not None else None)
+                + _bytes(json.dumps(extra, separators=(',', ':')).encode() if extra else None))
+    except (KeyError, struct.error, AttributeError, ValueError):
+        return _json(snap)
+
+
+def stable_part(data):
+    """The part of an encoded record that is not timestamps and counters:
+    equal stable parts mean nothing classification reads has changed."""
+    if data[0] == FORMAT_V1:
+        return data[VOLATILE.size:]
+    snap = json.loads(data[1:])
+    return json.dumps({k: v for k, v in snap.items() if k not in ('ts', 'counters_ts') + COUNTERS},
+                      sort_keys=True).encode()
+
+
+def decode(data):
+    """Snapshot dict of an encode() record; legacy JSON text is accepted too."""
+    if isinstance(data, str):
+        return json.loads(data)
+    if data[0] == FORMAT_JSON:
+        return json.loads(data[1:])
+    if data[0] != FORMAT_V1:
+        raise ValueError(f"unknown snapshot format {data[0]}")
+    head = VOLATILE.unpack_from(data)
+    flags, state, state_since, link_downs, speed, expected = STABLE.unpack_from(data, VOLATILE.size)
+    snap = {'ts': head[1], 'name': None, 'disabled': bool(flags & DISABLED), 'carrier': bool(flags & CARRIER)}
+    snap.update(zip(COUNTERS, head[2:8]))
+    snap['link_downs'] = link_downs
+    for key, value in (('counters_ts', head[8]), ('state', STATES[state - 1] if state else None),
+                       ('state_since', state_since), ('speed_mbps', speed), ('expected_speed_mbps', expected)):
+        if flags & HAS[key]:
+            snap[key] = value
+    pos = VOLATILE.size + STABLE.size
+    fields = []
+    for _ in range(4):
+        (n,) = LENGTH.unpack_from(data, pos)
+        pos += LENGTH.size
+        if n == NONE_LEN:
+            fields.append(None)
+        else:
+            fields.append(bytes(data[pos:pos + n]))
+            pos += n
+    name, reason, flaps, extra = fields
+    snap['name'] = name.decode()
+    if flags & HAS['reason']:
+        snap['reason'] = reason.decode() if reason is not None else None
+    if flags & HAS['flaps']:
+        snap['flaps'] = flaps.decode() if flaps is not None else None
+    if extra is not None:
+        snap.update(json.loads(extra))
+    return snap
@@ -1,17 +1,65 @@
 # state_store.py
 import sqlite3
-import json
 import time
+import queue
+import random
+import threading
+from contextlib import contextmanager
 from typing import Optional
+import snapshot_codec
 
 class StateStore:
-    def __init__(self, path="state_api.db"):
+    """SQLite store for the latest snapshot per interface and the event log.
+
+    Default mode opens a connection per call (safe for ad-hoc tooling).
+    With batched=True one long-lived WAL connection is kept (synchronous=NORMAL),
+    writes are buffered and `flush()` commits them in a single transaction;
+    readers on other connections are never blocked by the writer.
+
+    Snapshots are stored as snapshot_codec records. With a `checkpoint`
+    (seconds) a snapshot is only written when something classification
+    reads changed (state, carrier, flaps, ...), so idle interfaces stop
+    rewriting counters every cycle, and every 0.5-1x `checkpoint` all rows
+    of a device are written once (a device's rows share pages; the random
+    spread keeps devices from coming due together). After a crash stored
+    counters are at most one checkpoint old and the first rates span that.
+    """
+
+    def __init__(self, path="state_api.db", batched=False, checkpoint=None, readers=8):
         self.path = path
+        self.batched = batched
+        self.checkpoint = checkpoint
+        self.skipped = 0  # unchanged snapshots not written
+        self._written = {}  # device -> [last checkpoint, next checkpoint, {iface: (stable part, written ts)}]
+        self._con = None
+        self._lock = threading.Lock()
+        self._pending_states = {}   # (device, iface) -> (ts, state, reason, state_since, payload record)
+        self._pending_events = []   # (device, iface, ts, event, state)
+        self._readers = ReadPool(path, readers)  # query methods (api_server)
         self._init_db()
 
+    def _open(self):
+        con = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    def _connect(self):
+        """Read connection for other threads/processes (api_server, tooling)."""
+        con = sqlite3.connect(self.path, timeout=30)
+        con.execute("PRAGMA busy_timeout=30000")
+        return con
+
+    def reading(self):
+        """Check out a read-only connection from the pool (context manager)."""
+        return self._readers.connection()
+
     def _init_db(self):
-        con = sqlite3.connect(self.path)
+        con = self._open() if self.batched else sqlite3.connect(self.path, timeout=30)
         cur = con.cursor()
+        # shard workers start together on one file: the PRAGMA table_info checks
+        # and the ALTERs below must not interleave with another process's
+        cur.execute("BEGIN IMMEDIATE")
         cur.execute("""
         CREATE TABLE IF NOT EXISTS iface_state (
             device text,
@@ -21,6 +69,13 @@ class StateStore:
             PRIMARY KEY (device, iface)
         )
         """)
+        # classified state is kept in columns too, so "how long has it been DOWN"
+        # is an index range scan on (state, state_since)
+        cols = {r[1] for r in cur.execute("PRAGMA table_info(iface_state)")}
+        for col, typ in (('state', 'text'), ('reason', 'text'), ('state_since', 'integer')):
+            if col not in cols:
+                cur.execute(f"ALTER TABLE iface_state ADD COLUMN {col} {typ}")
+        cur.execute("CREATE INDEX IF NOT EXISTS iface_state_state_since ON iface_state(state, state_since)")
         cur.execute("""
         CREATE TABLE IF NOT EXISTS event_log (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -30,20 +85,75 @@ class StateStore:
             event text
         )
         """)
+        if 'state' not in {r[1] for r in cur.execute("PRAGMA table_info(event_log)")}:
+            cur.execute("ALTER TABLE event_log ADD COLUMN state text")
+        # newest-first keyset pages: (ts, id) order with each filter as index prefix
+        cur.execute("CREATE INDEX IF NOT EXISTS event_log_ts ON event_log(ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS event_log_device_ts ON event_log(device, ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS event_log_iface_ts ON event_log(device, iface, ts)")
+        cur.execute("CREATE INDEX IF NOT EXISTS event_log_state_ts ON event_log(state, ts)")
+        # change counters per resource ('events', 'summary', 'state:<device>'),
+        # bumped by the writes that change it; readers use them as ETags
+        cur.execute("CREATE TABLE IF NOT EXISTS store_meta (key text PRIMARY KEY, value integer)")
+        # precomputed fleet summary, one row per collector (shard)
+        cur.execute("CREATE TABLE IF NOT EXISTS fleet_summary (worker text PRIMARY KEY, ts integer, body text)")
         con.commit()
-        con.close()
+        if self.batched:
+            self._con = con
+        else:
+            con.close()
 
     def save_iface_snapshot(self, device, iface, payload: dict):
+        row = _state_row(device, iface, int(time.time()), payload)
+        if self.checkpoint is not None and not self._changed(device, iface, row):
+            return
+        if self.batched:
+            with self._lock:
+                self._pending_states[(device, iface)] = row[2:]
+            return
         con = sqlite3.connect(self.path)
         cur = con.cursor()
-        cur.execute(
-            "INSERT OR REPLACE INTO iface_state(device, iface, ts, payload) VALUES (?,?,?,?)",
-            (device, iface, int(time.time()), json.dumps(payload))
-        )
+        cur.execute(_UPSERT_STATE, row)
+        cur.execute(_BUMP_VERSION, ('state:' + device,))
         con.commit()
         con.close()
 
+    def _changed(self, device, iface, row):
+        # checkpoints are per device: its rows sit on neighbouring pages
+        now = row[2]
+        dev = self._written.get(device)
+        if dev is None:
+            dev = self._written[device] = [now, now + self.checkpoint * random.uniform(0.5, 1.0), {}]
+        elif now >= dev[1]:
+            dev[0], dev[1] = now, now + self.checkpoint * random.uniform(0.5, 1.0)
+        stable = snapshot_codec.stable_part(row[-1])
+        last = dev[2].get(iface)
+        if last is not None and last[0] == stable and last[1] >= dev[0]:
+            self.skipped += 1
+            return False
+        dev[2][iface] = (stable, now)
+        return True
+
+    def forget(self, device, ifaces=None):
+        """Drop what was last written for `device` (or just `ifaces`), so its
+        next snapshots are written whatever they contain."""
+        if ifaces is None:
+            self._written.pop(device, None)
+            return
+        dev = self._written.get(device)
+        for iface in ifaces if dev is not None else ():
+            dev[2].pop(iface, None)
+
     def load_iface_snapshot(self, device, iface) -> Optional[dict]:
+        if self.batched:
+            with self._lock:
+                pending = self._pending_states.get((device, iface))
+                if pending is None:
+                    row = self._con.execute("SELECT payload FROM iface_state WHERE device=? AND iface=?",
+                                            (device, iface)).fetchone()
+                else:
+                    row = (pending[-1],)
+            return snapshot_codec.decode(row[0]) if row else None
         con = sqlite3.connect(self.path)
         cur = con.cursor()
         cur.execute("SELECT payload FROM iface_state WHERE device=? AND iface=?", (device, iface))
@@ -51,16 +161,318 @@ class StateStore:
         con.close()
         if not row:
             return None
-        return json.loads(row[0])
+        return snapshot_codec.decode(row[0])
+
+    def load_all_snapshots(self, device=None):
+        """Yield (device, iface, payload) for every stored interface (of `device`, when given)."""
+        con = self._connect()
+        try:
+            if device is None:
+                cur = con.execute("SELECT device, iface, payload FROM iface_state")
+            else:
+                cur = con.execute("SELECT device, iface, payload FROM iface_state WHERE device=?", (device,))
+            for device, iface, payload in cur:
+                yield device, iface, snapshot_codec.decode(payload)
+        finally:
+            con.close()
 
-    def append_event(self, device, iface, event_text):
+    def append_event(self, device, iface, event_text, state=None):
+        """Log an event; `state` is the interface state it led to (filterable)."""
+        if self.batched:
+            with self._lock:
+                self._pending_events.append((device, iface, int(time.time()), event_text, state))
+            return
         con = sqlite3.connect(self.path)
         cur = con.cursor()
-        cur.execute("INSERT INTO event_log(device, iface, ts, event) VALUES (?,?,?,?)",
-                    (device, iface, int(time.time()), event_text))
+        cur.execute(_INSERT_EVENT, (device, iface, int(time.time()), event_text, state))
+        cur.execute(_BUMP_VERSION, ('events',))
         con.commit()
         con.close()
 
+    def pending(self):
+        return len(self._pending_states) + len(self._pending_events)
+
+    def flush(self):
+        """Commit buffered snapshots and events in one transaction.
+        Returns (snapshots, events) written. No-op outside batched mode."""
+        if not self.batched:
+            return 0, 0
+        with self._lock:
+            states, self._pending_states = self._pending_states, {}
+            events, self._pending_events = self._pending_events, []
+            if not states and not events:
+                return 0, 0
+            self._write([k + v for k, v in states.items()], events)
+        return len(states), len(events)
+
+    def write_cycle(self, snapshots, events=()):
+        """Write [(device, iface, payload_dict)] and [(device, iface, event_text[, state])]
+        in a single transaction."""
+        now = int(time.time())
+        rows = [_state_row(d, i, now, p) for d, i, p in snapshots]
+        evs = [(e[0], e[1], now, e[2], e[3] if len(e) > 3 else None) for e in events]
+        if self.batched:
+            with self._lock:
+                self._write(rows, evs)
+        else:
+            con = self._connect()
+            try:
+                self._write(rows, evs, con)
+            finally:
+                con.close()
+
+    def _write(self, states, events, con=None):
+        con = con or self._con
+        with con:
+            con.executemany(_UPSERT_STATE, states)
+            if events:
+                con.executemany(_INSERT_EVENT, events)
+            keys = {('state:' + r[0],) for r in states}
+            if events:
+                keys.add(('events',))
+            con.executemany(_BUMP_VERSION, keys)
+
+    def save_summary(self, worker, ts, body):
+        """Replace `worker`'s fleet summary (JSON text)."""
+        row = (worker, int(ts), body)
+        sql = "INSERT OR REPLACE INTO fleet_summary(worker, ts, body) VALUES (?,?,?)"
+        if self.batched:
+            with self._lock, self._con:
+                self._con.execute(sql, row)
+                self._con.execute(_BUMP_VERSION, ('summary',))
+            return
+        con = self._connect()
+        try:
+            with con:
+                con.execute(sql, row)
+                con.execute(_BUMP_VERSION, ('summary',))
+        finally:
+            con.close()
+
+    def summaries(self):
+        """[(worker, ts, body JSON text)] of every collector, newest first."""
+        with self.reading() as con:
+            return con.execute("SELECT worker, ts, body FROM fleet_summary ORDER BY ts DESC").fetchall()
+
+    def version(self, key='events'):
+        """Change counter of one resource: 'events', 'summary' or 'state:<device>'
+        (0 before its first write)."""
+        with self.reading() as con:
+            row = con.execute("SELECT value FROM store_meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def events(self, device=None, iface=None, state=None, since=None, until=None, before=None, limit=100):
+        """Events newest first, [(id, device, iface, ts, state, event)].
+
+        Keyset pagination: pass the (ts, id) of the last row of a page as
+        `before` to get the next one, so every page costs the same however
+        deep it is. `since`/`until` bound ts (inclusive)."""
+        where, params = [], []
+        for col, val in (('device', device), ('iface', iface), ('state', state)):
+            if val is not None:
+                where.append(f"{col}=?")
+                params.append(val)
+        if since is not None:
+            where.append("ts>=?")
+            params.append(int(since))
+        if until is not None:
+            where.append("ts<=?")
+            params.append(int(until))
+        if before is not None:
+            where.append("(ts, id) < (?, ?)")
+            params.extend((int(before[0]), int(before[1])))
+        sql = "SELECT id, device, iface, ts, state, event FROM event_log"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(int(limit))
+        with self.reading() as con:
+            return con.execute(sql, params).fetchall()
+
+    def iface_snapshots(self, device, state=None):
+        """[(iface, ts, state, reason, state_since, payload dict)] of one device."""
+        sql = "SELECT iface, ts, state, reason, state_since, payload FROM iface_state WHERE device=?"
+        params = [device]
+        if state is not None:
+            sql += " AND state=?"
+            params.append(state)
+        with self.reading() as con:
+            rows = con.execute(sql + " ORDER BY iface", params).fetchall()
+        return [r[:5] + (snapshot_codec.decode(r[5]),) for r in rows]
+
+    def iface_states(self, state, min_duration=0, limit=100, now=None):
+        """Interfaces in `state` for at least `min_duration` seconds, longest first:
+        [(device, iface, reason, state_since)]."""
+        now = int(now or time.time())
+        with self.reading() as con:
+            return con.execute(
+                "SELECT device, iface, reason, state_since FROM iface_state "
+                "WHERE state=? AND state_since<=? ORDER BY state_since LIMIT ?",
+                (state, now - int(min_duration), int(limit))).fetchall()
+
+    def load_iface_state(self, device, iface):
+        """(state, reason, state_since) of one interface, or None."""
+        with self.reading() as con:
+            return con.execute(
+                "SELECT state, reason, state_since FROM iface_state WHERE device=? AND iface=?",
+                (device, iface)).fetchone()
+
+    def close(self):
+        self._readers.close()
+        if self._con is not None:
+            self.flush()
+            self._con.close()
+            self._con = None
+
+
+class ReadPool:
+    """At most `size` read-only connections to one database, checked out per
+    request and returned after it. Thread-per-request servers (Flask's
+    threaded dev server) reuse the same few connections instead of opening
+    one per request; when all are busy a request waits up to `timeout`."""
+
+    def __init__(self, path, size=8, timeout=30):
+        self.path = path
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        con = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        con.execute("PRAGMA busy_timeout=30000")
+        con.execute("PRAGMA query_only=1")
+        return con
+
+    @contextmanager
+    def connection(self):
+        try:
+            con = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                grow = self._opened < self.size
+                if grow:
+                    self._opened += 1
+            if grow:
+                try:
+                    con = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                con = self._idle.get(timeout=self.timeout)
+        try:
+            yield con
+        finally:
+            self._idle.put(con)
+
+    def close(self):
+        """Close the idle connections (the pool can still be used afterwards)."""
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self._opened -= 1
+            con.close()
+
+
+_INSERT_EVENT = "INSERT INTO event_log(device, iface, ts, event, state) VALUES (?,?,?,?,?)"
+_BUMP_VERSION = ("INSERT INTO store_meta(key, value) VALUES (?, 1) "
+                 "ON CONFLICT(key) DO UPDATE SET value=value+1")
+
+# updated in place: REPLACE would delete the row and append it under a new
+# rowid, rewriting pages of the table and of both indexes on every save
+_UPSERT_STATE = ("INSERT INTO iface_state(device, iface, ts, state, reason, state_since, payload) "
+                 "VALUES (?,?,?,?,?,?,?) ON CONFLICT(device, iface) DO UPDATE SET ts=excluded.ts, "
+                 "state=excluded.state, reason=excluded.reason, state_since=excluded.state_since, "
+                 "payload=excluded.payload")
+
+
+def _state_row(device, iface, ts, payload):
+    return (device, iface, ts, payload.get('state'), payload.get('reason'), payload.get('state_since'),
+            snapshot_codec.encode(payload))
+
+
+class StateCache:
+    """Write-through in-memory cache of the latest snapshot per interface.
+
+    Warmed once from iface_state at startup; after that prev-snapshot
+    lookups never touch SQLite. Anything else (append_event, flush, close)
+    is passed through to the wrapped StateStore.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._snaps = {}  # device -> {iface: snapshot}
+        self._lock = threading.Lock()
+
+    def warm(self):
+        """Load every stored snapshot; returns the number of interfaces cached."""
+        snaps = {}
+        n = 0
+        for device, iface, payload in self.store.load_all_snapshots():
+            snaps.setdefault(device, {})[iface] = payload
+            n += 1
+        with self._lock:
+            self._snaps = snaps
+        return n
+
+    def snapshots(self, device):
+        """[(iface, snapshot)] cached for `device`."""
+        with self._lock:
+            return list(self._snaps.get(device, {}).items())
+
+    def get_last_state(self, device, iface):
+        return self._snaps.get(device, {}).get(iface)
+
+    def remember(self, device, iface, snapshot):
+        """Cache `snapshot` without writing it: the classify stage records what
+        it hands to persist, so the next result of the device compares to it."""
+        with self._lock:
+            self._snaps.setdefault(device, {})[iface] = snapshot
+
+    def save_state(self, device, iface, snapshot):
+        with self._lock:
+            self._snaps.setdefault(device, {})[iface] = snapshot
+        self.store.save_iface_snapshot(device, iface, snapshot)
+
+    def retain(self, device, ifaces):
+        """Evict cached interfaces of `device` not in `ifaces`; returns their names."""
+        keep = set(ifaces)
+        with self._lock:
+            cached = self._snaps.get(device)
+            if not cached:
+                return []
+            gone = [i for i in cached if i not in keep]
+            for i in gone:
+                del cached[i]
+        self.store.forget(device, gone)
+        return gone
+
+    def reload_device(self, device):
+        """Re-read one device's snapshots from the database (after another
+        collector shard polled it). Returns the number of interfaces loaded."""
+        snaps = {iface: payload for _, iface, payload in self.store.load_all_snapshots(device)}
+        with self._lock:
+            self._snaps[device] = snaps
+        self.store.forget(device)
+        return len(snaps)
+
+    def drop_device(self, device):
+        with self._lock:
+            self._snaps.pop(device, None)
+        self.store.forget(device)
+
+    def __len__(self):
+        return sum(len(v) for v in self._snaps.values())
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
 
 # helper for external tooling to get a connection (used by api_server)
 def _connect_db(path):
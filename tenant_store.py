@@ -0,0 +1,207 @@
+# tenant_store.py
+import hmac
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from prometheus_client import Counter
+from alert_dispatch import TokenBucket
+from state_store import ReadPool
+
+log = logging.getLogger("collector.tenants")
+
+TENANT_EVENTS = Counter('noc_tenant_events_total', 'Events written to the tenant store', ['tenant'])
+TENANT_DROPPED = Counter('noc_tenant_events_dropped_total', 'Events dropped by the per-tenant quota', ['tenant'])
+
+# columns added to the scaffolded tenants table: quota overrides (NULL = default)
+# and the SHA-256 of the tenant's API read key (NULL = admin key only)
+_EXTRA_COLUMNS = (('events_per_sec', 'REAL'), ('burst', 'INTEGER'), ('api_key_sha256', 'TEXT'))
+
+
+def ensure_schema(con):
+    """Create/upgrade the multi-tenant tables (idempotent)."""
+    con.execute('''CREATE TABLE IF NOT EXISTS tenants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        created_ts INTEGER DEFAULT (strftime('%s','now'))
+    )''')
+    cols = {r[1] for r in con.execute("PRAGMA table_info(tenants)")}
+    for col, typ in _EXTRA_COLUMNS:
+        if col not in cols:
+            con.execute(f"ALTER TABLE tenants ADD COLUMN {col} {typ}")
+    con.execute('''CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tenant_id INTEGER,
+        device TEXT,
+        iface TEXT,
+        ts INTEGER,
+        event TEXT,
+        FOREIGN KEY(tenant_id) REFERENCES tenants(id)
+    )''')
+    # every tenant query is an equality on tenant_id plus a ts range/order, so
+    # a tenant holding most rows never makes the others scan them
+    con.execute('CREATE INDEX IF NOT EXISTS events_tenant_ts ON events(tenant_id, ts)')
+    con.execute('CREATE INDEX IF NOT EXISTS events_tenant_device_iface_ts ON events(tenant_id, device, iface, ts)')
+    # device-only filters: walking the index above would need a sort per device
+    con.execute('CREATE INDEX IF NOT EXISTS events_tenant_device_ts ON events(tenant_id, device, ts)')
+    con.execute('CREATE INDEX IF NOT EXISTS events_ts ON events(ts)')  # retention
+    con.commit()
+
+
+def select_events(con, tenant_id, device=None, iface=None, since=None, until=None, before=None, limit=100):
+    """[(id, device, iface, ts, event)] of one tenant, newest first; keyset
+    pages like StateStore.events (`before` = (ts, id))."""
+    where, params = ["tenant_id=?"], [int(tenant_id)]
+    for col, val in (('device', device), ('iface', iface)):
+        if val is not None:
+            where.append(f"{col}=?")
+            params.append(val)
+    if since is not None:
+        where.append("ts>=?")
+        params.append(int(since))
+    if until is not None:
+        where.append("ts<=?")
+        params.append(int(until))
+    if before is not None:
+        where.append("(ts, id) < (?, ?)")
+        params.extend((int(before[0]), int(before[1])))
+    sql = ("SELECT id, device, iface, ts, event FROM events WHERE " + " AND ".join(where)
+           + " ORDER BY ts DESC, id DESC LIMIT ?")
+    return con.execute(sql, params + [int(limit)]).fetchall()
+
+
+def key_digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def set_api_key(con, name, key):
+    """Store the digest of `key` as tenant `name`'s read key, creating the tenant."""
+    with con:
+        con.execute("INSERT OR IGNORE INTO tenants(name) VALUES (?)", (name,))
+        con.execute("UPDATE tenants SET api_key_sha256=? WHERE name=?", (key_digest(key), name))
+    return con.execute("SELECT id FROM tenants WHERE name=?", (name,)).fetchone()[0]
+
+
+def check_api_key(con, tenant_id, key):
+    """Whether `key` is tenant `tenant_id`'s read key."""
+    row = con.execute("SELECT api_key_sha256 FROM tenants WHERE id=?", (int(tenant_id),)).fetchone()
+    return bool(key and row and row[0]) and hmac.compare_digest(row[0], key_digest(key))
+
+
+class TenantStore:
+    """Batched, quota-limited event ingestion into the SaaS tenant schema.
+
+    `append()`/`ingest()` charge each event to its tenant's token bucket
+    (`events_per_sec`/`burst` from the tenants row, else the defaults) and
+    buffer what fits; over-quota events are dropped and counted. `flush()`
+    writes the buffer with one executemany in a single transaction. Tenants
+    are referenced by name and created on first use; `reload()` picks up
+    overrides edited since.
+    """
+
+    def __init__(self, path='saas.db', rate=50.0, burst=500, batch_size=5000, reload_interval=30.0):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = int(burst)
+        self.batch_size = batch_size
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._pending = []   # (tenant_id, device, iface, ts, event)
+        self._ids = {}       # tenant name -> id
+        self._buckets = {}   # tenant id -> TokenBucket
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        ensure_schema(self._con)
+        self._readers = ReadPool(path, 4)
+
+    @classmethod
+    def from_config(cls, config):
+        """Store for config['tenants'], or None when multi-tenancy is off."""
+        t = (config or {}).get('tenants', {}) or {}
+        if not t.get('enabled', False):
+            return None
+        return cls(t.get('db_path', 'saas.db'), rate=float(t.get('events_per_sec', 50)),
+                   burst=int(t.get('burst', 500)), batch_size=int(t.get('batch_size', 5000)),
+                   reload_interval=float(t.get('reload_interval', 30)))
+
+    def _quota(self, rate, burst):
+        """(rate, burst) of a tenants row; NULL means the default, 0 is an override."""
+        return (self.rate if rate is None else float(rate)), (self.burst if burst is None else int(burst))
+
+    def tenant_id(self, name):
+        """Id of tenant `name`, creating it if needed."""
+        tid = self._ids.get(name)
+        if tid is not None:
+            return tid
+        with self._lock:
+            with self._con:
+                self._con.execute("INSERT OR IGNORE INTO tenants(name) VALUES (?)", (name,))
+            row = self._con.execute("SELECT id, events_per_sec, burst FROM tenants WHERE name=?", (name,)).fetchone()
+            tid = row[0]
+            self._buckets[tid] = TokenBucket(*self._quota(row[1], row[2]))
+            self._ids[name] = tid
+        return tid
+
+    def reload(self):
+        """Re-read the quota overrides of the tenants seen so far; returns how many changed."""
+        with self._lock:
+            rows = self._con.execute("SELECT id, events_per_sec, burst FROM tenants").fetchall()
+        changed = 0
+        for tid, rate, burst in rows:
+            bucket = self._buckets.get(tid)
+            if bucket is None:
+                continue
+            rate, burst = self._quota(rate, burst)
+            with bucket.lock:
+                if (bucket.rate, bucket.burst) != (rate, burst):
+                    now = time.monotonic()  # settle what accrued at the old rate first
+                    bucket.tokens = min(bucket.burst, bucket.tokens + (now - bucket.stamp) * bucket.rate)
+                    bucket.stamp = now
+                    bucket.rate, bucket.burst = rate, float(burst)
+                    bucket.tokens = min(bucket.tokens, bucket.burst)
+                    changed += 1
+        return changed
+
+    def append(self, tenant, device, iface, event, ts=None):
+        """Queue one event for `tenant` (name). Returns False when over quota."""
+        return self.ingest(tenant, [(device, iface, int(ts or time.time()), event)]) == 1
+
+    def ingest(self, tenant, rows):
+        """Bulk path: rows of (device, iface, ts, event) for one tenant. Queues
+        as many as the quota allows, in order; returns how many."""
+        tid = self.tenant_id(tenant)
+        granted = self._buckets[tid].take(len(rows))
+        if granted < len(rows):
+            TENANT_DROPPED.labels(tenant=tenant).inc(len(rows) - granted)
+        if not granted:
+            return 0
+        with self._lock:
+            self._pending.extend((tid,) + tuple(r) for r in rows[:granted])
+            full = len(self._pending) >= self.batch_size
+        TENANT_EVENTS.labels(tenant=tenant).inc(granted)
+        if full:
+            self.flush()
+        return granted
+
+    def flush(self):
+        """Write queued events in one transaction; returns how many."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            with self._con:
+                self._con.executemany("INSERT INTO events(tenant_id, device, iface, ts, event) VALUES (?,?,?,?,?)",
+                                      rows)
+        return len(rows)
+
+    def events(self, tenant_id, device=None, iface=None, since=None, until=None, before=None, limit=100):
+        """A tenant's events newest first, see select_events()."""
+        with self._readers.connection() as con:
+            return select_events(con, tenant_id, device, iface, since, until, before, limit)
+
+    def close(self):
+        self._readers.close()
+        self.flush()
+        self._con.close()
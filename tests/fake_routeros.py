@@ -0,0 +1,248 @@
+# fake_routeros.py - minimal RouterOS API server for tests
+import socket
+import threading
+import socketserver
+
+
+def encode_length(n):
+    if n < 0x80:
+        return bytes([n])
+    if n < 0x4000:
+        return (n | 0x8000).to_bytes(2, 'big')
+    if n < 0x200000:
+        return (n | 0xC00000).to_bytes(3, 'big')
+    if n < 0x10000000:
+        return (n | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + n.to_bytes(4, 'big')
+
+
+def encode_sentence(words):
+    out = b''
+    for w in words:
+        if isinstance(w, str):
+            w = w.encode()
+        out += encode_length(len(w)) + w
+    return out + b'\x00'
+
+
+def _read_exact(f, n):
+    data = f.read(n)
+    if len(data) != n:
+        raise EOFError
+    return data
+
+
+def read_word(f):
+    b = _read_exact(f, 1)[0]
+    if b < 0x80:
+        n = b
+    elif b < 0xC0:
+        n = ((b & 0x3F) << 8) | _read_exact(f, 1)[0]
+    elif b < 0xE0:
+        n = ((b & 0x1F) << 16) | int.from_bytes(_read_exact(f, 2), 'big')
+    elif b < 0xF0:
+        n = ((b & 0x0F) << 24) | int.from_bytes(_read_exact(f, 3), 'big')
+    else:
+        n = int.from_bytes(_read_exact(f, 4), 'big')
+    return _read_exact(f, n).decode()
+
+
+def read_sentence(f):
+    words = []
+    while True:
+        w = read_word(f)
+        if w == '':
+            return words
+        words.append(w)
+
+
+def default_interfaces(n=3):
+    return [{
+        'name': f'ether{i}', 'type': 'ether', 'running': 'true', 'disabled': 'false',
+        'rx-byte': '1000', 'tx-byte': '2000', 'rx-error': '0', 'tx-error': '0',
+        'rx-drop': '0', 'tx-drop': '0', 'link-downs': '0',
+    } for i in range(1, n + 1)]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().setup()
+
+    def send(self, words):
+        # listen updates are written from FakeRouterOS.set_interface's thread
+        with self.wlock:
+            self.wfile.write(encode_sentence(words))
+
+    def handle(self):
+        srv = self.server.fake
+        srv._track(self.request, True)
+        self.wlock = threading.Lock()
+        listening = {}  # tag -> proplist keys of an open /interface/listen
+        logged_in = False
+        try:
+            while True:
+                words = read_sentence(self.rfile)
+                if not words:
+                    continue
+                cmd, attrs, queries, tag = words[0], {}, {}, None
+                for w in words[1:]:
+                    if w.startswith('.tag='):
+                        tag = w[5:]
+                    elif w.startswith('='):
+                        k, _, v = w[1:].partition('=')
+                        attrs[k] = v
+                    elif w.startswith('?'):
+                        k, _, v = w[1:].partition('=')
+                        queries[k] = v
+                tail = ['.tag=' + tag] if tag is not None else []
+                srv.calls.append(cmd)
+                if cmd == '/login':
+                    if attrs.get('name') == srv.user and attrs.get('password') == srv.password:
+                        logged_in = True
+                        srv.logins += 1
+                        self.wfile.write(encode_sentence(['!done'] + tail))
+                    else:
+                        self.wfile.write(encode_sentence(['!trap', '=message=invalid user name or password (6)'] + tail))
+                        self.wfile.write(encode_sentence(['!done'] + tail))
+                    continue
+                if not logged_in:
+                    self.wfile.write(encode_sentence(['!fatal', 'not logged in']))
+                    return
+                if cmd == '/interface/listen':
+                    proplist = attrs.get('.proplist')
+                    listening[tag] = proplist.split(',') if proplist else None
+                    srv._listen(self, tag, listening[tag], True)
+                    continue
+                if cmd == '/cancel':
+                    target = attrs.get('tag')
+                    if target in listening:
+                        srv._listen(self, target, listening.pop(target), False)
+                        self.send(['!trap', '=category=2', '=message=interrupted', '.tag=' + target])
+                        self.send(['!done', '.tag=' + target])
+                    self.send(['!done'] + tail)
+                    continue
+                rows = srv.handle_command(cmd, attrs, queries)
+                if rows is None:
+                    self.wfile.write(encode_sentence(['!trap', '=message=no such command'] + tail))
+                    self.wfile.write(encode_sentence(['!done'] + tail))
+                    continue
+                proplist = attrs.get('.proplist')
+                keys = proplist.split(',') if proplist else None
+                with self.wlock:
+                    for row in rows:
+                        items = row.items() if keys is None else ((k, row[k]) for k in keys if k in row)
+                        self.wfile.write(encode_sentence(['!re'] + [f'={k}={v}' for k, v in items] + tail))
+                    self.wfile.write(encode_sentence(['!done'] + tail))
+        except (EOFError, OSError, ValueError):
+            pass
+        finally:
+            for t, keys in listening.items():
+                srv._listen(self, t, keys, False)
+            srv._track(self.request, False)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeRouterOS:
+    """Threaded fake RouterOS API endpoint on 127.0.0.1 (random port).
+
+    `connections` counts accepted TCP sessions and `logins` successful
+    logins, so tests can check session reuse; `drop_all()` closes every
+    client socket from the server side. `/interface/listen` is supported:
+    `set_interface()` changes an interface and sends the change to every
+    open listen (`listeners()` counts them), `/cancel` ends one.
+    """
+
+    def __init__(self, user='admin', password='secret', interfaces=None, ethernet=None):
+        self.user = user
+        self.password = password
+        self.interfaces = interfaces if interfaces is not None else default_interfaces()
+        self.ethernet = ethernet if ethernet is not None else [
+            {'name': i['name'], 'speed': '1Gbps'} for i in self.interfaces]
+        self.connections = 0
+        self.logins = 0
+        self.calls = []
+        self._socks = set()
+        self._listeners = set()  # (handler, tag, proplist keys)
+        self._lock = threading.Lock()
+        self._srv = _Server(('127.0.0.1', 0), _Handler)
+        self._srv.fake = self
+        self.port = self._srv.server_address[1]
+        self._thread = threading.Thread(target=self._srv.serve_forever, args=(0.05,), daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stop(self):
+        self._srv.shutdown()
+        self._srv.server_close()
+        self.drop_all()
+
+    def _track(self, sock, add):
+        with self._lock:
+            if add:
+                self.connections += 1
+                self._socks.add(sock)
+            else:
+                self._socks.discard(sock)
+
+    def drop_all(self):
+        with self._lock:
+            socks = list(self._socks)
+        for s in socks:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            s.close()
+
+    def _listen(self, handler, tag, keys, add):
+        entry = (handler, tag, tuple(keys) if keys else None)
+        with self._lock:
+            if add:
+                self._listeners.add(entry)
+            else:
+                self._listeners.discard(entry)
+
+    def listeners(self):
+        with self._lock:
+            return len(self._listeners)
+
+    def set_interface(self, name, **props):
+        """Update interface `name` (keyword names use _ for -, values are
+        sent as given, e.g. running='false') and notify open listens."""
+        row = next(i for i in self.interfaces if i['name'] == name)
+        row.update({k.replace('_', '-'): v for k, v in props.items()})
+        with self._lock:
+            listeners = list(self._listeners)
+        for handler, tag, keys in listeners:
+            items = row.items() if keys is None else ((k, row[k]) for k in keys if k in row)
+            words = ['!re'] + [f'={k}={v}' for k, v in items] + (['.tag=' + tag] if tag is not None else [])
+            try:
+                handler.send(words)
+            except OSError:
+                pass
+
+    def device_cfg(self, name='R1', **extra):
+        cfg = {'name': name, 'ip': '127.0.0.1', 'api_port': self.port, 'user': self.user, 'pass': self.password}
+        cfg.update(extra)
+        return cfg
+
+    def handle_command(self, cmd, attrs, queries):
+        if cmd == '/interface/print':
+            rows = self.interfaces
+        elif cmd == '/interface/ethernet/print':
+            rows = self.ethernet
+        elif cmd == '/system/identity/print':
+            rows = [{'name': 'fake'}]
+        else:
+            return None
+        return [r for r in rows if all(r.get(k) == v for k, v in queries.items())]
@@ -0,0 +1,137 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from alert_dispatch import AlertDispatcher
+
+
+class FakeReceiver:
+    """HTTP endpoint recording JSON bodies; the first `fail` requests get 503."""
+
+    def __init__(self, fail=0, delay=0):
+        self.bodies = []
+        self.fail = fail
+        self.delay = delay
+        recv = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                time.sleep(recv.delay)
+                if recv.fail:
+                    recv.fail -= 1
+                    self.send_response(503)
+                else:
+                    recv.bodies.append(body)
+                    self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/hook"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def wait_for(cond, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not cond():
+        time.sleep(0.02)
+    return cond()
+
+
+def test_submit_does_not_block_and_batches_with_retries(tmp_path):
+    recv = FakeReceiver(fail=2, delay=0.2)
+    d = AlertDispatcher({'provider': 'slack', 'webhook': recv.url}, spill_path=str(tmp_path / 'spill.jsonl'),
+                        backoff_base=0.01, batch_wait=0.1, workers=1)
+    t0 = time.monotonic()
+    for i in range(30):
+        d.submit('R1', f'ether{i}', 'DOWN', {'reason': 'no carrier'})
+    assert time.monotonic() - t0 < 0.1
+    assert wait_for(lambda: sum(b['text'].count('\n') + 1 for b in recv.bodies) == 30)
+    assert len(recv.bodies) < 30  # merged into batched posts
+    d.close()
+    recv.close()
+    assert not (tmp_path / 'spill.jsonl').exists()
+
+
+def test_failed_alerts_spill_and_replay(tmp_path):
+    spill = str(tmp_path / 'spill.jsonl')
+    d = AlertDispatcher({'webhook': 'http://127.0.0.1:9/down'}, spill_path=spill,
+                        max_retries=1, backoff_base=0.01, batch_wait=0)
+    d.submit('R1', 'ether1', 'DOWN', {'reason': 'no carrier'})
+    assert wait_for(lambda: d.pending() == 0)
+    d.close()
+    with open(spill) as f:
+        assert [json.loads(line)['iface'] for line in f] == ['ether1']
+
+    recv = FakeReceiver()
+    d = AlertDispatcher({'webhook': recv.url}, spill_path=spill, batch_wait=0)
+    assert wait_for(lambda: len(recv.bodies) == 1)
+    assert recv.bodies[0]['iface'] == 'ether1' and recv.bodies[0]['state'] == 'DOWN'
+    d.close()
+    recv.close()
+
+
+def test_batching_only_merges_chat_posts_to_one_url(tmp_path):
+    d = AlertDispatcher({'dispatch': {'batch_size': 50},
+                         'destinations': [{'name': 'pd', 'provider': 'pagerduty', 'routing_key': 'k'},
+                                          {'name': 'og', 'provider': 'opsgenie', 'routing_key': 'k'},
+                                          {'name': 'chat', 'provider': 'slack', 'webhook': 'http://127.0.0.1:9/hook'}]},
+                        spill_path=str(tmp_path / 'spill.jsonl'), batch_wait=0)
+    assert {n: dest.batch_size for n, dest in d.destinations.items()} == {'pd': 1, 'og': 1, 'chat': 50}
+
+    class Session:
+        posts = []
+
+        def post(self, url, json, headers, timeout):
+            self.posts.append((url, json))
+            return type('Response', (), {'status_code': 202})()
+
+    now = time.time()
+    events = [{'device': 'R1', 'iface': '*', 'state': 'DOWN', 'details': {}, 'submitted': now, 'summary': 'R1: 1 DOWN',
+               'action': 'trigger', 'dedup_key': 'noc-R1'},
+              {'device': 'R2', 'iface': '*', 'state': 'UP', 'details': {}, 'submitted': now, 'summary': 'R2: recovered',
+               'action': 'resolve', 'dedup_key': 'noc-R2'}]
+    assert d._deliver(d.destinations['og'], Session(), events)
+    (trigger_url, trigger), (resolve_url, resolve) = Session.posts
+    assert trigger['alias'] == 'noc-R1' and 'alerts' not in trigger
+    assert resolve_url.endswith('/noc-R2/close?identifierType=alias') and resolve == {'note': 'R2: recovered'}
+    d.close(timeout=0)
+
+
+def test_incident_trigger_and_resolve_stay_in_order(tmp_path, monkeypatch):
+    import alerter
+    recv = FakeReceiver(fail=1)  # the trigger's first attempt fails
+    monkeypatch.setattr(alerter, 'PAGERDUTY_URL', recv.url)
+    cfg = {'provider': 'pagerduty', 'routing_key': 'k', 'dispatch': {'rate_limit': None}}
+
+    def incident(d):
+        d.submit('R1', '*', 'DOWN', {}, summary='R1: 1 DOWN', action='trigger', dedup_key='noc-R1')
+        d.submit('R1', '*', 'UP', {}, summary='R1: recovered', action='resolve', dedup_key='noc-R1')
+
+    d = AlertDispatcher(cfg, spill_path=str(tmp_path / 'spill.jsonl'), backoff_base=0.2, batch_wait=0, workers=2)
+    incident(d)
+    assert wait_for(lambda: len(recv.bodies) == 2)
+    assert [b['event_action'] for b in recv.bodies] == ['trigger', 'resolve']
+    d.close()
+
+    # a spilled trigger takes its resolve along, and the replay sends both in order
+    recv.bodies, recv.fail = [], 1
+    d = AlertDispatcher(cfg, spill_path=str(tmp_path / 'spill.jsonl'), max_retries=0, batch_wait=0,
+                        replay_interval=3600)
+    incident(d)
+    assert wait_for(lambda: d.pending() == 0 and (tmp_path / 'spill.jsonl').exists())
+    time.sleep(0.2)
+    assert recv.bodies == []
+    assert d.replay() == 2
+    assert wait_for(lambda: len(recv.bodies) == 2)
+    assert [b['event_action'] for b in recv.bodies] == ['trigger', 'resolve']
+    d.close()
+    recv.close()
@@ -0,0 +1,82 @@
+import importlib
+from state_store import StateStore
+
+
+def load_app(tmp_path, monkeypatch):
+    monkeypatch.setenv('STATE_DB_PATH', str(tmp_path / 'state.db'))
+    monkeypatch.setenv('HISTORY_DB_PATH', str(tmp_path / 'history.db'))
+    monkeypatch.setenv('SAAS_DB', str(tmp_path / 'saas.db'))
+    monkeypatch.delenv('API_KEY', raising=False)
+    import api_server
+    return importlib.reload(api_server)
+
+
+def test_events_cursor_pages_and_etag(tmp_path, monkeypatch):
+    api = load_app(tmp_path, monkeypatch)
+    store = StateStore(str(tmp_path / 'state.db'))
+    store.write_cycle([('R1', 'ether1', {'state': 'DOWN', 'reason': 'no carrier', 'ts': 1})],
+                      [('R1', f'ether{i}', f'initial_state DOWN : {i}', 'DOWN') for i in range(5)])
+    client = api.app.test_client()
+
+    first = client.get('/api/v1/events?limit=3')
+    body = first.get_json()
+    assert len(body['events']) == 3 and body['next_cursor']
+    rest = client.get(f"/api/v1/events?limit=3&cursor={body['next_cursor']}").get_json()
+    assert len(rest['events']) == 2 and rest['next_cursor'] is None
+    assert {e['id'] for e in body['events'] + rest['events']} == set(range(1, 6))
+    assert client.get('/api/v1/events?cursor=bad').status_code == 400
+
+    etag = first.headers['ETag']
+    assert client.get('/api/v1/events?limit=3', headers={'If-None-Match': etag}).status_code == 304
+    ifaces_etag = client.get('/api/v1/device/R1/ifaces').headers['ETag']
+    store.save_iface_snapshot('R2', 'ether1', {'state': 'UP', 'ts': 2})  # other device, no event
+    assert client.get('/api/v1/events?limit=3', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/v1/device/R1/ifaces', headers={'If-None-Match': ifaces_etag}).status_code == 304
+    store.append_event('R1', 'ether1', 'state_change DOWN -> UP : {}', 'UP')
+    again = client.get('/api/v1/events?limit=3', headers={'If-None-Match': etag})
+    assert again.status_code == 200 and again.get_json()['events'][0]['state'] == 'UP'
+
+    ifaces = client.get('/api/v1/device/R1/ifaces').get_json()
+    assert ifaces == [{'iface': 'ether1', 'ts': ifaces[0]['ts'], 'state': 'DOWN', 'reason': 'no carrier',
+                       'since': None, 'payload': {'state': 'DOWN', 'reason': 'no carrier', 'ts': 1}}]
+
+
+def test_summary_serves_stored_rows_and_merges_shards(tmp_path, monkeypatch):
+    import json
+    from fleet_summary import FleetSummary
+    api = load_app(tmp_path, monkeypatch)
+    client = api.app.test_client()
+    assert client.get('/api/v1/summary').status_code == 404
+    store = StateStore(str(tmp_path / 'state.db'), batched=True)
+    a, b = FleetSummary(), FleetSummary()
+    a.update_device('R1', [('ether1', 'DOWN', None, None)])
+    store.save_summary('w0', 1000, a.render()[1])
+    assert client.get('/api/v1/summary').get_json()['fleet'] == {'DOWN': 1}
+    b.update_device('R2', [('ether1', 'UP', None, None)])
+    store.save_summary('w1', 1010, b.render()[1])
+    body = client.get('/api/v1/summary').get_json()
+    assert body['fleet'] == {'DOWN': 1, 'UP': 1}
+    store.save_summary('w1', 1000 + 10 + api.SUMMARY_MAX_AGE, json.dumps(b.snapshot()))
+    assert client.get('/api/v1/summary').get_json()['fleet'] == {'UP': 1}  # w0 is stale
+
+
+def test_tenant_events_never_create_saas_db(tmp_path, monkeypatch):
+    api = load_app(tmp_path, monkeypatch)
+    client = api.app.test_client()
+    assert client.get('/api/v1/tenants/1/events').get_json() == {'events': [], 'next_cursor': None}
+    assert not (tmp_path / 'saas.db').exists()
+
+
+def test_history_is_read_only_and_empty_without_a_db(tmp_path, monkeypatch):
+    from history_store import HistoryStore
+    api = load_app(tmp_path, monkeypatch)
+    client = api.app.test_client()
+    body = client.get('/api/v1/device/R1/iface/ether1/history?start=0&end=2000&resolution=raw').get_json()
+    assert body['points'] == [] and not (tmp_path / 'history.db').exists()
+    assert client.get('/api/v1/device/R1/iface/ether1/history?resolution=2m').status_code == 400
+    writer = HistoryStore(str(tmp_path / 'history.db'))  # the collector
+    writer.append('R1', 'ether1', 1000, 8e6, 1e6, 0, 0)
+    writer.flush()
+    body = client.get('/api/v1/device/R1/iface/ether1/history?start=0&end=2000&resolution=raw').get_json()
+    assert [p['rx_bps'] for p in body['points']] == [8e6]
+    writer.close()
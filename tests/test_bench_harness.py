@@ -0,0 +1,54 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+from routeros_sim import RouterOsSimulator, WRAP  # noqa: E402
+from bench_collector import compare  # noqa: E402
+
+
+def test_simulated_counters():
+    sim = RouterOsSimulator(ifaces=200, wrap=True, flap=0.2, errors=0.2, flap_period=10, flap_down=3)
+    rows = [sim.interface_rows('sim1', sim.start + t) for t in (0, 5, 12, 25, 70)]
+    flapping = {r['name'] for snap in rows for r in snap if r['running'] == 'false'}
+    assert 0 < len(flapping) < 200
+    for i in range(200):
+        series = [int(snap[i]['link-downs']) for snap in rows]
+        assert series == sorted(series)
+        errs = [int(snap[i]['rx-error']) for snap in rows]
+        assert errs == sorted(errs)
+    assert any(int(snap[i]['rx-error']) for snap in rows for i in range(200))
+    rx = [int(snap[0]['rx-byte']) for snap in rows]
+    assert all(0 <= v < WRAP for v in rx) and rx != sorted(rx)  # wrapped at least once
+    assert sim.interface_rows('sim1') != RouterOsSimulator(ifaces=200, seed=2).interface_rows('sim1')
+
+
+def test_compare_flags_regressions_only():
+    base = {'params': {'devices': [100], 'engine': 'thread', 'interval': 5.0, 'tolerance': 0.2},
+            'results': [{'devices': 100, 'engine': 'thread', 'warmed_up': True, 'devices_per_sec': 50.0,
+                         'cycle_avg_ms': 40.0, 'cpu_ms_per_device': 1.0, 'sqlite_ms_per_device': 0.0,
+                         'max_rss_mb': 40.0}]}
+    params = dict(base['params'], devices=[100, 500], tolerance=0.1)
+    same = [dict(base['results'][0], devices_per_sec=48.0, cycle_avg_ms=30.0)]
+    assert compare(same, base, 0.2, params) == []
+    worse = [dict(base['results'][0], devices_per_sec=30.0, max_rss_mb=60.0)]
+    assert [line.split()[3] for line in compare(worse, base, 0.2)] == ['devices_per_sec:', 'max_rss_mb:']
+
+
+def test_compare_fails_runs_it_cannot_compare():
+    base = {'params': {'devices': [100], 'engine': 'thread', 'interval': 5.0},
+            'results': [{'devices': 100, 'engine': 'thread', 'warmed_up': True, 'devices_per_sec': 50.0,
+                         'cycle_avg_ms': 40.0, 'cpu_ms_per_device': 1.0, 'sqlite_ms_per_device': 0.0,
+                         'max_rss_mb': 40.0}]}
+    run = base['results'][0]
+
+    def kinds(results, params=None):
+        return [line.split()[0] for line in compare(results, base, 0.2, params)]
+
+    assert kinds([dict(run, devices=500)]) == ['MISSING']
+    assert kinds([dict(run, engine='async')]) == ['MISSING']
+    assert kinds([dict(run, warmed_up=False)]) == ['WARM-UP']
+    assert kinds([run], dict(base['params'], interval=1.0)) == ['PARAMS']
+    assert kinds([dict(run, cycle_avg_ms=None)]) == ['UNMEASURED']
+    # a metric at 0 is still compared
+    assert kinds([dict(run, sqlite_ms_per_device=0.5)]) == ['REGRESSION']
+    assert kinds([dict(run, devices_per_sec=0)]) == ['REGRESSION']
@@ -31,3 +31,47 @@ def test_speed_mismatch():
     cur = make_snap(speed_mbps='100', expected=1000, ts=2000)
     state, info = classify_interface(cur, prev, {})
     assert state in ("DEGRADED","UP")
+
+def test_parse_speed_variants():
+    from classifier import _parse_speed_to_mbps
+    assert _parse_speed_to_mbps('1Gbps') == 1000
+    assert _parse_speed_to_mbps('2.5Gbps') == 2500
+    assert _parse_speed_to_mbps('100Mbps') == 100
+    assert _parse_speed_to_mbps(1000) == 1000
+    assert _parse_speed_to_mbps('auto') == 0
+    assert _parse_speed_to_mbps(None) == 0
+
+def test_classify_batch_matches_classify_interface():
+    import random
+    from classifier import classify_batch, to_columns
+    rnd = random.Random(7)
+    thresholds = {'err_per_sec': 0.5, 'flaps_window': 300, 'flaps_count': 3}
+    curs, prevs = [], []
+    for _ in range(2000):
+        prev = make_snap(rx_bytes=rnd.randint(0, 10**6), rx_errors=rnd.randint(0, 100), ts=1000,
+                         speed_mbps=rnd.choice([100, 1000, '1Gbps']))
+        prev['link_downs'] = rnd.randint(0, 5)
+        cur = make_snap(rx_bytes=rnd.randint(0, 10**6), rx_errors=prev['rx_errors'] + rnd.randint(-5, 200),
+                        tx_errors=rnd.randint(0, 3), ts=rnd.choice([1000, 1015, 1060]),
+                        speed_mbps=rnd.choice([100, 1000, '1Gbps', '100Mbps', None]),
+                        expected=rnd.choice([None, 1000]), carrier=rnd.random() > 0.1,
+                        disabled=rnd.random() < 0.05)
+        cur['link_downs'] = prev['link_downs'] + rnd.choice([0, 0, 1, 3])
+        cur['downs_ts'] = [cur['ts'] - rnd.randint(0, 600) for _ in range(rnd.randint(0, 3))]
+        curs.append(cur)
+        prevs.append(prev if rnd.random() > 0.2 else None)
+    res = classify_batch(*to_columns(curs, prevs), thresholds)
+    for k, (cur, prev) in enumerate(zip(curs, prevs)):
+        assert (res.states[k], res.infos[k]) == classify_interface(cur, prev, thresholds)
+        if prev:
+            interval = max(1, cur['ts'] - prev['ts'])
+            assert res.rx_bps[k] == max(0, (cur['rx_bytes'] - prev['rx_bytes']) * 8 / interval)
+
+def test_classify_batch_counter_wrap():
+    from classifier import classify_batch, to_columns, _counter_delta
+    prev = make_snap(rx_bytes=2**32 - 100, ts=0)
+    cur = make_snap(rx_bytes=50, ts=10)
+    plain = classify_batch(*to_columns([cur], [prev]), {})
+    wrapped = classify_batch(*to_columns([cur], [prev]), {}, max_counter=2**32 - 1)
+    assert plain.rx_bps == [0]
+    assert wrapped.rx_bps == [_counter_delta(2**32 - 100, 50, 2**32 - 1) * 8 / 10]
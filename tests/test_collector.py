@@ -0,0 +1,58 @@
+import time
+import sqlite3
+import threading
+import collector_api
+from fake_routeros import FakeRouterOS, default_interfaces
+
+
+def run_collector(config, until, timeout=10):
+    collector_api.shutdown_event.clear()
+    t = threading.Thread(target=collector_api.start_collector, args=(config,), daemon=True)
+    t.start()
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline and not until():
+            time.sleep(0.05)
+    finally:
+        collector_api.shutdown_event.set()
+        t.join(timeout=10)
+    assert not t.is_alive()
+
+
+def test_collector_end_to_end(tmp_path):
+    ifaces = default_interfaces(3)
+    ifaces[1]['running'] = 'false'
+    db_path = str(tmp_path / 'state.db')
+    with FakeRouterOS(interfaces=ifaces) as fake:
+        config = {'devices': [fake.device_cfg('R1')], 'poll_interval': 1, 'db_path': db_path,
+                  'history': {'db_path': str(tmp_path / 'history.db')}}
+
+        def done():
+            try:
+                con = sqlite3.connect(db_path)
+                n = con.execute("SELECT count(*) FROM iface_state").fetchone()[0]
+                con.close()
+                return n == 3
+            except sqlite3.Error:
+                return False
+
+        run_collector(config, done)
+    con = sqlite3.connect(db_path)
+    events = con.execute("SELECT device, iface, event FROM event_log").fetchall()
+    con.close()
+    assert events == [('R1', 'ether2', "initial_state DOWN : {'reason': 'no carrier'}")]
+
+
+def test_transitions_use_stored_state(tmp_path):
+    from state_store import StateStore, StateCache
+    db = StateCache(StateStore(str(tmp_path / 's.db'), batched=True))
+    snap = {'ts': 100, 'carrier': True, 'link_downs': 0, 'rx_errors': 0}
+    # stored state wins over re-classifying prev (which alone would say UP)
+    db.save_state('R1', 'ether1', dict(snap, state='DOWN', reason='high_error_rate', state_since=40))
+    db.save_state('R1', 'ether2', dict(snap, state='UP', reason='carrier OK', state_since=40))
+    db.save_state('R1', 'ether3', dict(snap, carrier=False))  # saved before states were stored
+    r = {'device': 'R1', 'ifaces': {n: dict(snap, ts=115) for n in ('ether1', 'ether2', 'ether3')}}
+    _, records = collector_api.classify_result(r, db, {})
+    got = {name: (prev_state, state, cur['state_since']) for name, cur, prev_state, state, info, _ in records}
+    assert got == {'ether1': ('DOWN', 'UP', 115), 'ether2': ('UP', 'UP', 40), 'ether3': ('DOWN', 'UP', 115)}
+    db.close()
@@ -0,0 +1,67 @@
+import socket
+import time
+from fake_routeros import FakeRouterOS
+from collector_api import poll_device
+from collector_async import AsyncEngine
+
+
+def test_async_result_matches_thread_engine():
+    with FakeRouterOS() as fake:
+        engine = AsyncEngine()
+        try:
+            dev = fake.device_cfg(expected_speed_mbps=1000)
+            results, failures = engine.poll_all([dev])
+            expected = poll_device(dev)
+            assert failures == {}
+            for snap in list(results[0]['ifaces'].values()) + list(expected['ifaces'].values()):
+                snap.pop('ts')
+            assert results == [expected]
+        finally:
+            engine.close()
+
+
+def test_hung_device_times_out_without_stalling_others():
+    hung = socket.socket()
+    hung.bind(('127.0.0.1', 0))
+    hung.listen(8)
+    with FakeRouterOS() as fake:
+        engine = AsyncEngine(device_timeout=0.5)
+        try:
+            devs = [fake.device_cfg('R1'), fake.device_cfg('R2'),
+                    {'name': 'HUNG', 'ip': '127.0.0.1', 'api_port': hung.getsockname()[1]}]
+            t0 = time.monotonic()
+            results, failures = engine.poll_all(devs)
+            assert time.monotonic() - t0 < 2
+            assert sorted(r['device'] for r in results) == ['R1', 'R2']
+            assert failures == {'HUNG': 'timeout'}
+        finally:
+            engine.close()
+            hung.close()
+
+
+def test_sessions_reused_and_reopened_after_drop():
+    with FakeRouterOS() as fake:
+        engine = AsyncEngine()
+        try:
+            dev = fake.device_cfg()
+            engine.poll_all([dev])
+            engine.poll_all([dev])
+            assert fake.logins == 1
+            fake.drop_all()
+            time.sleep(0.05)
+            results, failures = engine.poll_all([dev])
+            assert failures == {} and len(results) == 1
+            assert fake.logins == 2
+        finally:
+            engine.close()
+
+
+def test_bad_credentials_reported_as_failure():
+    with FakeRouterOS() as fake:
+        engine = AsyncEngine()
+        try:
+            results, failures = engine.poll_all([fake.device_cfg(**{'pass': 'nope'})])
+            assert results == []
+            assert 'invalid user name' in failures['R1']
+        finally:
+            engine.close()
@@ -0,0 +1,87 @@
+import time
+import logging
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from fake_routeros import FakeRouterOS
+from connection_pool import ConnectionManager, DeviceBackoff
+from collector_api import poll_device, thread_submit
+
+
+def test_session_reused_between_polls():
+    with FakeRouterOS() as fake:
+        cm = ConnectionManager()
+        dev = fake.device_cfg()
+        for _ in range(5):
+            r = poll_device(dev, connections=cm)
+            assert set(r['ifaces']) == {'ether1', 'ether2', 'ether3'}
+        assert fake.connections == 1
+        assert fake.logins == 1
+        st = cm.stats()
+        assert st['opened'] == 1 and st['reused'] == 4
+        assert st['reuse_ratio'] == pytest.approx(0.8)
+        assert st['connect_seconds_max'] is not None
+        cm.close_all()
+
+
+def test_reconnect_after_server_drop():
+    with FakeRouterOS() as fake:
+        cm = ConnectionManager()
+        dev = fake.device_cfg()
+        poll_device(dev, connections=cm)
+        fake.drop_all()
+        time.sleep(0.05)
+        r = poll_device(dev, connections=cm)
+        assert r['ifaces']['ether1']['carrier'] is True
+        assert fake.connections == 2
+        assert fake.logins == 2
+        cm.close_all()
+
+
+def test_idle_sessions_are_evicted():
+    with FakeRouterOS() as fake:
+        cm = ConnectionManager(idle_timeout=0)
+        poll_device(fake.device_cfg(), connections=cm)
+        assert cm.stats()['open'] == 1
+        assert cm.evict_idle() == 1
+        assert cm.stats()['open'] == 0
+
+
+def test_failed_login_backs_off():
+    with FakeRouterOS() as fake:
+        cm = ConnectionManager(backoff_base=30)
+        dev = fake.device_cfg(password='wrong', **{'pass': 'wrong'})
+        with pytest.raises(Exception):
+            poll_device(dev, connections=cm)
+        with pytest.raises(DeviceBackoff):
+            poll_device(dev, connections=cm)
+        assert fake.connections == 1
+        assert cm.stats()['failed'] == 1
+
+
+def test_backoff_skips_are_not_logged_as_failures(caplog):
+    with FakeRouterOS() as fake, ThreadPoolExecutor(1) as executor:
+        cm = ConnectionManager(backoff_base=30)
+        dev = fake.device_cfg(password='wrong', **{'pass': 'wrong'})
+        submit = thread_submit(executor, lambda d: poll_device(d, connections=cm))
+        errors = []
+        caplog.set_level(logging.DEBUG, logger='collector')
+        for _ in range(2):
+            submit([dev], lambda r: None, lambda d, reason: errors.append(reason))
+            executor.submit(lambda: None).result()  # the single worker has run the poll
+        assert len(errors) == 2 and 'backoff' in errors[1]
+        failures = [r for r in caplog.records if r.levelno >= logging.ERROR]
+        assert len(failures) == 1 and failures[0].exc_info  # the login failure only
+        assert any(r.levelno == logging.DEBUG and 'backoff' in r.getMessage() for r in caplog.records)
+
+
+def test_poll_round_trips_do_not_grow_with_ports():
+    from fake_routeros import default_interfaces
+    with FakeRouterOS(interfaces=default_interfaces(60)) as fake:
+        cm = ConnectionManager()
+        r = poll_device(fake.device_cfg(expected_speed_mbps=1000), connections=cm)
+        assert len(r['ifaces']) == 60
+        assert r['ifaces']['ether60']['speed_mbps'] == 1000
+        assert fake.calls.count('/interface/print') == 1
+        assert fake.calls.count('/interface/ethernet/print') == 1
+        assert cm.acquire(fake.device_cfg()).api.communicator.calls == 2
+        cm.close_all()
@@ -0,0 +1,97 @@
+from correlator import IncidentCorrelator
+from alerter import build_alert_request
+from alert_dispatch import TokenBucket
+
+
+def test_reboot_becomes_one_incident_and_resolves():
+    sent = []
+    c = IncidentCorrelator(lambda *a, **kw: sent.append((a, kw)), window=30)
+    for i in range(24):
+        c.add('CORE-1', f'ether{i}', 'DOWN', {'reason': 'no carrier'}, ts=1000)
+    c.add('CORE-1', 'ether1', 'UP', {}, ts=1005)  # back within the window
+    c.add('CORE-1', 'ether1', 'DOWN', {'reason': 'no carrier'}, ts=1010)
+    assert c.flush(now=1020) == 0
+    assert c.flush(now=1030) == 1
+    (device, iface, state, details), kw = sent[0]
+    assert (device, iface, state, kw['action'], kw['dedup_key']) == ('CORE-1', '*', 'DOWN', 'trigger', 'noc-CORE-1')
+    assert kw['summary'].startswith('CORE-1: 24 DOWN (')
+    assert len(details['interfaces']) == 24
+
+    # repeated state is not re-sent
+    c.add('CORE-1', 'ether3', 'DOWN', {'reason': 'no carrier'}, ts=1045)
+    assert c.flush(now=1100) == 0
+
+    for i in range(24):
+        c.add('CORE-1', f'ether{i}', 'UP', {}, ts=1200)
+    assert c.flush(now=1300) == 1
+    assert sent[-1][1]['action'] == 'resolve'
+    assert c.open_incidents() == {}
+
+
+def test_restored_incident_resolves_after_restart(tmp_path, monkeypatch):
+    c = IncidentCorrelator(lambda *a, **kw: None, window=0)
+    c.add('R1', 'ether1', 'UP', {}, ts=1)
+    assert c.flush(now=1) == 0  # nothing known open: a flap within the window
+    c.restore('R1', [('ether1', 'DOWN', {'reason': 'no carrier'}), ('ether2', 'UP', {})])
+    assert c.open_incidents() == {'R1': {('R1', 'ether1'): ('DOWN', {'reason': 'no carrier'})}}
+    c.restore('R1', [])
+    assert c.open_incidents() == {}
+
+    # collector restart: the DOWN stored by the previous run is resolved by the next UP poll
+    from alert_dispatch import AlertDispatcher
+    from state_store import StateStore
+    from fake_routeros import FakeRouterOS, default_interfaces
+    from test_collector import run_collector
+    sent = []
+    monkeypatch.setattr(AlertDispatcher, 'submit', lambda self, *a, **kw: sent.append(kw))
+    db_path = str(tmp_path / 's.db')
+    store = StateStore(db_path)
+    store.save_iface_snapshot('R1', 'ether1', {'ts': 1, 'state': 'DOWN', 'reason': 'no carrier', 'state_since': 1,
+                                               'carrier': False, 'disabled': False, 'link_downs': 0})
+    with FakeRouterOS(interfaces=default_interfaces(1)) as fake:
+        config = {'devices': [fake.device_cfg('R1')], 'poll_interval': 1, 'db_path': db_path,
+                  'history': {'enabled': False}, 'correlation': {'window': 0},
+                  'alerting': {'dispatch': {'spill_path': str(tmp_path / 'spill.jsonl')}}}
+        run_collector(config, lambda: sent)
+    assert [(kw['action'], kw['dedup_key']) for kw in sent] == [('resolve', 'noc-R1')]
+
+
+def test_sites_follow_device_configs_and_sharding_keys_per_device():
+    sent = []
+    c = IncidentCorrelator(lambda *a, **kw: sent.append(kw), window=0)
+    c.set_sites([{'name': 'R1', 'site': 'lima'}, {'name': 'R2', 'site': 'lima'}])  # e.g. from the inventory
+    c.add('R1', 'ether1', 'DOWN', {}, ts=1)
+    c.flush(now=1)
+    assert sent[-1]['dedup_key'] == 'noc-lima'
+    c.set_sites([{'name': 'R1', 'site': 'cusco'}, {'name': 'R2', 'site': 'lima'}])
+    c.flush(force=True)
+    assert sorted((kw['dedup_key'], kw['action']) for kw in sent[1:]) == [('noc-cusco', 'trigger'),
+                                                                         ('noc-lima', 'resolve')]
+    assert list(c.open_incidents()) == ['cusco']
+
+    c = IncidentCorrelator.from_config({'devices': [{'name': 'R1', 'site': 'lima'}], 'sharding': {'enabled': True}},
+                                       lambda *a, **kw: None)
+    c.set_sites([{'name': 'R1', 'site': 'lima'}])
+    assert c.group_of('R1') == 'R1'
+
+
+def test_sites_group_devices_and_pagerduty_resolve():
+    sent = []
+    c = IncidentCorrelator(lambda *a, **kw: sent.append(kw), window=0, sites={'R1': 'lima', 'R2': 'lima'})
+    c.add('R1', 'ether1', 'DOWN', {}, ts=1)
+    c.add('R2', 'ether1', 'DEGRADED', {}, ts=1)
+    c.flush(now=1)
+    assert len(sent) == 1 and sent[0]['dedup_key'] == 'noc-lima'
+    assert '1 DOWN' in sent[0]['summary'] and '1 DEGRADED' in sent[0]['summary']
+
+    cfg = {'provider': 'pagerduty', 'routing_key': 'k'}
+    _, _, trigger = build_alert_request('lima', '*', 'DOWN', {}, cfg, 'lima: 1 DOWN', 'trigger', 'noc-lima')
+    _, _, resolve = build_alert_request('lima', '*', 'UP', {}, cfg, 'lima: recovered', 'resolve', 'noc-lima')
+    assert trigger['dedup_key'] == resolve['dedup_key'] == 'noc-lima'
+    assert resolve == {'routing_key': 'k', 'event_action': 'resolve', 'dedup_key': 'noc-lima'}
+
+
+def test_token_bucket_limits_rate():
+    b = TokenBucket(rate=10, burst=2)
+    assert b.reserve() == 0 and b.reserve() == 0
+    assert 0.05 < b.reserve() <= 0.1
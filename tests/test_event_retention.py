@@ -0,0 +1,77 @@
+import os
+import sqlite3
+from state_store import StateStore
+from event_retention import EventRetention, archived_events, period_key, period_bounds
+
+DAY = 86400
+NOW = 1_790_000_000  # 2026-09-21
+
+
+def fill(path, rows):
+    store = StateStore(path)
+    con = store._connect()
+    con.executemany("INSERT INTO event_log(device, iface, ts, event, state) VALUES (?,?,?,?,?)", rows)
+    con.commit()
+    con.close()
+
+
+def test_period_keys():
+    assert period_key(NOW) == '202609' and period_key(NOW, 'day') == '20260921'
+    start, end = period_bounds('202612')
+    assert period_key(start) == '202612' and period_key(end) == '202701' and period_key(end - 1) == '202612'
+    assert period_bounds('20260921')[1] - period_bounds('20260921')[0] == DAY
+
+
+def test_moves_compacts_and_expires(tmp_path):
+    path = str(tmp_path / 's.db')
+    old = NOW - 40 * DAY
+    flaps = []
+    for k in range(50):  # flapping port: alternating transitions one minute apart
+        t = 'UP -> DOWN' if k % 2 == 0 else 'DOWN -> UP'
+        flaps.append(('R1', 'ether1', old + 60 * k, f"state_change {t} : {{'n': {k}}}", t.split()[-1]))
+    fill(path, flaps + [('R2', 'ether2', old + 30, 'initial_state DOWN : {}', 'DOWN'),
+                        ('R1', 'ether1', NOW - DAY, 'state_change UP -> DOWN : {}', 'DOWN')])
+    r = EventRetention(path, str(tmp_path / 'arch'), hot_days=7, keep_days=90, batch=7, clock=lambda: NOW)
+    assert r.run_once() == 51
+    con = sqlite3.connect(path)
+    assert con.execute("SELECT ts FROM event_log").fetchall() == [(NOW - DAY,)]
+    con.close()
+    assert r.partitions() == [period_key(old)]
+    runs = archived_events(str(tmp_path / 'arch'), device='R1')
+    assert sorted((x['kind'], x['count']) for x in runs) == [('state_change DOWN -> UP', 25),
+                                                             ('state_change UP -> DOWN', 25)]
+    down = next(x for x in runs if x['kind'] == 'state_change UP -> DOWN')
+    assert (down['ts'], down['last_ts']) == (old, old + 60 * 48) and down['event'].endswith("{'n': 48}")
+    assert len(archived_events(str(tmp_path / 'arch'), since=NOW - 3 * DAY)) == 0
+
+    # crash after the partition commit, before the hot-table delete: the rows come back
+    fill(path, [('R3', 'ether1', old + 7200, 'initial_state DOWN : {}', 'DOWN')])
+    con = sqlite3.connect(path)
+    lost = con.execute("SELECT * FROM event_log WHERE device='R3'").fetchall()
+    assert r.step() == 1
+    con.executemany("INSERT INTO event_log(id, device, iface, ts, event, state) VALUES (?,?,?,?,?,?)", lost)
+    con.commit()
+    assert r.step() == 1
+    assert con.execute("SELECT count(*) FROM event_log WHERE device='R3'").fetchone()[0] == 0
+    con.close()
+    assert [x['count'] for x in archived_events(str(tmp_path / 'arch'), device='R3')] == [1]
+
+    r.clock = lambda: NOW + 200 * DAY
+    r.archive = True
+    assert r.expire() == [period_key(old)]
+    assert os.path.exists(r.partition_path(period_key(old)) + '.gz') and r.partitions() == []
+    r.close()
+
+
+def test_moving_rows_changes_the_events_etag(tmp_path, monkeypatch):
+    from test_api_server import load_app
+    api = load_app(tmp_path, monkeypatch)
+    path = str(tmp_path / 'state.db')
+    fill(path, [('R1', 'ether1', NOW - 40 * DAY, 'initial_state DOWN : {}', 'DOWN')])
+    client = api.app.test_client()
+    etag = client.get('/api/v1/events').headers['ETag']
+    r = EventRetention(path, str(tmp_path / 'arch'), hot_days=7, clock=lambda: NOW)
+    assert r.step() == 1
+    r.close()
+    again = client.get('/api/v1/events', headers={'If-None-Match': etag})
+    assert again.status_code == 200 and again.get_json()['events'] == []
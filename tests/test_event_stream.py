@@ -0,0 +1,136 @@
+import json
+import socket
+import time
+from event_stream import BroadcastBuffer, StreamServer
+
+
+def connect(port, query='', headers=''):
+    s = socket.create_connection(('127.0.0.1', port), timeout=5)
+    s.sendall(f"GET /api/v1/stream{query} HTTP/1.1\r\nHost: x\r\n{headers}\r\n".encode())
+    return s
+
+
+def read_events(sock, n, timeout=5):
+    """First n events as (id, type, data), skipping comments and retry lines."""
+    buf, out = b'', []
+    deadline = time.monotonic() + timeout
+    while len(out) < n and time.monotonic() < deadline:
+        buf += sock.recv(65536)
+        while b'\n\n' in buf:
+            block, buf = buf.split(b'\n\n', 1)
+            fields = dict(line.split(': ', 1) for line in block.decode().split('\n') if ': ' in line
+                          and not line.startswith(':'))
+            if 'event' in fields:
+                out.append((fields.get('id'), fields['event'], json.loads(fields['data'])))
+    return out
+
+
+def test_buffer_gap_and_resume_point():
+    b = BroadcastBuffer(size=4)
+    for i in range(6):
+        b.publish('transition', {'i': i}, 'R1', 'DOWN')
+    events, gap = b.since(0)
+    assert gap and [e[0] for e in events] == [3, 4, 5, 6]
+    assert b.since(4) == (b.since(4)[0], False) and [e[0] for e in b.since(4)[0]] == [5, 6]
+    assert b.resume_point(f"{b.epoch}-5") == (5, False)
+    assert b.resume_point(f"{b.epoch - 1}-5") == (0, True)
+    assert b.resume_point(None) == (6, False)
+
+
+def test_filters_resume_and_fan_out():
+    server = StreamServer(port=0, addr='127.0.0.1', keepalive=60).start()
+    try:
+        down = connect(server.port, '?state=down')
+        r2 = connect(server.port, '?device=R2&type=rates')
+        crowd = [connect(server.port) for _ in range(200)]
+        deadline = time.monotonic() + 5
+        while server.subscribers() < 202 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert server.subscribers() == 202
+        pub = server.buffer.publish
+        pub('transition', {'device': 'R1', 'iface': 'ether1', 'state': 'DOWN'}, 'R1', 'DOWN')
+        pub('transition', {'device': 'R1', 'iface': 'ether1', 'state': 'UP'}, 'R1', 'UP')
+        pub('rates', {'device': 'R2', 'rx_bps': 1.0}, 'R2')
+        pub('transition', {'device': 'R2', 'iface': 'ether2', 'state': 'DOWN'}, 'R2', 'DOWN')
+
+        got = read_events(down, 2)
+        assert [(t, d['device']) for _, t, d in got] == [('transition', 'R1'), ('transition', 'R2')]
+        assert [t for _, t, _ in read_events(r2, 1)] == ['rates']
+        for s in crowd[:20]:
+            assert len(read_events(s, 4)) == 4
+
+        # reconnect after the first event: only what came later
+        first_id = got[0][0]
+        down.close()
+        again = connect(server.port, '', f"Last-Event-ID: {first_id}\r\n")
+        assert [d.get('state') for _, _, d in read_events(again, 3)] == ['UP', None, 'DOWN']
+        stale = connect(server.port, '?last_event_id=1-1')
+        assert read_events(stale, 1)[0][1] == 'reset'
+        for s in crowd + [r2, again, stale]:
+            s.close()
+    finally:
+        server.stop()
+
+
+def test_collector_publishes_transitions_and_rates(tmp_path, monkeypatch):
+    from fake_routeros import FakeRouterOS, default_interfaces
+    from test_collector import run_collector
+    seen = []
+    publish = BroadcastBuffer.publish
+
+    def spy(self, type_, data, device=None, state=None):
+        seen.append((type_, data))
+        return publish(self, type_, data, device, state)
+
+    monkeypatch.setattr(BroadcastBuffer, 'publish', spy)
+    ifaces = default_interfaces(2)
+    ifaces[1]['running'] = 'false'
+    with FakeRouterOS(interfaces=ifaces) as fake:
+        config = {'devices': [fake.device_cfg('R1')], 'poll_interval': 1, 'db_path': str(tmp_path / 's.db'),
+                  'history': {'enabled': False}, 'stream': {'enabled': True, 'port': 0}}
+        run_collector(config, lambda: {'transition', 'rates'} <= {t for t, _ in seen})
+    kinds = dict(seen)
+    assert kinds['transition']['iface'] == 'ether2' and kinds['transition']['state'] == 'DOWN'
+    assert kinds['rates']['states'] == {'UP': 1, 'DOWN': 1}
+
+
+def test_publish_while_draining_is_not_lost():
+    import select
+    import threading
+    server = StreamServer(port=0, addr='127.0.0.1')  # selector loop not started: drained here like _run does
+    wake_r, publisher = server._wake_r, []
+
+    class Racing:
+        """The wake socket, with a publish landing as the drain starts reading."""
+
+        def recv(self, n):
+            if not publisher:
+                publisher.append(threading.Thread(target=server._wake))
+                publisher[0].start()
+                publisher[0].join(0.2)
+            return wake_r.recv(n)
+
+    server._wake()
+    server._wake_r = Racing()
+    server._drain_wake()
+    publisher[0].join(5)
+    readable, _, _ = select.select([wake_r], [], [], 1.0)
+    assert readable or not server._woken, "wake lost: flag set but nothing to read"
+    server._wake_r = wake_r
+    for sock in (wake_r, server._wake_w, server._lsock):
+        sock.close()
+
+
+def test_stream_requires_the_api_key_and_no_wildcard_origin(monkeypatch):
+    monkeypatch.setenv('API_KEY', 'k')
+    server = StreamServer.from_config({'stream': {'enabled': True, 'port': 0, 'listen_addr': '127.0.0.1'}}).start()
+    try:
+        s = connect(server.port)
+        assert s.recv(100).startswith(b'HTTP/1.1 401')
+        s.close()
+        s = connect(server.port, '?api_key=k')
+        head = s.recv(4096)
+        assert head.startswith(b'HTTP/1.1 200') and b'Access-Control-Allow-Origin' not in head
+        s.close()
+    finally:
+        server.stop()
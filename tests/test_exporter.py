@@ -0,0 +1,58 @@
+import gzip
+import urllib.request
+from prometheus_client import CollectorRegistry
+from prometheus_client.parser import text_string_to_metric_families
+from exporter import InterfaceTable, start_http_server
+
+
+def samples(body):
+    return {(s.name, tuple(sorted(s.labels.items()))): s.value
+            for fam in text_string_to_metric_families(body.decode()) for s in fam.samples}
+
+
+def test_one_series_per_interface_and_gone_interfaces_dropped():
+    t = InterfaceTable()
+    t.update_device('R1', [('ether1', 'UP', (8.0, 16.0, 0.5, 0.0)), ('ether"2', 'DOWN', None)])
+    t.observe_poll('R1', 0.25)
+    t.observe_poll('R2', 10.0, ok=False)
+    s = samples(t.render())
+    assert s[('noc_interface_up', (('device', 'R1'), ('iface', 'ether1')))] == 1
+    assert s[('noc_interface_state', (('device', 'R1'), ('iface', 'ether"2')))] == 2
+    assert s[('noc_interface_rx_bps', (('device', 'R1'), ('iface', 'ether1')))] == 8
+    assert s[('noc_device_poll_seconds', (('device', 'R1'),))] == 0.25
+    assert s[('noc_device_poll_success', (('device', 'R2'),))] == 0
+    assert s[('noc_device_poll_failures_total', (('device', 'R2'),))] == 1
+
+    # state change keeps the same series; a vanished interface is no longer exported
+    t.update_device('R1', [('ether1', 'DEGRADED', (8.0, 16.0, 0.5, 0.0))])
+    s = samples(t.render())
+    assert [k for k in s if k[0] == 'noc_interface_state'] == [
+        ('noc_interface_state', (('device', 'R1'), ('iface', 'ether1')))]
+    assert s[('noc_interface_state', (('device', 'R1'), ('iface', 'ether1')))] == 1
+    t.retain_devices(['R2'])
+    assert t.series() == 0 and ('noc_device_poll_seconds', (('device', 'R1'),)) not in samples(t.render())
+
+
+def test_http_scrape_with_gzip():
+    t = InterfaceTable()
+    t.update_device('R1', [('ether1', 'UP', None)])
+    server = start_http_server(0, '127.0.0.1', table=t, registry=CollectorRegistry())
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        req = urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'})
+        with urllib.request.urlopen(req) as r:
+            body = gzip.decompress(r.read())
+        assert samples(body)[('noc_interface_up', (('device', 'R1'), ('iface', 'ether1')))] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_set_states_keeps_rates():
+    t = InterfaceTable()
+    t.update_device('R1', [('ether1', 'UP', (8.0, 16.0, 0.5, 0.0)), ('ether2', 'UP', None)])
+    t.set_states('R1', {'ether1': 'DOWN'})
+    t.set_states('R9', {'ether1': 'DOWN'})  # unknown device: ignored
+    text = t.render().decode()
+    assert 'noc_interface_up{device="R1",iface="ether1"} 0.0' in text
+    assert 'noc_interface_rx_bps{device="R1",iface="ether1"} 8.0' in text and 'R9' not in text
@@ -0,0 +1,37 @@
+import random
+from flap_tracker import FlapTracker, downs_within
+from classifier import classify_interface
+
+
+def test_ring_counts_and_roundtrip():
+    t = FlapTracker(slots=4)
+    t.record(100, 1000)  # one slot no matter how many downs
+    t.record(100, 1)
+    t.record(200)
+    assert len(t) == 2
+    assert t.count_within(200, 100) == 1002
+    assert t.count_within(250, 100) == 1
+    assert t.count_within(350, 100) == 0
+    for ts in (300, 400, 500):
+        t.record(ts)
+    assert len(t) == 4  # 100 overwritten
+    assert t.count_within(500, 1000) == 4
+    back = FlapTracker.from_text(t.to_text(), slots=4)
+    assert back.pack() == t.pack()
+    assert len(t.pack()) == 4 * 8
+    assert FlapTracker().to_text() == ''
+
+
+def test_legacy_downs_ts_same_decision():
+    rnd = random.Random(3)
+    th = {'flaps_window': 300, 'flaps_count': 3}
+    for _ in range(500):
+        now = 10000
+        downs_ts = [now - rnd.randint(0, 600) for _ in range(rnd.randint(0, 6))]
+        prev = {'ts': now - 15, 'link_downs': 5}
+        cur = {'ts': now, 'link_downs': 5 + rnd.choice([0, 0, 1]), 'downs_ts': downs_ts}
+        text = FlapTracker.from_snapshot(cur).to_text()
+        assert downs_within(text, now, 300) == downs_within(downs_ts, now, 300)
+        new = {k: v for k, v in cur.items() if k != 'downs_ts'}
+        new['flaps'] = text
+        assert classify_interface(new, prev, th) == classify_interface(cur, prev, th)
@@ -0,0 +1,60 @@
+import json
+from fleet_summary import FleetSummary, merge
+
+
+def rows(states, err=0.0, rx=0.0):
+    return [(f'ether{i}', s, (rx * i, 0.0, err * i), 1000) for i, s in enumerate(states)]
+
+
+def test_counts_follow_each_device_update():
+    s = FleetSummary(top_n=3)
+    s.update_device('R1', rows(['UP', 'UP', 'DOWN']))
+    s.update_device('R2', rows(['UP', 'DEGRADED']))
+    assert s.fleet_counts() == {'UP': 3, 'DOWN': 1, 'DEGRADED': 1}
+    s.update_device('R1', rows(['UP', 'UP', 'UP']))
+    assert s.fleet_counts() == {'UP': 4, 'DEGRADED': 1}
+    s.remove_device('R2')
+    assert s.fleet_counts() == {'UP': 3}
+    assert s.snapshot()['devices'] == {'R1': {'UP': 3}}
+    s.move_states('R1', [('UP', 'DOWN')])  # link change between polls
+    s.move_states('R2', [('UP', 'DOWN')])  # no longer summarized
+    assert s.fleet_counts() == {'UP': 2, 'DOWN': 1}
+
+
+def test_top_lists_failed_polls_and_render_cache():
+    s = FleetSummary(top_n=2)
+    s.update_device('R1', rows(['UP'] * 4, err=1.0, rx=1e8))
+    s.update_device('R2', rows(['UP'] * 4, err=0.5, rx=3e8))
+    s.poll_failed('R3', 'timeout', ts=100)
+    s.poll_failed('R3', 'timeout', ts=115)
+    snap = s.snapshot()
+    assert [(e['device'], e['iface']) for e in snap['top_errors']] == [('R1', 'ether3'), ('R1', 'ether2')]
+    assert [(e['device'], e['iface'], e['utilization']) for e in snap['top_utilization']] == \
+        [('R2', 'ether3', 0.9), ('R2', 'ether2', 0.6)]
+    assert snap['failed_polls'] == {'R3': {'since': 100, 'failures': 2, 'reason': 'timeout'}}
+    changed, text = s.render()
+    assert changed and s.render() == (False, text)
+    s.update_device('R3', rows(['UP']))
+    changed, text = s.render()
+    assert changed and json.loads(text)['failed_polls'] == {}
+
+
+def test_merge_shards():
+    a, b = FleetSummary(top_n=2), FleetSummary(top_n=2)
+    a.update_device('R1', rows(['UP', 'DOWN'], err=1.0))
+    b.update_device('R2', rows(['UP', 'UP', 'DOWN'], err=2.0))
+    m = merge([a.snapshot(), b.snapshot()], top_n=2)
+    assert m['fleet'] == {'UP': 3, 'DOWN': 2} and m['interfaces'] == 5
+    assert set(m['devices']) == {'R1', 'R2'}
+    assert [e['device'] for e in m['top_errors']] == ['R2', 'R2']
+
+
+def test_pruned_top_matches_full_sort():
+    import random
+    from fleet_summary import _top
+    rnd = random.Random(3)
+    for devices in (1, 3, 50):
+        per_device = [(f'R{d}', sorted(((rnd.random(), f'e{i}') for i in range(rnd.randrange(0, 8))), reverse=True))
+                      for d in range(devices)]
+        full = sorted(((v, d, i) for d, lst in per_device for v, i in lst), reverse=True)[:5]
+        assert _top(per_device, 5) == full
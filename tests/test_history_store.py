@@ -0,0 +1,59 @@
+import time
+from history_store import HistoryStore
+
+
+def test_rollups_average_and_max(tmp_path):
+    h = HistoryStore(str(tmp_path / 'h.db'))
+    base = int(time.time()) // 3600 * 3600 - 3600
+    for k in range(8):  # 2 minutes of 15 s samples
+        h.append('R1', 'ether1', base + k * 15, rx_bps=100 * (k + 1), tx_bps=10, err_rate=0, drop_rate=k)
+    assert h.flush() == 8
+    res, raw = h.query('R1', 'ether1', base, base + 3600, resolution='raw')
+    assert len(raw) == 8 and raw[0]['rx_bps'] == 100
+    res, m1 = h.query('R1', 'ether1', base, base + 3600, resolution='1m')
+    assert [r['ts'] for r in m1] == [base, base + 60]
+    assert m1[0]['rx_bps'] == 250 and m1[0]['rx_max'] == 400
+    res, hour = h.query('R1', 'ether1', base, base + 3600, resolution='1h')
+    assert len(hour) == 1 and hour[0]['rx_bps'] == 450 and hour[0]['drop_rate'] == 3.5
+    # a later flush into the same bucket merges instead of overwriting
+    h.append('R1', 'ether1', base + 120, rx_bps=900, tx_bps=10, err_rate=0, drop_rate=0)
+    h.flush()
+    res, hour = h.query('R1', 'ether1', base, base + 3600, resolution='1h')
+    assert hour[0]['rx_max'] == 900 and hour[0]['rx_bps'] == 500
+    # replayed samples (same series and ts) are stored and rolled up once
+    h.append('R1', 'ether1', base + 120, rx_bps=900, tx_bps=10, err_rate=0, drop_rate=0)
+    h.append('R1', 'ether1', base + 135, rx_bps=0, tx_bps=10, err_rate=0, drop_rate=0)
+    h.append('R1', 'ether1', base + 135, rx_bps=0, tx_bps=10, err_rate=0, drop_rate=0)
+    assert h.flush() == 1
+    res, hour = h.query('R1', 'ether1', base, base + 3600, resolution='1h')
+    assert hour[0]['rx_bps'] == 4500 / 10
+    h.close()
+
+
+def test_retention_per_resolution_and_auto_resolution(tmp_path):
+    now = int(time.time())
+    h = HistoryStore(str(tmp_path / 'h.db'), retention={'raw': 3600})
+    h.append('R1', 'ether1', now - 7200, 1, 1, 0, 0)
+    h.append('R1', 'ether1', now - 60, 1, 1, 0, 0)
+    h.flush()
+    assert h.prune(now) == 1
+    assert len(h.query('R1', 'ether1', now - 86400, now, resolution='raw')[1]) == 1
+    assert len(h.query('R1', 'ether1', now - 86400, now, resolution='1m')[1]) == 2
+    assert h.pick_resolution(now - 1800, now) == 'raw'
+    assert h.pick_resolution(now - 30 * 86400, now) == '1h'
+    assert h.query('R9', 'ether1', 0, now) == ('1h', [])
+    h.close()
+
+
+def test_reader_sees_series_created_after_it_opened(tmp_path):
+    path = str(tmp_path / 'h.db')
+    reader = HistoryStore(path)  # like api_server: opened once at import
+    writer = HistoryStore(path)
+    assert reader.query('R1', 'ether1', 0, 2000, 'raw') == ('raw', [])
+    writer.append('R1', 'ether1', 1000, 8e6, 1e6, 0, 0)
+    writer.flush()
+    res, rows = reader.query('R1', 'ether1', 0, 2000, 'raw')
+    assert [r['rx_bps'] for r in rows] == [8e6]
+    assert reader.query('R1', 'ether9', 0, 2000, 'raw') == ('raw', [])
+    writer.close()
+    reader.close()
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import socket
+import threading
+import urllib.error
+import urllib.request
+from instrumentation import Instrumentation, SamplingProfiler
+from fake_routeros import FakeRouterOS, default_interfaces
+from test_collector import run_collector
+
+
+def test_cycle_breakdown_and_slow_window():
+    instr = Instrumentation(slow_after=0.02, window=2)
+    instr.dispatched([{'name': 'R1'}, {'name': 'R2'}, {'name': 'R3'}])
+    emit = instr.emitter(lambda r: None)
+    emit({'device': 'R1', 'ifaces': {}})
+    t = instr.timer('R1')
+    time.sleep(0.03)
+    t.lap('store')
+    instr.finish('R1')
+    instr.finish('R2', error='timeout')
+    instr.finish('R9')  # never dispatched
+
+    s = instr.summary()
+    assert s['cycles'] == 2 and s['in_flight'] == 1
+    assert set(s['stages']) == {'poll', 'store'} and s['stages']['store']['seconds'] >= 0.03
+    slow, failed = s['slow'][1], s['slow'][0]
+    assert slow['device'] == 'R1' and list(slow['stages']) == ['store', 'poll']
+    assert failed['device'] == 'R2' and failed['error'] == 'timeout'
+    # no admin_token: the /debug routes are not served at all
+    assert instr.routes() is None
+
+
+def test_profiler_folds_thread_stacks():
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    t = threading.Thread(target=busy_loop, name="busy worker")
+    t.start()
+    try:
+        text = SamplingProfiler(hz=200).run(0.2)
+    finally:
+        stop.set()
+        t.join()
+    lines = [line.rsplit(' ', 1) for line in text.splitlines()]
+    busy = [(stack, int(n)) for stack, n in lines if stack.startswith('busy_worker;')]
+    assert busy and any('busy_loop (test_instrumentation.py:' in stack for stack, _ in busy)
+
+
+def test_collector_serves_cycle_breakdown(tmp_path):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    with FakeRouterOS(interfaces=default_interfaces(3)) as fake:
+        config = {'devices': [fake.device_cfg('R1')], 'poll_interval': 1, 'db_path': str(tmp_path / 'state.db'),
+                  'prometheus': {'enabled': True, 'listen_addr': '127.0.0.1', 'listen_port': port},
+                  'instrumentation': {'enabled': True, 'slow_after': 0, 'admin_token': 's3cret',
+                                      'profile_dir': str(tmp_path)},
+                  'history': {'db_path': str(tmp_path / 'history.db')}}
+        got = {}
+
+        def get(path, token='s3cret'):
+            req = urllib.request.Request(f'http://127.0.0.1:{port}{path}', headers={'X-Admin-Token': token})
+            try:
+                with urllib.request.urlopen(req) as resp:
+                    return resp.status, resp.read()
+            except urllib.error.HTTPError as e:
+                return e.code, e.read()
+
+        def done():
+            try:
+                status, body = get('/debug/cycles')
+                got['cycles'] = json.loads(body)
+                if not got['cycles']['cycles']:
+                    return False
+                got['denied'] = [get('/debug/cycles', token='nope')[0], get('/debug/profile', token='')[0]]
+                got['bad'] = [get(f'/debug/profile?seconds={s}')[0] for s in ('abc', '0', 'nan', '301')]
+                status, body = get('/debug/profile?seconds=0.1')
+                got['started'] = status
+                path = json.loads(body)['path']
+                deadline = time.monotonic() + 5
+                while 'start_collector' not in got.get('profile', '') and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    if os.path.exists(path):
+                        with open(path) as f:
+                            got['profile'] = f.read()
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as resp:
+                    got['metrics'] = resp.read().decode()
+                return True
+            except OSError:
+                return False
+
+        run_collector(config, done)
+    assert {'poll', 'queue', 'classify', 'export', 'store', 'stream'} <= set(got['cycles']['stages'])
+    assert got['cycles']['slow'][0]['device'] == 'R1'
+    assert got['denied'] == [401, 401] and got['bad'] == [400, 400, 400, 400] and got['started'] == 202
+    assert 'start_collector (collector_api.py:' in got['profile']
+    assert 'noc_cycle_stage_seconds_count{stage="classify"}' in got['metrics']
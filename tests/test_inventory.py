@@ -0,0 +1,57 @@
+import sqlite3
+from inventory import DeviceInventory
+from fake_routeros import FakeRouterOS, default_interfaces
+from test_collector import run_collector
+
+
+def test_refresh_applies_only_committed_changes(tmp_path):
+    path = str(tmp_path / 'inv.db')
+    inv = DeviceInventory(path, base=[{'name': 'static', 'host': '10.0.0.9'}])
+    assert [d['name'] for d in inv.devices()] == ['static']
+    assert inv.refresh() == 0
+
+    con = sqlite3.connect(path)
+    con.execute("INSERT INTO devices(hostname, ip, username, password, api_port, role) "
+                "VALUES ('R1', '10.0.0.1', 'admin', 'x', 8729, 'core')")
+    con.execute("INSERT INTO devices(hostname, ip, username, password) VALUES ('R2', '10.0.0.2', 'admin', 'x')")
+    con.commit()
+    assert inv.refresh() == 2
+    devs = {d['name']: d for d in inv.devices()}
+    assert set(devs) == {'static', 'R1', 'R2'}
+    assert (devs['R1']['port'], devs['R1']['role'], devs['R1']['host']) == (8729, 'core', '10.0.0.1')
+    assert inv.refresh() == 0  # data_version unchanged: nothing read
+
+    con.execute("UPDATE devices SET enabled=0 WHERE hostname='R1'")
+    con.execute("DELETE FROM devices WHERE hostname='R2'")
+    con.commit()
+    assert inv.refresh() == 2
+    assert [d['name'] for d in inv.devices()] == ['static']
+    con.close()
+    inv.close()
+
+
+def test_collector_picks_up_new_device_without_restart(tmp_path):
+    db_path = str(tmp_path / 'state.db')
+    with FakeRouterOS(interfaces=default_interfaces(2)) as fake:
+        config = {'devices': [], 'poll_interval': 1, 'db_path': db_path, 'inventory': {'enabled': True},
+                  'history': {'enabled': False}}
+        state = {'added': False}
+
+        def until():
+            con = sqlite3.connect(db_path)
+            try:
+                if not state['added']:
+                    con.execute("INSERT INTO devices(hostname, ip, username, password, api_port) VALUES (?,?,?,?,?)",
+                                ('R9', '127.0.0.1', fake.user, fake.password, fake.port))
+                    con.commit()
+                    state['added'] = True
+                return con.execute("SELECT count(*) FROM iface_state WHERE device='R9'").fetchone()[0] == 2
+            except sqlite3.OperationalError:
+                return False
+            finally:
+                con.close()
+
+        run_collector(config, until)
+    con = sqlite3.connect(db_path)
+    assert con.execute("SELECT count(*) FROM iface_state WHERE device='R9'").fetchone()[0] == 2
+    con.close()
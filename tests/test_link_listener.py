@@ -0,0 +1,99 @@
+import time
+import sqlite3
+import collector_api
+from state_store import StateStore, StateCache
+from link_listener import link_update
+from fake_routeros import FakeRouterOS, default_interfaces
+from test_collector import run_collector
+
+
+def test_link_update_between_polls_keeps_rates_right(tmp_path):
+    db = StateCache(StateStore(str(tmp_path / 's.db'), batched=True))
+    snap = {'ts': 100, 'carrier': True, 'disabled': False, 'rx_bytes': 1000, 'tx_bytes': 0, 'link_downs': 0}
+    collector_api.classify_result({'device': 'R1', 'ifaces': {'ether1': dict(snap)}}, db, {})
+
+    item = collector_api.classify_link_event(link_update('R1', [{'name': 'ether1', 'running': 'false'}], 130),
+                                             db, {})
+    assert isinstance(item, collector_api.LinkUpdate)
+    [(name, cur, prev_state, state, info, rates)] = item.records
+    assert (prev_state, state, rates, cur['state_since'], cur['counters_ts']) == ('UP', 'DOWN', None, 130, 100)
+    # unknown interfaces wait for the next poll
+    assert collector_api.classify_link_event(link_update('R1', [{'name': 'ether9', 'running': 'true'}]), db, {}) is None
+
+    # the next counter poll measures rates since the counters were read (ts 100), not since 130
+    _, records = collector_api.classify_result(
+        {'device': 'R1', 'ifaces': {'ether1': dict(snap, ts=160, rx_bytes=61000, link_downs=1)}}, db, {})
+    [(_, cur, prev_state, state, _, rates)] = records
+    assert (prev_state, state) == ('DOWN', 'UP') and rates[0] == 60000 * 8 / 60
+    db.close()
+
+
+def test_link_update_keeps_counter_derived_down(tmp_path):
+    db = StateCache(StateStore(str(tmp_path / 's.db'), batched=True))
+    snap = {'ts': 100, 'carrier': True, 'disabled': False, 'rx_bytes': 0, 'tx_bytes': 0, 'rx_errors': 0,
+            'link_downs': 0}
+    collector_api.classify_result({'device': 'R1', 'ifaces': {'ether1': dict(snap)}}, db, {})
+    _, [(_, _, _, state, _, _)] = collector_api.classify_result(
+        {'device': 'R1', 'ifaces': {'ether1': dict(snap, ts=110, rx_errors=10000)}}, db, {})
+    assert state == 'DOWN'
+
+    # a carrier-up listen row knows nothing about errors: no false recovery
+    item = collector_api.classify_link_event(link_update('R1', [{'name': 'ether1', 'running': 'true'}], 115), db, {})
+    [(_, cur, prev_state, state, info, _)] = item.records
+    assert (prev_state, state, cur['state_since']) == ('DOWN', 'DOWN', 110)
+    assert info['reason'].startswith('high_error_rate')
+    # losing carrier is still taken from the listener, and so is getting it back
+    item = collector_api.classify_link_event(link_update('R1', [{'name': 'ether1', 'running': 'false'}], 120), db, {})
+    assert [r[3:5] for r in item.records] == [('DOWN', {'reason': 'no carrier'})]
+    item = collector_api.classify_link_event(link_update('R1', [{'name': 'ether1', 'running': 'true'}], 125), db, {})
+    assert [r[3] for r in item.records] == ['UP']
+    db.close()
+
+
+def test_collector_alerts_on_listen_events(tmp_path):
+    db_path = str(tmp_path / 'state.db')
+
+    def query(sql):
+        con = sqlite3.connect(db_path)
+        try:
+            return [r[0] for r in con.execute(sql)]
+        except sqlite3.Error:
+            return []
+        finally:
+            con.close()
+
+    def events():
+        return query("SELECT event FROM event_log ORDER BY id")
+
+    def wait(cond, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not cond() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return cond()
+
+    with FakeRouterOS(interfaces=default_interfaces(3)) as fake:
+        config = {'devices': [fake.device_cfg('R1')], 'poll_interval': 1, 'db_path': db_path,
+                  'listen': {'enabled': True, 'poll_interval': 3600, 'retry': 0.1},
+                  'history': {'db_path': str(tmp_path / 'history.db')}}
+        timings = {}
+
+        def scenario():
+            # initial (resync) poll stored and listen open
+            if not (wait(lambda: query("SELECT count(*) FROM iface_state") == [3])
+                    and wait(lambda: fake.listeners() == 1)):
+                return True
+            t0 = time.monotonic()
+            fake.set_interface('ether2', running='false')
+            if wait(lambda: len(events()) == 1):
+                timings['down'] = time.monotonic() - t0
+            fake.set_interface('ether2', running='true')
+            wait(lambda: len(events()) == 2)
+            fake.drop_all()  # lost subscription: re-subscribe and poll again for what was missed
+            timings['resync'] = wait(lambda: fake.calls.count('/interface/print') == 2 and fake.listeners() == 1)
+            return True
+
+        run_collector(config, scenario, timeout=30)
+    got = events()
+    assert got[0].startswith('state_change UP -> DOWN') and "no carrier" in got[0]
+    assert got[1].startswith('state_change DOWN -> UP')
+    assert timings['down'] < 1.0 and timings['resync']
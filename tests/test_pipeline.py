@@ -0,0 +1,49 @@
+import time
+import threading
+from pipeline import Pipeline
+
+
+def test_fast_devices_persist_before_slow_device_finishes():
+    persisted = {}
+    p = Pipeline(lambda r: r, lambda r: persisted.setdefault(r['device'], time.monotonic()))
+
+    def source(devices, emit):
+        threads = []
+        for d in devices:
+            def work(d=d):
+                time.sleep(d['delay'])
+                emit({'device': d['name']})
+            t = threading.Thread(target=work)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+    t0 = time.monotonic()
+    p.run_cycle([{'name': 'fast', 'delay': 0}, {'name': 'slow', 'delay': 0.5}], source)
+    assert set(persisted) == {'fast', 'slow'}
+    assert persisted['fast'] - t0 < 0.3
+    assert persisted['slow'] - t0 >= 0.5
+    p.close()
+
+
+def test_full_queues_push_back_on_pollers():
+    release = threading.Event()
+    p = Pipeline(lambda r: r, lambda r: release.wait(), queue_size=1)
+    emitted = []
+
+    def producer():
+        for i in range(5):
+            p.emit(i)
+            emitted.append(i)
+
+    t = threading.Thread(target=producer, daemon=True)
+    t.start()
+    time.sleep(0.2)
+    # one item in persist, one queued for persist, one in classify, one queued for classify
+    assert len(emitted) < 5
+    release.set()
+    t.join(timeout=2)
+    p.drain()
+    assert emitted == list(range(5))
+    p.close()
@@ -0,0 +1,102 @@
+from scheduler import PollScheduler, MISSED_DEADLINES
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_intervals_spread_and_no_drift():
+    clock = Clock()
+    s = PollScheduler(default_interval=60, tiers={'core': 10}, clock=clock)
+    devs = [{'name': f'sw{i}'} for i in range(50)] + [{'name': 'core1', 'role': 'core'},
+                                                        {'name': 'odd', 'poll_interval': 5}]
+    s.sync(devs)
+    assert s.interval_for(devs[-2]) == 10 and s.interval_for(devs[-1]) == 5
+    first = {}
+    while clock.now < 1060:
+        for d in s.pop_due():
+            first.setdefault(d['name'], clock.now)
+            s.done(d['name'])
+        clock.now += 1
+    # start times are spread, not all at once
+    assert len(set(first.values())) > 20
+    assert max(first.values()) < 1060
+
+    # a slow poll skips deadlines instead of shifting every later one
+    clock.now = 2000.0
+    s = PollScheduler(default_interval=10, clock=clock)
+    s.sync([{'name': 'r1'}])
+    clock.now += 10
+    assert [d['name'] for d in s.pop_due()] == ['r1']
+    start = clock.now
+    missed = MISSED_DEADLINES._value.get()
+    clock.now += 25  # poll took 25 s
+    s.done('r1')
+    assert MISSED_DEADLINES._value.get() - missed == 2
+    assert s.pop_due() == []
+    clock.now = start + 30
+    assert [d['name'] for d in s.pop_due()] == ['r1']
+
+
+def test_fast_interval_in_flight_and_removal():
+    clock = Clock()
+    s = PollScheduler(default_interval=60, fast_interval=5, clock=clock)
+    s.sync([{'name': 'r1'}, {'name': 'r2'}])
+    clock.now += 60
+    assert {d['name'] for d in s.pop_due()} == {'r1', 'r2'}
+    assert s.in_flight() == 2
+    clock.now += 100
+    assert s.pop_due() == []  # still in flight: never dispatched twice
+    s.done('r1', fast=True)
+    s.done('r2')
+    assert s.in_flight() == 0
+    assert s.next_delay(max_wait=100) <= 5
+    clock.now += 5
+    assert [d['name'] for d in s.pop_due()] == ['r1']
+    s.done('r1')  # settled: back to 60 s
+    assert s.next_delay(max_wait=100) > 5
+    assert s.sync([{'name': 'r2'}]) == ([], [], ['r1'])
+    clock.now += 1000
+    assert [d['name'] for d in s.pop_due()] == ['r2']
+
+
+def test_poke_and_listen_interval():
+    clock = Clock()
+    s = PollScheduler.from_config({'poll_interval': 15, 'listen': {'enabled': True, 'poll_interval': 120}})
+    assert s.default_interval == 120
+    s = PollScheduler(default_interval=120, clock=clock)
+    s.sync([{'name': 'r1'}])
+    while not s.pop_due():
+        clock.now += 1
+    s.done('r1')
+    assert s.pop_due() == [] and s.poke('r1')
+    assert [d['name'] for d in s.pop_due()] == ['r1']
+    assert not s.poke('r1')  # in flight
+    s.done('r1')
+    assert s.next_delay(max_wait=1000) == 120
+
+
+def test_collector_keeps_polling_after_classify_error(tmp_path, monkeypatch):
+    import collector_api
+    from fake_routeros import FakeRouterOS, default_interfaces
+    from test_collector import run_collector
+    classify_result = collector_api.classify_result
+    failures = []
+
+    def flaky_classify(*args, **kw):
+        if not failures:
+            failures.append(1)
+            raise RuntimeError("boom")
+        return classify_result(*args, **kw)
+
+    monkeypatch.setattr(collector_api, 'classify_result', flaky_classify)
+    with FakeRouterOS(interfaces=default_interfaces(2)) as fake:
+        config = {'devices': [fake.device_cfg('R1')], 'poll_interval': 0.2, 'db_path': str(tmp_path / 's.db'),
+                  'history': {'enabled': False}}
+        run_collector(config, lambda: fake.calls.count('/interface/print') >= 3)
+        polls = fake.calls.count('/interface/print')
+    assert failures and polls >= 3
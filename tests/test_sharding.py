@@ -0,0 +1,93 @@
+import time
+import sqlite3
+import multiprocessing
+import collector_api
+from sharding import HashRing, ShardMembership
+from fake_routeros import FakeRouterOS, default_interfaces
+
+
+def test_ring_moves_only_the_new_members_share():
+    names = [f"R{i}" for i in range(2000)]
+    before = HashRing(['w0', 'w1', 'w2'])
+    after = HashRing(['w0', 'w1', 'w2', 'w3'])
+    moved = [n for n in names if before.owner(n) != after.owner(n)]
+    assert all(after.owner(n) == 'w3' for n in moved)
+    assert 300 < len(moved) < 700  # about a quarter
+    counts = {w: sum(after.owner(n) == w for n in names) for w in after.members}
+    assert min(counts.values()) > 300
+
+
+def test_dead_member_expires(tmp_path):
+    path = str(tmp_path / 's.db')
+    clock = [100.0]
+    a = ShardMembership(path, 'a', heartbeat=1, ttl=3, clock=lambda: clock[0])
+    b = ShardMembership(path, 'b', heartbeat=1, ttl=3, clock=lambda: clock[0])
+    a.beat(force=True)
+    assert b.beat(force=True)
+    assert a.beat(force=True)
+    devices = [{'name': f"R{i}"} for i in range(50)]
+    assert len(a.owned(devices)) + len(b.owned(devices)) == 50
+    clock[0] += 5  # b stops beating
+    assert a.beat()
+    assert a.ring.members == ('a',)
+    assert len(a.owned(devices)) == 50
+    a.leave()
+    b.leave()
+
+
+def _device_times(db_path):
+    con = sqlite3.connect(db_path, timeout=30)
+    try:
+        return dict(con.execute("SELECT device, min(ts) FROM iface_state GROUP BY device"))
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        con.close()
+
+
+def _wait(cond, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_workers_split_devices_and_take_over(tmp_path):
+    db_path = str(tmp_path / 'state.db')
+    ctx = multiprocessing.get_context('spawn')
+    with FakeRouterOS(interfaces=default_interfaces(2)) as fake:
+        names = [f"R{i}" for i in range(12)]
+        # every poll rewrites iface_state.ts, which is how takeover is observed below
+        config = {'devices': [fake.device_cfg(n) for n in names], 'poll_interval': 1, 'db_path': db_path,
+                  'history': {'enabled': False}, 'correlation': {'enabled': False}, 'state_checkpoint': 0}
+        procs = {}
+        for w in ('w0', 'w1', 'w2'):
+            cfg = dict(config, sharding={'enabled': True, 'worker_id': w, 'heartbeat': 0.3, 'ttl': 1.5})
+            procs[w] = ctx.Process(target=collector_api.start_collector, args=(cfg,), daemon=True)
+            procs[w].start()
+        try:
+            def members():
+                con = sqlite3.connect(db_path, timeout=30)
+                try:
+                    return {r[0] for r in con.execute("SELECT worker_id FROM collector_members")}
+                except sqlite3.Error:
+                    return set()
+                finally:
+                    con.close()
+
+            # the first worker up may poll every device before the others join
+            assert _wait(lambda: set(_device_times(db_path)) == set(names))
+            assert _wait(lambda: members() == {'w0', 'w1', 'w2'})
+
+            procs['w1'].terminate()  # no clean leave: survivors must notice the missing heartbeats
+            procs['w1'].join(5)
+            killed = time.time()
+            ring = HashRing(['w0', 'w1', 'w2'])
+            assert any(ring.owner(n) == 'w1' for n in names)
+            assert _wait(lambda: all(ts > killed + 1 for ts in _device_times(db_path).values()))
+        finally:
+            for p in procs.values():
+                p.terminate()
+                p.join(5)
@@ -0,0 +1,40 @@
+import snapshot_codec
+from flap_tracker import FlapTracker
+
+
+def snapshot(**kw):
+    flaps = FlapTracker()
+    flaps.record(100, 2)
+    snap = {'ts': 1700000000, 'name': 'ether1', 'disabled': False, 'carrier': True, 'rx_bytes': 2**40,
+            'tx_bytes': 5, 'rx_errors': 0, 'tx_errors': 1, 'rx_drops': 0, 'tx_drops': 0, 'link_downs': 3,
+            'speed_mbps': 1000, 'flaps': flaps.to_text(), 'state': 'UP', 'reason': 'carrier OK',
+            'state_since': 1699990000}
+    snap.update(kw)
+    return snap
+
+
+def test_round_trip_binary_and_fallback():
+    snap = snapshot()
+    data = snapshot_codec.encode(snap)
+    assert data[0] == snapshot_codec.FORMAT_V1 and len(data) < len(str(snap)) / 2
+    assert snapshot_codec.decode(data) == snap
+    # optional keys, None values and unknown keys survive in the binary form
+    odd = snapshot(reason=None, flaps='', counters_ts=5, downs_ts=[1, 2])
+    del odd['speed_mbps']
+    assert snapshot_codec.encode(odd)[0] == snapshot_codec.FORMAT_V1
+    assert snapshot_codec.decode(snapshot_codec.encode(odd)) == odd
+    # what does not fit the layout is kept as JSON; legacy JSON text still decodes
+    for other in ({'ts': 1, 'rx_bytes': 10}, snapshot(speed_mbps=2.5), snapshot(rx_bytes=-1),
+                  snapshot(state='WEIRD'), snapshot(carrier='true')):
+        data = snapshot_codec.encode(other)
+        assert data[0] == snapshot_codec.FORMAT_JSON and snapshot_codec.decode(data) == other
+    assert snapshot_codec.decode('{"ts": 1}') == {'ts': 1}
+
+
+def test_stable_part_ignores_counters_and_time():
+    base = snapshot_codec.stable_part(snapshot_codec.encode(snapshot()))
+    moved = snapshot(ts=1700000060, rx_bytes=2**40 + 10**9, tx_drops=7)
+    assert snapshot_codec.stable_part(snapshot_codec.encode(moved)) == base
+    for changed in (snapshot(carrier=False), snapshot(state='DOWN'), snapshot(link_downs=4),
+                    snapshot(reason='flapping'), snapshot(flaps='')):
+        assert snapshot_codec.stable_part(snapshot_codec.encode(changed)) != base
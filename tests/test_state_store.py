@@ -0,0 +1,167 @@
+import sqlite3
+from state_store import StateStore
+
+
+def test_batched_writes_are_buffered_until_flush(tmp_path):
+    path = str(tmp_path / 's.db')
+    store = StateStore(path, batched=True)
+    store.save_iface_snapshot('R1', 'ether1', {'ts': 1, 'rx_bytes': 10})
+    store.save_iface_snapshot('R1', 'ether1', {'ts': 2, 'rx_bytes': 20})
+    store.append_event('R1', 'ether1', 'state_change UP -> DOWN : {}')
+    # visible to the writer before commit, not to other connections
+    assert store.load_iface_snapshot('R1', 'ether1')['rx_bytes'] == 20
+    reader = sqlite3.connect(path)
+    assert reader.execute("SELECT count(*) FROM iface_state").fetchone()[0] == 0
+    assert store.flush() == (1, 1)
+    assert reader.execute("SELECT count(*) FROM iface_state").fetchone()[0] == 1
+    assert reader.execute("SELECT count(*) FROM event_log").fetchone()[0] == 1
+    assert reader.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    reader.close()
+    store.close()
+
+
+def test_write_cycle_single_transaction(tmp_path):
+    path = str(tmp_path / 's.db')
+    store = StateStore(path)
+    store.write_cycle([('R1', f'ether{i}', {'ts': i}) for i in range(10)],
+                      [('R1', 'ether1', 'initial_state DOWN : {}')])
+    assert store.load_iface_snapshot('R1', 'ether9') == {'ts': 9}
+    con = store._connect()
+    assert con.execute("SELECT count(*) FROM event_log").fetchone()[0] == 1
+    con.close()
+
+
+def test_state_cache_warm_write_through_and_evict(tmp_path):
+    from state_store import StateCache
+    path = str(tmp_path / 's.db')
+    store = StateStore(path, batched=True)
+    store.save_iface_snapshot('R1', 'ether1', {'ts': 1})
+    store.save_iface_snapshot('R1', 'ether2', {'ts': 1})
+    store.close()
+
+    cache = StateCache(StateStore(path, batched=True))
+    assert cache.warm() == 2
+    assert cache.get_last_state('R1', 'ether1') == {'ts': 1}
+    assert cache.get_last_state('R1', 'ether9') is None
+    cache.save_state('R1', 'ether1', {'ts': 2})
+    assert cache.get_last_state('R1', 'ether1') == {'ts': 2}
+    assert cache.retain('R1', ['ether1']) == ['ether2']
+    assert cache.get_last_state('R1', 'ether2') is None
+    cache.flush()
+    assert StateStore(path).load_iface_snapshot('R1', 'ether1') == {'ts': 2}
+    cache.close()
+
+
+def test_state_columns_and_duration_query(tmp_path):
+    path = str(tmp_path / 's.db')
+    con = sqlite3.connect(path)  # table from before state columns existed
+    con.execute("CREATE TABLE iface_state (device text, iface text, ts integer, payload text, "
+                "PRIMARY KEY (device, iface))")
+    con.execute("INSERT INTO iface_state VALUES ('R0', 'ether1', 1, '{}')")
+    con.commit()
+    con.close()
+    store = StateStore(path, batched=True)
+    store.save_iface_snapshot('R1', 'ether1', {'ts': 100, 'state': 'DOWN', 'reason': 'no carrier', 'state_since': 50})
+    store.save_iface_snapshot('R1', 'ether2', {'ts': 100, 'state': 'DOWN', 'reason': 'flapping', 'state_since': 90})
+    store.save_iface_snapshot('R1', 'ether3', {'ts': 100, 'state': 'UP', 'reason': 'carrier OK', 'state_since': 10})
+    store.flush()
+    assert store.iface_states('DOWN', now=100) == [('R1', 'ether1', 'no carrier', 50), ('R1', 'ether2', 'flapping', 90)]
+    assert store.iface_states('DOWN', min_duration=30, now=100) == [('R1', 'ether1', 'no carrier', 50)]
+    assert store.load_iface_state('R1', 'ether3') == ('UP', 'carrier OK', 10)
+    assert store.load_iface_state('R0', 'ether1') == (None, None, None)
+    plan = store._connect().execute("EXPLAIN QUERY PLAN SELECT device FROM iface_state "
+                                    "WHERE state='DOWN' AND state_since<=1 ORDER BY state_since").fetchall()
+    assert 'iface_state_state_since' in str(plan)
+    store.close()
+
+
+def test_event_pages_filters_and_version(tmp_path):
+    store = StateStore(str(tmp_path / 's.db'))
+    con = store._connect()
+    con.executemany("INSERT INTO event_log(device, iface, ts, event, state) VALUES (?,?,?,?,?)",
+                    [(f'R{i % 3}', f'ether{i % 2}', 1000 + i // 2, f'e{i}', 'DOWN' if i % 4 else 'UP')
+                     for i in range(100)])
+    con.commit()
+    con.close()
+    v = store.version()
+    seen, before = [], None
+    while True:
+        page = store.events(device='R1', limit=7, before=before)
+        seen.extend(page)
+        if len(page) < 7:
+            break
+        before = (page[-1][3], page[-1][0])
+    assert [r[5] for r in seen] == [f'e{i}' for i in range(99, -1, -1) if i % 3 == 1]
+    rows = store.events(device='R2', iface='ether0', state='DOWN', since=1010, until=1030)
+    assert rows and all(r[1:3] == ('R2', 'ether0') and r[4] == 'DOWN' and 1010 <= r[3] <= 1030 for r in rows)
+    with store.reading() as con:
+        plan = ' '.join(r[3] for r in con.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM event_log WHERE device=? ORDER BY ts DESC, id DESC LIMIT 5", ('R1',)))
+    assert 'event_log_device_ts' in plan and 'TEMP B-TREE' not in plan
+    store.append_event('R1', 'ether1', 'state_change UP -> DOWN : {}', 'DOWN')
+    assert store.version() == v + 1
+    # each resource has its own counter
+    store.save_iface_snapshot('R2', 'ether1', {'ts': 1})
+    store.save_summary('w0', 1, '{}')
+    assert (store.version(), store.version('state:R2'), store.version('state:R1'), store.version('summary')) \
+        == (v + 1, 1, 0, 1)
+    store.write_cycle([('R1', 'ether1', {'ts': 2})])
+    assert (store.version(), store.version('state:R1'), store.version('state:R2')) == (v + 1, 1, 1)
+    assert store.events(limit=1)[0][4:] == ('DOWN', 'state_change UP -> DOWN : {}')
+
+
+def test_write_on_change_with_device_checkpoints(tmp_path, monkeypatch):
+    import state_store
+    clock = [1000]
+    monkeypatch.setattr(state_store.time, 'time', lambda: clock[0])
+    monkeypatch.setattr(state_store.random, 'uniform', lambda a, b: 1.0)
+    path = str(tmp_path / 's.db')
+    store = StateStore(path, batched=True, checkpoint=60)
+
+    def cycle(ts, **kw):
+        clock[0] = ts
+        for i in (1, 2):
+            store.save_iface_snapshot('R1', f'ether{i}', {'ts': ts, 'rx_bytes': ts * i, 'state': 'UP', **kw})
+        return store.flush()[0]
+
+    assert cycle(1000) == 2
+    assert cycle(1015) == 0 and store.skipped == 2  # only counters moved
+    assert store.load_iface_snapshot('R1', 'ether1')['ts'] == 1000
+    assert cycle(1030, state='DOWN') == 2
+    assert cycle(1045, state='DOWN') == 0
+    assert cycle(1060, state='DOWN') == 2  # device checkpoint: every row rewritten once
+    assert store.load_iface_snapshot('R1', 'ether2') == {'ts': 1060, 'rx_bytes': 2120, 'state': 'DOWN'}
+    store.forget('R1')
+    assert cycle(1075, state='DOWN') == 2
+    con = sqlite3.connect(path)
+    assert con.execute("SELECT typeof(payload), ts FROM iface_state WHERE iface='ether1'").fetchone() == ('blob', 1075)
+    con.close()
+    store.close()
+
+
+def test_read_pool_is_bounded_and_reused(tmp_path):
+    import threading
+    from state_store import ReadPool
+    pool = ReadPool(str(tmp_path / 's.db'), size=2, timeout=5)
+    seen, release = [], threading.Event()
+
+    def request(hold):
+        with pool.connection() as con:
+            seen.append(id(con))
+            if hold:
+                release.wait(5)
+
+    busy = [threading.Thread(target=request, args=(True,)) for _ in range(2)]
+    for t in busy:
+        t.start()
+    waiter = threading.Thread(target=request, args=(False,))  # waits for a free connection
+    waiter.start()
+    waiter.join(0.3)
+    assert waiter.is_alive() and len(seen) == 2 and pool._opened == 2
+    release.set()
+    for t in busy + [waiter]:
+        t.join(5)
+    assert pool._opened == 2 and len(set(seen)) == 2 and seen[2] in seen[:2]
+    with pool.connection() as con:
+        assert con.execute("PRAGMA query_only").fetchone()[0] == 1
+    pool.close()
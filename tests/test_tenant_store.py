@@ -0,0 +1,130 @@
+import time
+import sqlite3
+import importlib
+from tenant_store import TenantStore, ensure_schema, set_api_key
+from test_api_server import load_app
+from test_collector import run_collector
+from fake_routeros import FakeRouterOS, default_interfaces
+
+
+def test_quota_batches_and_keyset_pages(tmp_path):
+    path = str(tmp_path / 'saas.db')
+    store = TenantStore(path, rate=0.001, burst=5, batch_size=4)
+    assert store.ingest('big', [('R1', 'ether1', 100 + i, f'e{i}') for i in range(8)]) == 5
+    assert store.append('big', 'R1', 'ether1', 'over', ts=200) is False
+    assert store.append('small', 'R2', 'ether1', 'one', ts=150)
+    # the first batch_size rows were written when the batch filled
+    con = sqlite3.connect(path)
+    assert con.execute("SELECT count(*) FROM events").fetchone()[0] == 5
+    assert store.flush() == 1
+
+    big, small = store.tenant_id('big'), store.tenant_id('small')
+    page = store.events(big, limit=2)
+    assert [r[4] for r in page] == ['e4', 'e3']
+    rest = store.events(big, before=(page[-1][3], page[-1][0]), limit=10)
+    assert [r[4] for r in rest] == ['e2', 'e1', 'e0']
+    assert [r[4] for r in store.events(small)] == ['one']
+    assert store.events(big, device='R2') == [] and len(store.events(big, since=103)) == 2
+
+    # a tenants-row override replaces the default quota
+    con.execute("INSERT INTO tenants(name, events_per_sec, burst) VALUES ('vip', 1000, 1000)")
+    con.commit()
+    assert store.ingest('vip', [('R9', 'ether1', 1, 'x')] * 50) == 50
+    store.close()
+    con.close()
+
+
+def test_quota_overrides_zero_and_later_edits(tmp_path):
+    path = str(tmp_path / 'saas.db')
+    store = TenantStore(path, rate=0.001, burst=5)
+    con = sqlite3.connect(path)
+    # an explicit 0 is an override, not "use the default"
+    con.execute("INSERT INTO tenants(name, events_per_sec, burst) VALUES ('muted', 0, 0)")
+    con.commit()
+    assert store.ingest('muted', [('R1', 'ether1', 1, 'x')] * 3) == 0
+    assert store.ingest('acme', [('R1', 'ether1', 1, 'x')] * 10) == 5
+
+    # edited after both tenants were first seen
+    con.execute("UPDATE tenants SET events_per_sec=1000, burst=100 WHERE name IN ('muted', 'acme')")
+    con.commit()
+    assert store.reload() == 2 and store.reload() == 0
+    time.sleep(0.05)
+    assert store.ingest('muted', [('R1', 'ether1', 1, 'x')] * 200) >= 40
+    con.execute("UPDATE tenants SET events_per_sec=NULL, burst=NULL WHERE name='acme'")
+    con.commit()
+    assert store.reload() == 1
+    assert store.ingest('acme', [('R1', 'ether1', 1, 'x')] * 10) == 5  # back to the default burst
+    store.close()
+    con.close()
+
+
+def test_tenant_route_needs_admin_or_own_key(tmp_path, monkeypatch):
+    path = str(tmp_path / 'saas.db')
+    store = TenantStore(path)
+    store.append('acme', 'R1', 'ether1', 'mine', ts=1)
+    store.append('other', 'R2', 'ether1', 'theirs', ts=1)
+    store.close()
+    con = sqlite3.connect(path)
+    acme = set_api_key(con, 'acme', 'acme-key')
+    other = con.execute("SELECT id FROM tenants WHERE name='other'").fetchone()[0]
+    con.close()
+
+    api = load_app(tmp_path, monkeypatch)
+    monkeypatch.setenv('API_KEY', 'admin')
+    api = importlib.reload(api)
+    client = api.app.test_client()
+
+    def get(tid, **headers):
+        return client.get(f'/api/v1/tenants/{tid}/events', headers=headers)
+
+    assert get(acme).status_code == 401
+    mine = get(acme, **{'X-Tenant-Key': 'acme-key'})
+    assert [e['event'] for e in mine.get_json()['events']] == ['mine']
+    # a tenant key opens only its own tenant, and nothing else in the API
+    assert get(other, **{'X-Tenant-Key': 'acme-key'}).status_code == 401
+    assert get(other, **{'X-Tenant-Key': ''}).status_code == 401
+    assert client.get('/api/v1/events', headers={'X-Tenant-Key': 'acme-key'}).status_code == 401
+    theirs = get(other, **{'X-API-Key': 'admin'})
+    assert [e['event'] for e in theirs.get_json()['events']] == ['theirs']
+
+
+def test_tenant_queries_use_tenant_indexes(tmp_path):
+    con = sqlite3.connect(str(tmp_path / 'saas.db'))
+    ensure_schema(con)
+    ensure_schema(con)  # idempotent
+    for where in ("tenant_id=1", "tenant_id=1 AND ts>=5", "tenant_id=1 AND device='R1'",
+                  "tenant_id=1 AND device='R1' AND iface='e1'"):
+        plan = ' '.join(r[3] for r in con.execute(
+            f"EXPLAIN QUERY PLAN SELECT * FROM events WHERE {where} ORDER BY ts DESC, id DESC LIMIT 10"))
+        assert 'USING INDEX events_tenant' in plan and 'SCAN events' not in plan, plan
+    con.close()
+
+
+def test_collector_tags_events_with_device_tenant(tmp_path, monkeypatch):
+    ifaces = default_interfaces(2)
+    ifaces[0]['running'] = 'false'
+    saas = str(tmp_path / 'saas.db')
+    with FakeRouterOS(interfaces=ifaces) as fake:
+        config = {'devices': [dict(fake.device_cfg('R1'), tenant='acme'), fake.device_cfg('R2')],
+                  'poll_interval': 1, 'db_path': str(tmp_path / 'state.db'),
+                  'tenants': {'enabled': True, 'db_path': saas}, 'history': {'enabled': False}}
+
+        def done():
+            con = sqlite3.connect(str(tmp_path / 'state.db'))
+            try:
+                return con.execute("SELECT count(*) FROM event_log").fetchone()[0] == 2
+            except sqlite3.Error:
+                return False
+            finally:
+                con.close()
+
+        run_collector(config, done)
+    con = sqlite3.connect(saas)
+    rows = con.execute("SELECT t.name, e.device, e.iface FROM events e JOIN tenants t ON t.id = e.tenant_id"
+                       ).fetchall()
+    con.close()
+    assert rows == [('acme', 'R1', 'ether1')]
+
+    api = load_app(tmp_path, monkeypatch)
+    body = api.app.test_client().get('/api/v1/tenants/1/events?device=R1').get_json()
+    assert [e['iface'] for e in body['events']] == ['ether1'] and body['next_cursor'] is None
@@ -40,11 +40,26 @@ export default function App(){
 
 function Events(){
   const [events, setEvents] = useState([]);
-  useEffect(()=>{ fetch('/api/v1/events').then(r=>r.json()).then(setEvents); },[]);
+  useEffect(()=>{
+    const load = ()=> fetch('/api/v1/events').then(r=>r.json()).then(p=>setEvents(p.events));
+    load();
+    // live transitions from the collector's stream.port; nothing serves the stream
+    // on the API's origin, so without VITE_STREAM_URL the list is just loaded once
+    const url = import.meta.env.VITE_STREAM_URL;
+    if (!url) return;
+    const es = new EventSource(url);
+    es.addEventListener('transition', m=>{
+      const e = JSON.parse(m.data);
+      const text = `state_change ${e.prev} -> ${e.state} : ${JSON.stringify(e.info)}`;
+      setEvents(ev=>[{id: m.lastEventId, device: e.device, iface: e.iface, ts: e.ts, state: e.state, event: text}, ...ev].slice(0, 200));
+    });
+    es.addEventListener('reset', load);
+    return ()=> es.close();
+  },[]);
   return (
     <ul>
       {events.map(e=>(
-        <li key={e.ts + e.device + e.iface}><strong>{e.device}/{e.iface}</strong> — {new Date(e.ts*1000).toLocaleString()}: {e.event}</li>
+        <li key={e.id}><strong>{e.device}/{e.iface}</strong> — {new Date(e.ts*1000).toLocaleString()}: {e.event}</li>
       ))}
     </ul>
   )